@@ -0,0 +1,299 @@
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from records import Record
+from schema import ensure_schema, rebuild_analytics
+from transactions import immediate_transaction
+
+# Management reports: loans per category / genre, overdue and late-return
+# rates, fines charged and collected, event attendance per audience and
+# room utilisation
+#
+#   python analytics.py refresh                    # nightly, after the fine sweep
+#   python analytics.py report --from 2026-09-01 --to 2026-09-30
+#
+# Reports read only the summary tables (schema.py, ANALYTICS): loan and fine
+# counters per day kept by triggers, event and room figures per month. Their
+# size grows with the number of days / months / genres / rooms, not with the
+# loans and sign-ups behind them -> A year's report costs the same with 10k
+# loans or 10M.
+#
+# Event months touched since the last refresh (sign-ups, cancellations, room
+# changes) are listed in AnalyticsDirty. refresh() rebuilds just those months;
+# until then a report works them out from EventOccupancy, one range read on
+# the schedule index per month -> Reports are always current, and read-only
+# (fine on the server's read connections).
+
+# Loan / fine days and event months shown by default
+DEFAULT_DAYS = 30
+
+
+# Loans under one category or genre
+class LoanSummary(Record):
+    __slots__ = ("key", "loans", "returned", "returned_late", "late_rate")
+
+
+class FineTotals(Record):
+    __slots__ = ("fines", "assessed", "collected", "cleared")
+
+
+# Open loans on the last refresh day up to the end of the report
+class OverdueSnapshot(Record):
+    __slots__ = ("day", "open_loans", "overdue", "overdue_rate")
+
+
+class AudienceSummary(Record):
+    __slots__ = ("audience", "events", "attendees", "capacity", "fill_rate")
+
+
+# Attendees of an event held in several rooms are split by room size
+class RoomSummary(Record):
+    __slots__ = ("room", "events", "seats", "attendees", "utilisation")
+
+
+class AnalyticsReport(Record):
+    __slots__ = ("start", "end", "by_category", "by_genre", "overdue", "fines", "audiences", "rooms")
+
+
+class RefreshReport(Record):
+    __slots__ = ("months", "overdue", "seconds")
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+# First day of the month after `month` ('YYYY-MM')
+def _next_month(month):
+    first = date.fromisoformat(month + "-01")
+    return (first.replace(day=28) + timedelta(days=4)).replace(day=1).isoformat()
+
+
+# (audience, events, attendees, capacity) for one month, from the raw tables
+def _event_rows(conn, month):
+    return conn.execute("""
+        SELECT COALESCE(e.targetAudience, ''), COUNT(*), SUM(o.attendees), SUM(o.capacity)
+        FROM Events e
+        JOIN EventOccupancy o ON o.eventID = e.eventID
+        WHERE e.scheduledDate >= ? AND e.scheduledDate < ?
+        GROUP BY COALESCE(e.targetAudience, '')
+    """, (month + "-01", _next_month(month))).fetchall()
+
+
+# (roomNum, events, seats, attendees) for one month, from the raw tables
+def _room_rows(conn, month):
+    return conn.execute("""
+        SELECT l.roomNum, COUNT(*), SUM(r.maxCap), SUM(o.attendees * 1.0 * r.maxCap / o.capacity)
+        FROM Events e
+        JOIN EventOccupancy o ON o.eventID = e.eventID
+        JOIN Located l ON l.eventID = e.eventID
+        JOIN Room r ON r.roomNum = l.roomNum
+        WHERE e.scheduledDate >= ? AND e.scheduledDate < ?
+        GROUP BY l.roomNum
+    """, (month + "-01", _next_month(month))).fetchall()
+
+
+# Rebuilds EventStats / RoomStats for the dirty months -> Number of months
+def refresh_events(conn):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        months = [month for (month,) in cursor.execute("SELECT month FROM AnalyticsDirty")]
+        for month in months:
+            cursor.execute("DELETE FROM EventStats WHERE month = ?", (month,))
+            cursor.executemany("""
+                INSERT INTO EventStats (month, audience, events, attendees, capacity) VALUES (?, ?, ?, ?, ?)
+            """, [(month, *row) for row in _event_rows(conn, month)])
+            cursor.execute("DELETE FROM RoomStats WHERE month = ?", (month,))
+            cursor.executemany("""
+                INSERT INTO RoomStats (month, roomNum, events, seats, attendees) VALUES (?, ?, ?, ?, ?)
+            """, [(month, room, events, seats, attendees or 0) for room, events, seats, attendees
+                  in _room_rows(conn, month)])
+        cursor.executemany("DELETE FROM AnalyticsDirty WHERE month = ?", [(month,) for month in months])
+    return len(months)
+
+
+# Records today's open / overdue loan counts (range reads on BorrowTransactionsOverdue)
+def refresh_overdue(conn, today):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("SELECT COUNT(*) FROM BorrowTransactions WHERE status = 'Borrowed'")
+        open_loans = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM BorrowTransactions WHERE status = 'Borrowed' AND returnDate < ?",
+                       (today,))
+        overdue = cursor.fetchone()[0]
+        cursor.execute("INSERT OR REPLACE INTO OverdueStats (day, openLoans, overdue) VALUES (?, ?, ?)",
+                       (today, open_loans, overdue))
+    return OverdueSnapshot(today, open_loans, overdue, _rate(overdue, open_loans))
+
+
+def refresh(conn, today=None):
+    started = time.perf_counter()
+    today = today or date.today().isoformat()
+    months = refresh_events(conn)
+    overdue = refresh_overdue(conn, today)
+    return RefreshReport(months, overdue, time.perf_counter() - started)
+
+
+def _loans_by(conn, column, start, end):
+    rows = conn.execute(f"""
+        SELECT {column}, SUM(loans), SUM(returned), SUM(returnedLate)
+        FROM LoanStats
+        WHERE day BETWEEN ? AND ?
+        GROUP BY {column}
+        ORDER BY SUM(loans) DESC
+    """, (start, end)).fetchall()
+    return [LoanSummary(key or "(none)", loans, returned, late, _rate(late, returned))
+            for key, loans, returned, late in rows]
+
+
+# Figures for every month from `start` to `end`: summary rows for the clean
+# months, worked out from the raw tables for the dirty ones
+def _event_months(conn, start, end):
+    first, last = start[:7], end[:7]
+    dirty = [month for (month,) in conn.execute(
+        "SELECT month FROM AnalyticsDirty WHERE month BETWEEN ? AND ?", (first, last))]
+
+    audiences = conn.execute("""
+        SELECT audience, events, attendees, capacity FROM EventStats
+        WHERE month BETWEEN ? AND ? AND month NOT IN (SELECT month FROM AnalyticsDirty)
+    """, (first, last)).fetchall()
+    rooms = conn.execute("""
+        SELECT roomNum, events, seats, attendees FROM RoomStats
+        WHERE month BETWEEN ? AND ? AND month NOT IN (SELECT month FROM AnalyticsDirty)
+    """, (first, last)).fetchall()
+    for month in dirty:
+        audiences += _event_rows(conn, month)
+        rooms += _room_rows(conn, month)
+    return audiences, rooms
+
+
+# Adds up rows of (key, counts...) by key
+def _totals(rows):
+    totals = {}
+    for key, *counts in rows:
+        before = totals.get(key, [0] * len(counts))
+        totals[key] = [a + (b or 0) for a, b in zip(before, counts)]
+    return totals
+
+
+# Report for the days `start`..`end` (events: the months they fall in)
+def report(conn, start=None, end=None):
+    # Bad dates -> ValueError
+    end = date.fromisoformat(end).isoformat() if end else date.today().isoformat()
+    start = (date.fromisoformat(start).isoformat() if start
+             else (date.fromisoformat(end) - timedelta(days=DEFAULT_DAYS - 1)).isoformat())
+
+    fines = FineTotals(*conn.execute("""
+        SELECT COALESCE(SUM(fines), 0), ROUND(COALESCE(SUM(assessed), 0), 2),
+               ROUND(COALESCE(SUM(collected), 0), 2), COALESCE(SUM(cleared), 0)
+        FROM FineStats
+        WHERE day BETWEEN ? AND ?
+    """, (start, end)).fetchone())
+
+    row = conn.execute("""
+        SELECT day, openLoans, overdue FROM OverdueStats
+        WHERE day <= ?
+        ORDER BY day DESC
+        LIMIT 1
+    """, (end,)).fetchone()
+    overdue = OverdueSnapshot(*row, _rate(row[2], row[1])) if row else None
+
+    audience_rows, room_rows = _event_months(conn, start, end)
+    audiences = [AudienceSummary(audience or "(none)", events, attendees, capacity or None,
+                                 _rate(attendees, capacity))
+                 for audience, (events, attendees, capacity) in _totals(audience_rows).items()]
+    rooms = [RoomSummary(room, events, seats, round(attendees, 1), _rate(attendees, seats))
+             for room, (events, seats, attendees) in sorted(_totals(room_rows).items())]
+
+    return AnalyticsReport(start, end, _loans_by(conn, "category", start, end), _loans_by(conn, "genre", start, end),
+                           overdue, fines, sorted(audiences, key=lambda line: -line.attendees), rooms)
+
+
+def _percent(rate):
+    return "-" if rate is None else f"{rate:.1%}"
+
+
+def print_report(result, top=10):
+    print(f"📊 Library report {result.start} to {result.end}")
+
+    for title, lines in (("category", result.by_category), ("genre", result.by_genre)):
+        print(f"\nLoans by {title}:")
+        for line in lines[:top]:
+            print(f"  {line.key:<25} {line.loans:>7} loans {line.returned:>7} returned  "
+                  f"{_percent(line.late_rate):>6} late")
+        if len(lines) > top:
+            print(f"  ... and {len(lines) - top} more")
+
+    print("\nOverdue:")
+    if result.overdue:
+        print(f"  {result.overdue.overdue} of {result.overdue.open_loans} open loans overdue "
+              f"({_percent(result.overdue.overdue_rate)}) on {result.overdue.day}")
+    else:
+        print("  No snapshot yet (run: python analytics.py refresh)")
+
+    fines = result.fines
+    print(f"\nFines: {fines.fines} charged, ${fines.assessed:.2f} assessed, "
+          f"${fines.collected:.2f} collected, {fines.cleared} paid off")
+
+    print("\nEvent attendance by audience:")
+    for line in result.audiences:
+        capacity = line.capacity if line.capacity is not None else "no limit"
+        print(f"  {line.audience:<22} {line.events:>5} events {line.attendees:>7} attendees  "
+              f"seats {capacity}  {_percent(line.fill_rate):>6} full")
+
+    print("\nRoom utilisation:")
+    for line in result.rooms:
+        print(f"  Room {line.room:<6} {line.events:>5} events {line.seats:>7} seats "
+              f"{line.attendees:>9} attendees  {_percent(line.utilisation):>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library management reports")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fresh = commands.add_parser("refresh", help="fold recent event changes in and record today's overdue loans")
+    fresh.add_argument("--date", help="run as if today were DATE (YYYY-MM-DD)")
+
+    show = commands.add_parser("report", help="print the report")
+    show.add_argument("--from", dest="start", help=f"first day (default: {DEFAULT_DAYS} days before --to)")
+    show.add_argument("--to", dest="end", help="last day (default: today)")
+    show.add_argument("--top", type=int, default=10, help="categories / genres shown")
+
+    commands.add_parser("rebuild", help="recompute every summary from the raw tables")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    if args.command == "refresh":
+        result = refresh(conn, args.date)
+        print(f"✅ {result.months} event months refreshed, {result.overdue.overdue} of "
+              f"{result.overdue.open_loans} open loans overdue, in {result.seconds:.2f}s.")
+
+    elif args.command == "report":
+        started = time.perf_counter()
+        try:
+            result = report(conn, args.start, args.end)
+        except ValueError as error:
+            print(f"❌ {error}")
+            return 1
+        print_report(result, args.top)
+        print(f"\n({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    elif args.command == "rebuild":
+        started = time.perf_counter()
+        with immediate_transaction(conn):
+            rebuild_analytics(conn.cursor())
+        result = refresh(conn)
+        print(f"✅ Summaries rebuilt, {result.months} event months, in {time.perf_counter() - started:.2f}s.")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
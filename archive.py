@@ -0,0 +1,287 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from circulation import ItemNotFound
+from records import LibraryError, Record
+from schema import ensure_schema
+from transactions import immediate_transaction
+
+# Archive job: keeps the tables the desk works on down to the working set
+#
+#   python archive.py run                      # everything closed for a year
+#   python archive.py run --before 2025-01-01
+#   python archive.py retire 4012 4013         # take items out of circulation
+#   python archive.py stats
+#
+# Moved to the Archived* tables (schema.py, ARCHIVE), CHUNK_SIZE rows per
+# transaction so the desk never waits long:
+#   loans      returned before the cutoff, with their fines, unless one is still owed
+#              or Borrow still points at the loan
+#   sign-ups   for events held before the cutoff (their seat counts stay as they were)
+#   items      retired (Records status 'Archived') and not checked out; they drop
+#              out of search and recommendations
+#
+# Checkout, returns, fines and sign-ups only ever touch current rows, so they
+# work on the small live tables; history (recommendations, reports, a fine's
+# item name) reads the LoanHistory / FineHistory / AttendanceHistory /
+# ItemHistory views. New rows reuse the freed pages; to shrink the file after
+# a big first run, restore a `maintenance.py vacuum` copy.
+#
+# Item ids are plain rowids: SQLite hands out MAX + 1, so the item holding the
+# highest id always stays put, or its id could be given out again. Sign-up ids
+# (attendID) are AUTOINCREMENT and never reused.
+
+# Loans and sign-ups closed for this many days are archived
+ARCHIVE_AFTER_DAYS = 365
+
+# Rows (loans, items) or events per transaction
+CHUNK_SIZE = 1000
+EVENT_CHUNK_SIZE = 100
+
+
+class ArchiveError(LibraryError):
+    pass
+
+
+# Summary of an archive run
+class ArchiveReport(Record):
+    __slots__ = ("before", "loans", "fines", "attendances", "items", "chunks", "seconds")
+
+
+def _today():
+    return date.today().isoformat()
+
+
+# Takes an item out of circulation (its holds are dropped); the next archive
+# run moves it out of Item
+def retire_item(conn, item_id, today=None):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("SELECT name FROM Item WHERE itemID = ?", (item_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ItemNotFound("Item not found.")
+        cursor.execute("SELECT 1 FROM Borrow WHERE itemID = ?", (item_id,))
+        if cursor.fetchone() is not None:
+            raise ArchiveError(f"'{row[0]}' is checked out. Retire it once it has been returned.")
+        cursor.execute("UPDATE Item SET status = 'Unavailable' WHERE itemID = ?", (item_id,))
+        cursor.execute("DELETE FROM ItemHolds WHERE itemID = ?", (item_id,))
+        cursor.execute("UPDATE Records SET status = 'Archived', lastUpdated = ? WHERE itemID = ?",
+                       (today or _today(), item_id))
+    return row[0]
+
+
+# Returned loans from before `before` with nothing owed, and their fines
+# -> (loans, fines) moved
+def archive_loans(conn, before, today=None, chunk_size=CHUNK_SIZE, progress=None):
+    today = today or _today()
+    cursor = conn.cursor()
+    after_id = 0
+    loans = fines = 0
+    while True:
+        with immediate_transaction(conn):
+            cursor.execute("""
+                SELECT T.borrowID FROM BorrowTransactions T
+                WHERE T.borrowID > ? AND T.status = 'Returned' AND T.returnDate < ?
+                  AND NOT EXISTS (SELECT 1 FROM Fines F
+                                  WHERE F.borrowID = T.borrowID AND F.status = 'Unpaid' AND F.amount > 0)
+                  AND NOT EXISTS (SELECT 1 FROM Borrow B WHERE B.borrowID = T.borrowID)
+                ORDER BY T.borrowID
+                LIMIT ?
+            """, (after_id, before, chunk_size))
+            chunk = [borrow_id for (borrow_id,) in cursor.fetchall()]
+            if chunk:
+                ids = json.dumps(chunk)
+                cursor.execute("""
+                    INSERT INTO ArchivedLoans (borrowID, borrowDate, returnDate, status, email, itemID, archivedAt)
+                    SELECT borrowID, borrowDate, returnDate, status, email, itemID, ?
+                    FROM BorrowTransactions WHERE borrowID IN (SELECT value FROM json_each(?))
+                """, (today, ids))
+                cursor.execute("""
+                    INSERT INTO ArchivedFines (borrowID, status, amount, assessed)
+                    SELECT borrowID, status, amount, assessed
+                    FROM Fines WHERE borrowID IN (SELECT value FROM json_each(?))
+                """, (ids,))
+                fines += cursor.rowcount
+                cursor.execute("DELETE FROM Fines WHERE borrowID IN (SELECT value FROM json_each(?))", (ids,))
+                cursor.execute("DELETE FROM BorrowTransactions WHERE borrowID IN (SELECT value FROM json_each(?))",
+                               (ids,))
+                loans += len(chunk)
+                after_id = chunk[-1]
+
+        if progress:
+            progress("loans", loans)
+        if len(chunk) < chunk_size:
+            return loans, fines
+
+
+# Sign-ups for events held before `before` -> Number moved
+def archive_attendances(conn, before, today=None, chunk_size=EVENT_CHUNK_SIZE, progress=None):
+    today = today or _today()
+    cursor = conn.cursor()
+    after = ("", "", 0)
+    moved = 0
+    while True:
+        with immediate_transaction(conn):
+            cursor.execute("""
+                SELECT eventID, scheduledDate, scheduledTime FROM Events
+                WHERE scheduledDate < ? AND (scheduledDate, scheduledTime, eventID) > (?, ?, ?)
+                ORDER BY scheduledDate, scheduledTime, eventID
+                LIMIT ?
+            """, (before, *after, chunk_size))
+            events = cursor.fetchall()
+            if events:
+                ids = json.dumps([event_id for event_id, _, _ in events])
+                cursor.execute("""
+                    SELECT eventID, COUNT(*) FROM Attends
+                    WHERE eventID IN (SELECT value FROM json_each(?))
+                    GROUP BY eventID
+                """, (ids,))
+                counts = cursor.fetchall()
+                cursor.execute("""
+                    INSERT INTO ArchivedAttends (attendID, email, eventID, archivedAt)
+                    SELECT attendID, email, eventID, ? FROM Attends
+                    WHERE eventID IN (SELECT value FROM json_each(?))
+                """, (today, ids))
+                cursor.execute("DELETE FROM Attends WHERE eventID IN (SELECT value FROM json_each(?))", (ids,))
+                # The delete trigger took them off the seat counts -> Put them back
+                cursor.executemany("UPDATE EventOccupancy SET attendees = attendees + ? WHERE eventID = ?",
+                                   [(count, event_id) for event_id, count in counts])
+                moved += sum(count for _, count in counts)
+                after = (events[-1][1], events[-1][2], events[-1][0])
+
+        if progress:
+            progress("sign-ups", moved)
+        if len(events) < chunk_size:
+            return moved
+
+
+# Retired items that aren't checked out -> Number moved
+def archive_items(conn, today=None, chunk_size=CHUNK_SIZE, progress=None):
+    today = today or _today()
+    cursor = conn.cursor()
+    after_id = 0
+    moved = 0
+    while True:
+        with immediate_transaction(conn):
+            cursor.execute("""
+                SELECT DISTINCT r.itemID FROM Records r
+                WHERE r.status = 'Archived' AND r.itemID > ?
+                  AND r.itemID < (SELECT MAX(itemID) FROM Item)
+                  AND EXISTS (SELECT 1 FROM Item WHERE Item.itemID = r.itemID)
+                  AND NOT EXISTS (SELECT 1 FROM Borrow WHERE Borrow.itemID = r.itemID)
+                ORDER BY r.itemID
+                LIMIT ?
+            """, (after_id, chunk_size))
+            chunk = [item_id for (item_id,) in cursor.fetchall()]
+            if chunk:
+                ids = json.dumps(chunk)
+                cursor.execute("""
+                    INSERT INTO ArchivedItems (itemID, name, author, category, genre, status, archivedAt)
+                    SELECT itemID, name, author, category, genre, status, ?
+                    FROM Item WHERE itemID IN (SELECT value FROM json_each(?))
+                """, (today, ids))
+                # Triggers take them out of the search index
+                cursor.execute("DELETE FROM Item WHERE itemID IN (SELECT value FROM json_each(?))", (ids,))
+                cursor.execute("DELETE FROM ItemNeighbours WHERE itemID IN (SELECT value FROM json_each(?))", (ids,))
+                moved += len(chunk)
+                after_id = chunk[-1]
+
+        if progress:
+            progress("items", moved)
+        if len(chunk) < chunk_size:
+            return moved
+
+
+# The whole run -> ArchiveReport
+# progress(what, rows so far) is called after each chunk
+def archive(conn, before=None, today=None, chunk_size=CHUNK_SIZE, progress=None):
+    started = time.perf_counter()
+    today = today or _today()
+    before = before or (date.fromisoformat(today) - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+
+    chunks = 0
+
+    def counted(what, rows):
+        nonlocal chunks
+        chunks += 1
+        if progress:
+            progress(what, rows)
+
+    loans, fines = archive_loans(conn, before, today, chunk_size, counted)
+    attendances = archive_attendances(conn, before, today, EVENT_CHUNK_SIZE, counted)
+    items = archive_items(conn, today, chunk_size, counted)
+    return ArchiveReport(before, loans, fines, attendances, items, chunks, time.perf_counter() - started)
+
+
+# (table, live rows, archived rows)
+def archive_sizes(conn):
+    sizes = []
+    for live, archived in (("BorrowTransactions", "ArchivedLoans"), ("Fines", "ArchivedFines"),
+                           ("Attends", "ArchivedAttends"), ("Item", "ArchivedItems")):
+        counts = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in (live, archived)]
+        sizes.append((live, *counts))
+    return sizes
+
+
+def print_progress(what, rows):
+    print(f"\r⏳ {rows} {what} archived   ", end="", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move closed loans, past sign-ups and retired items to the archive")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="archive everything closed before the cutoff")
+    run.add_argument("--before", help=f"cutoff date (default: {ARCHIVE_AFTER_DAYS} days ago)")
+    run.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="loans / items per transaction")
+
+    retire = commands.add_parser("retire", help="take items out of circulation")
+    retire.add_argument("item_ids", nargs="+", type=int)
+
+    commands.add_parser("stats", help="live and archived row counts")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    if args.command == "run":
+        if args.before:
+            try:
+                date.fromisoformat(args.before)
+            except ValueError:
+                print(f"❌ Not a date: {args.before}")
+                return 1
+        report = archive(conn, args.before, chunk_size=args.chunk_size, progress=print_progress)
+        print()
+        print(f"✅ Archived before {report.before}: {report.loans} loans, {report.fines} fines, "
+              f"{report.attendances} sign-ups, {report.items} items in {report.chunks} chunks, "
+              f"{report.seconds:.2f}s.")
+
+    elif args.command == "retire":
+        failed = 0
+        for item_id in args.item_ids:
+            try:
+                print(f"✅ Retired '{retire_item(conn, item_id)}' ({item_id}).")
+            except LibraryError as error:
+                print(f"❌ {item_id}: {error}")
+                failed += 1
+        if failed:
+            return 1
+
+    elif args.command == "stats":
+        print("📊 Live / archived rows")
+        for table, live, archived in archive_sizes(conn):
+            print(f"  {table:<20} {live:>10} live {archived:>10} archived")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
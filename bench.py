@@ -0,0 +1,173 @@
+import argparse
+import json
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from library_service import LibraryService, open_library
+from load_test import percentile
+from records import LibraryError
+
+# Times each desk workflow against a database (usually one made by datagen.py)
+#
+#   python datagen.py --scale 1m --out bench-1m.db
+#   python bench.py --db bench-1m.db --out before.json
+#   ... change something ...
+#   python bench.py --db bench-1m.db --compare before.json
+#
+# Runs on a temporary copy, so the database itself is never changed and every
+# run starts from the same data. Results (p50/p95/p99 in ms, ops/sec) are JSON.
+
+# Workflows in the order they run; return comes after borrow so it has loans to return
+WORKFLOWS = ["search", "borrow", "return", "donate", "find_events", "register", "fines"]
+
+
+# Inputs for every workflow, drawn up front from the data (not timed)
+def pick_inputs(conn, rng, iterations):
+    def sample(query, *params):
+        rows = conn.execute(query, params).fetchall()
+        return [rng.choice(rows) for _ in range(iterations)] if rows else []
+
+    members = [email for (email,) in sample("SELECT email FROM Member")]
+    busy_members = [email for (email,) in sample("""
+        SELECT email FROM BorrowTransactions GROUP BY email ORDER BY COUNT(*) DESC LIMIT 100
+    """)] or members
+    names = [name for (name,) in sample("SELECT name FROM Item WHERE name IS NOT NULL")]
+    available = conn.execute("SELECT itemID FROM Item WHERE status = 'Available' LIMIT ?",
+                             (iterations * 10,)).fetchall()
+    upcoming = [event_id for (event_id,) in sample("""
+        SELECT eventID FROM Events WHERE scheduledDate >= DATE('now')
+    """)]
+
+    return {
+        # One or two words of a real title, as a patron would type them
+        "search": [" ".join(rng.sample(name.split(), min(2, len(name.split())))) for name in names],
+        "borrow": list(zip(members, rng.sample([item_id for (item_id,) in available],
+                                               min(iterations, len(available))))),
+        "donate": [(f"Bench Donation {n}", "Bench Author", "Book", "Fiction") for n in range(iterations)],
+        "find_events": [None] * iterations,
+        "register": list(zip(members, upcoming)),
+        "fines": busy_members,
+    }
+
+
+# Runs `operation(argument)` for every argument -> (timings, errors, results)
+def time_calls(operation, arguments):
+    timings, errors, results = [], 0, []
+    for argument in arguments:
+        started = time.perf_counter()
+        try:
+            results.append(operation(argument))
+        except LibraryError:
+            errors += 1
+        timings.append(time.perf_counter() - started)
+    return timings, errors, results
+
+
+def summarize(timings, errors):
+    timings = sorted(timings)
+    total = sum(timings)
+    return {
+        "count": len(timings),
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "ops_per_sec": round(len(timings) / total, 1) if total else None,
+    }
+
+
+# instrument=True -> Same run on an InstrumentedConnection (to measure its overhead)
+def run(db_path, iterations=200, seed=42, workflows=WORKFLOWS, instrument=False):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / "bench.db"
+        shutil.copyfile(db_path, copy)
+        conn = open_library(copy, instrument=instrument)
+        service = LibraryService(conn)
+        inputs = pick_inputs(conn, rng, iterations)
+        borrowed = []
+
+        operations = {
+            "search": lambda text: next(service.search_pages(text, page_size=10), []),
+            "borrow": lambda args: borrowed.append((args[0], service.borrow(*args).item_id)),
+            "return": lambda args: service.return_item(*args),
+            "donate": lambda args: service.donate(*args),
+            "find_events": lambda _: service.list_events(),
+            "register": lambda args: service.register(*args),
+            "fines": lambda email: service.fines(email),
+        }
+
+        results = {}
+        for name in workflows:
+            arguments = borrowed if name == "return" else inputs[name]
+            timings, errors, _ = time_calls(operations[name], arguments)
+            results[name] = summarize(timings, errors)
+        service.close()
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Prints how each workflow moved against an earlier run
+def compare(report, baseline):
+    print(f"{'Workflow':<12} {'p50 before':>11} {'p50 now':>9} {'p95 before':>11} {'p95 now':>9} {'change':>8}")
+    for name, now in report["workflows"].items():
+        before = baseline["workflows"].get(name)
+        if not before or not before["p50_ms"]:
+            print(f"{name:<12} {'-':>11} {now['p50_ms']:>9} {'-':>11} {now['p95_ms']:>9}")
+            continue
+        change = now["p50_ms"] / before["p50_ms"]
+        print(f"{name:<12} {before['p50_ms']:>11} {now['p50_ms']:>9} {before['p95_ms']:>11} "
+              f"{now['p95_ms']:>9} {change:>7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the library workflows")
+    parser.add_argument("--db", default="bench.db", help="database to benchmark (a temporary copy is used)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per workflow")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workflow", action="append", choices=WORKFLOWS, help="only these workflows (repeatable)")
+    parser.add_argument("--instrument", action="store_true", help="run with query instrumentation on")
+    parser.add_argument("--out", help="write the JSON report here instead of printing it")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    workflows = [name for name in WORKFLOWS if not args.workflow or name in args.workflow]
+    if "return" in workflows and "borrow" not in workflows:
+        workflows.insert(workflows.index("return"), "borrow")
+
+    report = {
+        "database": str(args.db),
+        "commit": git_commit(),
+        "sqlite_version": sqlite3.sqlite_version,
+        "iterations": args.iterations,
+        "seed": args.seed,
+        "instrumented": args.instrument,
+        "workflows": run(args.db, args.iterations, args.seed, workflows, args.instrument),
+    }
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"✅ Wrote {args.out}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
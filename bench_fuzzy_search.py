@@ -0,0 +1,137 @@
+import argparse
+import random
+import shutil
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from load_test import percentile
+from schema import ensure_schema
+from search_index import PAGE_SIZE, fuzzy_search, search_items
+
+# Benchmark: misspelled author / title words, the old substring LIKE vs. the
+# full-text search vs. fuzzy_search on the trigram index (schema.py)
+#
+#   python datagen.py --scale 100k --out bench-100k.db
+#   python bench_fuzzy_search.py --db bench-100k.db --queries 300
+#
+# Each query is one word of a real item's author or title with one typo
+# (letters swapped, dropped, doubled or replaced). A hit is a result whose
+# author / title has the word spelled right. "LIKE + retries" is the old kiosk
+# routine: when the LIKE finds nothing, try again with the word cut down a
+# letter at a time, scanning the catalog each time.
+# Also times donations with and without the trigram triggers.
+# Runs on a temporary copy -> The database itself is never changed.
+
+FIELDS = ('author', 'name')
+
+
+# One typo in `word`
+def misspell(rng, word):
+    position = rng.randrange(len(word) - 1)
+    kind = rng.choice(["swap", "drop", "double", "replace"])
+    if kind == "swap":
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    if kind == "drop":
+        return word[:position] + word[position + 1:]
+    if kind == "double":
+        return word[:position] + word[position] + word[position:]
+    return word[:position] + rng.choice(string.ascii_lowercase) + word[position + 1:]
+
+
+# [(field, correct word, misspelled word)]
+def pick_queries(conn, rng, count):
+    queries = []
+    while len(queries) < count:
+        field = rng.choice(FIELDS)
+        row = conn.execute(f"SELECT {field} FROM Item WHERE itemID >= ? AND {field} IS NOT NULL LIMIT 1",
+                           (rng.randint(1, conn.execute("SELECT MAX(itemID) FROM Item").fetchone()[0]),)).fetchone()
+        words = [word for word in (row[0].split() if row else []) if len(word) >= 5 and word.isalpha()]
+        if words:
+            word = rng.choice(words)
+            queries.append((field, word, misspell(rng, word.lower())))
+    return queries
+
+
+def like(conn, field, text):
+    return conn.execute(f"""
+        SELECT itemID, name, author, category, genre, status FROM Item
+        WHERE {field} LIKE '%' || ? || '%' LIMIT ?
+    """, (text, PAGE_SIZE)).fetchall()
+
+
+def like_with_retries(conn, field, text):
+    while True:
+        rows = like(conn, field, text)
+        if rows or len(text) <= 3:
+            return rows
+        text = text[:-1]
+
+
+# Runs every query through `search` -> (timings in ms, share of queries with a hit)
+def measure(conn, queries, search):
+    timings = []
+    hits = 0
+    for field, word, text in queries:
+        start = time.perf_counter()
+        rows = search(conn, field, text)
+        timings.append((time.perf_counter() - start) * 1000)
+        column = 1 if field == 'name' else 2
+        if any(word.lower() in (row[column] or "").lower().split() for row in rows):
+            hits += 1
+    return sorted(timings), hits / len(queries)
+
+
+# Average ms per donated item (insert + commit), with whatever triggers are in place
+def time_donations(conn, count):
+    start = time.perf_counter()
+    for number in range(count):
+        conn.execute("INSERT INTO Item (name, author, category, genre, status) VALUES (?, ?, 'Book', 'Fiction', 'Available')",
+                     (f"Bench Donation Volume {number}", "Bench Author"))
+        conn.commit()
+    return (time.perf_counter() - start) * 1000 / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Misspelled searches: substring LIKE vs. trigram index")
+    parser.add_argument("--db", default="bench.db", help="database to copy (usually one made by datagen.py)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--donations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        shutil.copyfile(args.db, path)
+        conn = sqlite3.connect(path)
+        ensure_schema(conn)
+        conn.execute("PRAGMA synchronous = OFF")
+        queries = pick_queries(conn, random.Random(args.seed), args.queries)
+
+        searches = [
+            ("LIKE '%word%'", like),
+            ("LIKE + retries", like_with_retries),
+            ("full-text search", lambda conn, field, text: search_items(conn, text, field, PAGE_SIZE)),
+            ("fuzzy_search", lambda conn, field, text: fuzzy_search(conn, text, field)),
+        ]
+        print(f"{len(queries)} misspelled words, {conn.execute('SELECT COUNT(*) FROM Item').fetchone()[0]} items")
+        print(f"  {'':<18} {'p50 ms':>8} {'p95 ms':>8} {'found':>7}")
+        for label, search in searches:
+            timings, found = measure(conn, queries, search)
+            print(f"  {label:<18} {percentile(timings, 50):8.2f} {percentile(timings, 95):8.2f} {found:7.0%}")
+
+        time_donations(conn, args.donations)  # warm-up
+        with_index = time_donations(conn, args.donations)
+        triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'item_trigrams_%'").fetchall()
+        for name, _ in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        without_index = time_donations(conn, args.donations)
+        print(f"Donation: {without_index:.3f} ms without the trigram triggers, {with_index:.3f} ms with")
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from schema import BORROW_TRANSACTIONS_TRIGGERS
+
+# Benchmark: BorrowTransactions insert throughput with the old MAX()-based
+# set_borrow_transactions trigger vs. AUTOINCREMENT allocation (schema.py)
+#
+#   python bench_id_allocation.py --rows 50000 --preload 200000
+
+# Schema as built in the notebook
+BEFORE_SCHEMA = [
+    """CREATE TABLE BorrowTransactions (
+        borrowID INTEGER PRIMARY KEY,
+        borrowDate DATE,
+        returnDate DATE DEFAULT NULL,
+        status VARCHAR(10) CHECK (status IN ('Borrowed', 'Returned')) DEFAULT 'Borrowed'
+    )""",
+    """CREATE TABLE Fines (borrowID INTEGER PRIMARY KEY, status VARCHAR(6), amount DECIMAL(10,2))""",
+    """CREATE TRIGGER AddFineForOverdueInsert
+    AFTER INSERT ON BorrowTransactions
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO Fines (borrowID, status, amount)
+        SELECT New.borrowID, 'Unpaid', 10.00
+        WHERE NEW.status = 'Borrowed' AND NEW.returnDate < CURRENT_DATE;
+    END""",
+    """CREATE TRIGGER AddFineForOverdueUpdate
+    AFTER UPDATE ON BorrowTransactions
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO Fines (borrowID, status, amount)
+        SELECT New.borrowID, 'Unpaid', 10.00
+        WHERE NEW.status = 'Borrowed' AND NEW.returnDate < CURRENT_DATE;
+    END""",
+    """CREATE TRIGGER SetReturnDate
+    AFTER INSERT ON BorrowTransactions
+    FOR EACH ROW
+    BEGIN
+        UPDATE BorrowTransactions
+        SET returnDate = DATE(NEW.borrowDate, '+1 month')
+        WHERE borrowID = NEW.borrowID;
+    END""",
+    """CREATE TRIGGER set_borrow_transactions
+    BEFORE INSERT ON BorrowTransactions
+    FOR EACH ROW
+    WHEN NEW.borrowID IS NULL
+    BEGIN
+        UPDATE BorrowTransactions
+        SET borrowID = (
+            CASE
+                WHEN (SELECT MAX(borrowID) FROM BorrowTransactions) IS NULL THEN 1
+                ELSE (SELECT MAX(borrowID) FROM BorrowTransactions) + 1
+            END
+        )
+        WHERE rowid = NEW.rowid;
+    END""",
+]
+
+AFTER_SCHEMA = [
+    """CREATE TABLE BorrowTransactions (
+        borrowID INTEGER PRIMARY KEY AUTOINCREMENT,
+        borrowDate DATE,
+        returnDate DATE DEFAULT NULL,
+        status VARCHAR(10) CHECK (status IN ('Borrowed', 'Returned')) DEFAULT 'Borrowed'
+    )""",
+    """CREATE TABLE Fines (borrowID INTEGER PRIMARY KEY, status VARCHAR(6), amount DECIMAL(10,2))""",
+] + BORROW_TRANSACTIONS_TRIGGERS
+
+
+# How borrow_item() inserted a loan before: NULL id, trigger-set return date read back
+def insert_before(cursor, borrow_date):
+    cursor.execute("INSERT INTO BorrowTransactions (borrowID, borrowDate) VALUES (NULL, ?)", (borrow_date,))
+    borrow_id = cursor.lastrowid
+    cursor.execute("SELECT returnDate FROM BorrowTransactions WHERE borrowID = ?", (borrow_id,))
+    return borrow_id, cursor.fetchone()[0]
+
+
+# How circulation.checkout() inserts a loan now
+def insert_after(cursor, borrow_date):
+    cursor.execute("SELECT DATE(?, '+1 month')", (borrow_date,))
+    return_date = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO BorrowTransactions (borrowDate, returnDate) VALUES (?, ?)",
+                   (borrow_date, return_date))
+    return cursor.lastrowid, return_date
+
+
+# Builds a database, preloads it, then times `rows` inserts -> rows/sec
+def run(path, schema, insert, rows, preload, commit_every):
+    conn = sqlite3.connect(path)
+    for statement in schema:
+        conn.execute(statement)
+    conn.executemany("INSERT INTO BorrowTransactions (borrowID, borrowDate, returnDate, status) VALUES (?, ?, ?, 'Returned')",
+                     ((i, '2020-01-01', '2020-02-01') for i in range(1, preload + 1)))
+    conn.commit()
+
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    for i in range(rows):
+        insert(cursor, '2024-05-01')
+        if (i + 1) % commit_every == 0:
+            conn.commit()
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BorrowTransactions insert throughput, before vs. after")
+    parser.add_argument("--rows", type=int, default=20000, help="loans to insert")
+    parser.add_argument("--preload", type=int, default=100000, help="loans already in the table")
+    parser.add_argument("--commit-every", type=int, default=100,
+                        help="inserts per commit (1 = one commit per desk checkout, fsync-bound)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(Path(tmp) / "before.db", BEFORE_SCHEMA, insert_before,
+                     args.rows, args.preload, args.commit_every)
+        after = run(Path(tmp) / "after.db", AFTER_SCHEMA, insert_after,
+                    args.rows, args.preload, args.commit_every)
+
+    print(f"Before (MAX() trigger):   {before:10.0f} inserts/sec")
+    print(f"After  (AUTOINCREMENT):   {after:10.0f} inserts/sec")
+    print(f"Speed-up:                 {after / before:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
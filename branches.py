@@ -0,0 +1,381 @@
+import argparse
+import heapq
+import json
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+
+from event_calendar import EventCalendar, event_key
+from library_service import LibraryService, MemberExists
+from member_cache import MemberCache
+from pool import ConnectionPool
+from records import LibraryError, MemberNotFound, Record
+from schema import ensure_schema
+from search_index import PAGE_SIZE, search_items
+from transactions import immediate_transaction
+
+# Several branches, one database file each
+#
+#   python branches.py add east east.db       # new branch (file created and migrated)
+#   python branches.py list
+#   python branches.py search tolkien         # one search across every branch
+#   python branches.py events
+#   python branches.py home ana@example.com   # which branch a member belongs to
+#   python server.py --branches branches.json # GET /items searches every branch
+#
+# branches.json maps branch names to database files (relative to itself):
+#   {"main": "library.db", "east": "east.db"}
+# Without it library.db is the only branch, "main".
+#
+# A member belongs to one branch, the one whose Member table has them, and
+# everything they do (loans, holds, sign-ups, fines) is written there -> Each
+# branch's desk only ever takes its own file's write lock, so branches don't
+# queue behind each other. Item and event ids are per branch: "east:4012".
+#
+# Searches fan out: one query per branch on a thread pool (sqlite3 lets go of
+# the GIL while a query runs -> the branches are searched at the same time)
+# and the answers are merged in ranking order. A branch that hasn't answered
+# within the timeout, or can't be read, is left out and named in `missing`
+# instead of holding up the whole search. ATTACH was the other option, but it
+# is one connection: the branches would be searched one after another and one
+# slow or locked file would stall them all.
+
+BRANCHES_FILE = "branches.json"
+
+# Name of the only branch when there is no branches file
+DEFAULT_BRANCH = "main"
+
+# How long a search waits for the slowest branch (s)
+BRANCH_TIMEOUT_SECONDS = 1.0
+
+# Search threads per branch -> A slow branch can't take up every thread
+THREADS_PER_BRANCH = 4
+
+# bm25 scores this close count as a tie. Each branch scores against its own
+# catalog, so the same title scores a little better where the word is rarer;
+# ties are dealt out a branch at a time instead of one branch taking the page.
+SCORE_TIE = 1.0
+
+
+class BranchError(LibraryError):
+    pass
+
+
+class UnknownBranch(BranchError):
+    pass
+
+
+# Couldn't tell which branch a member belongs to
+class BranchUnavailable(BranchError):
+    pass
+
+
+# Member-scoped action on an item / event of another branch
+class WrongBranch(BranchError):
+    pass
+
+
+class Branch(Record):
+    __slots__ = ("name", "path")
+
+
+# Item / event with the branch it is at
+class BranchItem(Record):
+    __slots__ = ("branch", "item_id", "name", "author", "category", "genre", "status")
+
+
+class BranchEvent(Record):
+    __slots__ = ("branch", "event_id", "name", "scheduled_time", "scheduled_date", "target_audience")
+
+
+# Merged answer of a fan-out, and the branches that didn't give one
+class Federated(Record):
+    __slots__ = ("results", "missing")
+
+
+# Branches in the order they are listed in `config`
+def load_branches(config=BRANCHES_FILE):
+    config = Path(config).resolve()
+    if not config.exists():
+        return [Branch(DEFAULT_BRANCH, config.with_name("library.db"))]
+    return [Branch(name, config.parent / path) for name, path in json.loads(config.read_text()).items()]
+
+
+# Tables, indexes, views and triggers of the database `template` created in
+# the empty database `conn`, at the same schema version. The migrations start
+# from the tables built in the notebook -> A new file can't be migrated from nothing.
+def _copy_schema(template, conn):
+    source = sqlite3.connect(f"{Path(template).as_uri()}?mode=ro", uri=True)
+    try:
+        # FTS index tables are created by their CREATE VIRTUAL TABLE
+        shadow = {name for schema, name, kind, *_ in source.execute("PRAGMA table_list")
+                  if schema == "main" and kind == "shadow"}
+        objects = source.execute("""
+            SELECT name, sql FROM sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'
+            ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 WHEN 'view' THEN 2 ELSE 3 END, rowid
+        """).fetchall()
+        # No SchemaVersion -> Never migrated; ensure_schema() starts from the beginning
+        versions = []
+        if any(name == "SchemaVersion" for name, _ in objects):
+            versions = source.execute("SELECT version, name, appliedAt FROM SchemaVersion").fetchall()
+    finally:
+        source.close()
+
+    with immediate_transaction(conn):
+        for name, sql in objects:
+            if name not in shadow:
+                conn.execute(sql)
+        if versions:
+            conn.executemany("INSERT INTO SchemaVersion (version, name, appliedAt) VALUES (?, ?, ?)",
+                             versions)
+
+
+# Adds a branch to `config` and creates / migrates its database -> Branch
+# A new file gets the schema of the first branch that has a database
+def add_branch(name, path, config=BRANCHES_FILE):
+    config = Path(config).resolve()
+    branches = load_branches(config)
+    if any(branch.name == name for branch in branches):
+        raise BranchError(f"There is already a branch called {name}.")
+
+    path = Path(path).resolve()
+    created = not path.exists()
+    if created:
+        template = next((branch.path for branch in branches if Path(branch.path).exists()), None)
+        if template is None:
+            raise BranchError("No branch database to take the schema from.")
+    try:
+        conn = sqlite3.connect(path)
+        try:
+            if created:
+                _copy_schema(template, conn)
+            ensure_schema(conn)
+        finally:
+            conn.close()
+    except (sqlite3.Error, LibraryError):
+        # Half-made file -> Gone, so the next try starts again
+        if created:
+            path.unlink(missing_ok=True)
+        raise
+
+    branches.append(Branch(name, path))
+    entries = {}
+    for branch in branches:
+        try:
+            entries[branch.name] = str(Path(branch.path).relative_to(config.parent))
+        except ValueError:
+            entries[branch.name] = str(branch.path)
+    config.write_text(json.dumps(entries, indent=2) + "\n")
+    return Branch(name, path)
+
+
+# One pool, member cache and event calendar per branch, and a shared thread
+# pool for the fan-outs. Safe to share between threads.
+class BranchLibrary:
+    def __init__(self, branches, timeout=BRANCH_TIMEOUT_SECONDS):
+        # A pool would create a missing file -> An empty branch nobody notices
+        for branch in branches:
+            if not Path(branch.path).exists():
+                raise UnknownBranch(f"No database for branch {branch.name} at {branch.path}.")
+        self.branches = [branch.name for branch in branches]
+        self.timeout = timeout
+        self._pools = {branch.name: ConnectionPool(branch.path) for branch in branches}
+        self._caches = {branch.name: (MemberCache(), EventCalendar()) for branch in branches}
+        self._homes = {}
+        self._homes_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(len(branches) * THREADS_PER_BRANCH, thread_name_prefix="branch")
+
+    def _pool(self, name):
+        if name not in self._pools:
+            raise UnknownBranch(f"No branch called {name}.")
+        return self._pools[name]
+
+    # Runs search(service) against every branch at once, each on its own read
+    # connection -> ({branch: result}, [branches that timed out or failed])
+    def _fan_out(self, search):
+        def run(name):
+            return search(LibraryService(self._pools[name].reader(), *self._caches[name]))
+
+        futures = {self._executor.submit(run, name): name for name in self.branches}
+        done, _ = wait(futures, timeout=self.timeout)
+
+        results, missing = {}, []
+        for future, name in futures.items():
+            if future not in done or isinstance(future.exception(), sqlite3.Error):
+                missing.append(name)
+            else:
+                results[name] = future.result()
+        return results, missing
+
+    # Service on one branch's read connection
+    def reader(self, name):
+        return LibraryService(self._pool(name).reader(), *self._caches[name])
+
+    # Service on one branch's write connection, held for the block
+    @contextmanager
+    def writer(self, name):
+        with self._pool(name).writer() as conn:
+            yield LibraryService(conn, *self._caches[name])
+
+    # Branch a member belongs to (remembered once found)
+    def home_branch(self, email):
+        with self._homes_lock:
+            if email in self._homes:
+                return self._homes[email]
+
+        results, missing = self._fan_out(lambda service: service.get_member(email) is not None)
+        found = [name for name in self.branches if results.get(name)]
+        if found:
+            with self._homes_lock:
+                self._homes[email] = found[0]
+            return found[0]
+        if missing:
+            raise BranchUnavailable(f"Can't reach {', '.join(missing)} to look up this membership. Try again shortly.")
+        raise MemberNotFound("No membership found with this email. Please create a membership first.")
+
+    # Service on the member's home branch's write connection
+    @contextmanager
+    def member_writer(self, email):
+        with self.writer(self.home_branch(email)) as service:
+            yield service
+
+    # New member at `branch`; the email must not be in use at any branch
+    def create_member(self, branch, name, birthday, email):
+        try:
+            home = self.home_branch(email)
+        except MemberNotFound:
+            pass
+        else:
+            raise MemberExists(f"This email already has a membership (at {home}).")
+        with self.writer(branch) as service:
+            member = service.create_member(name, birthday, email)
+        with self._homes_lock:
+            self._homes[email] = branch
+        return member
+
+    def _at_home(self, email, branch, what):
+        home = self.home_branch(email)
+        if branch != home:
+            raise WrongBranch(f"That {what} is at {branch}; your membership is at {home}.")
+        return home
+
+    # Checkout at the member's home branch
+    def borrow(self, email, branch, item_id):
+        with self.writer(self._at_home(email, branch, "item")) as service:
+            return service.borrow(email, item_id)
+
+    def register(self, email, branch, event_id, today=None, waitlist=False):
+        with self.writer(self._at_home(email, branch, "event")) as service:
+            return service.register(email, event_id, today, waitlist)
+
+    # Best matches across all branches -> Federated(BranchItems, missing)
+    # Available first, then by bm25 score; each branch's own order is kept
+    def search_items(self, text, field=None, limit=PAGE_SIZE):
+        results, missing = self._fan_out(lambda service: search_items(service.conn, text, field, limit, scored=True))
+        ranked = [[(row[5] != 'Available', round(row[6] / SCORE_TIE), position, self.branches.index(name), row[:6])
+                   for position, row in enumerate(results[name])]
+                  for name in results]
+        items = [BranchItem(self.branches[branch], *row)
+                 for *_, branch, row in islice(heapq.merge(*ranked), limit)]
+        return Federated(items, missing)
+
+    # Upcoming events across all branches, in date order -> Federated(BranchEvents, missing)
+    def upcoming_events(self, limit=PAGE_SIZE, today=None):
+        results, missing = self._fan_out(lambda service: service.upcoming_events(limit, today=today))
+        ranked = [[(event_key(event), name, event) for event in results[name]] for name in results]
+        events = [BranchEvent(name, event.event_id, event.name, event.scheduled_time, event.scheduled_date,
+                              event.target_audience)
+                  for _, name, event in islice(heapq.merge(*ranked), limit)]
+        return Federated(events, missing)
+
+    # Closes every connection; only call once no thread is using it
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for pool in self._pools.values():
+            pool.close()
+
+
+def print_missing(missing):
+    if missing:
+        print(f"⚠️  No answer from {', '.join(missing)}: results from there are left out.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library branches, one database file each")
+    parser.add_argument("--config", default=BRANCHES_FILE, help=f"branches file (default: {BRANCHES_FILE})")
+    parser.add_argument("--timeout", type=float, default=BRANCH_TIMEOUT_SECONDS,
+                        help="seconds to wait for the slowest branch")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add a branch (creates and migrates its database)")
+    add.add_argument("name")
+    add.add_argument("path")
+
+    commands.add_parser("list", help="branches and their sizes")
+
+    search = commands.add_parser("search", help="search the catalogs of all branches")
+    search.add_argument("text")
+    search.add_argument("--field", choices=('name', 'author', 'category', 'genre'))
+    search.add_argument("--limit", type=int, default=PAGE_SIZE)
+
+    events = commands.add_parser("events", help="upcoming events at all branches")
+    events.add_argument("--limit", type=int, default=PAGE_SIZE)
+
+    home = commands.add_parser("home", help="which branch a member belongs to")
+    home.add_argument("email")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        try:
+            branch = add_branch(args.name, args.path, args.config)
+        except (BranchError, sqlite3.Error) as error:
+            print(f"❌ {error}")
+            return 1
+        print(f"✅ Branch {branch.name} added ({branch.path}).")
+        return
+
+    branches = load_branches(args.config)
+    if args.command == "list":
+        for branch in branches:
+            conn = sqlite3.connect(branch.path)
+            items, members = (conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("Item", "Member"))
+            conn.close()
+            print(f"  {branch.name:<15} {str(branch.path):<50} {items:>8} items {members:>8} members")
+        return
+
+    library = BranchLibrary(branches, args.timeout)
+    try:
+        if args.command == "search":
+            found = library.search_items(args.text, args.field, args.limit)
+            if not found.results:
+                print("❌ No items found.")
+            for item in found.results:
+                mark = "✅" if item.status == 'Available' else "❌"
+                print(f"{mark} {item.branch}:{item.item_id} {item.name} by {item.author} ({item.category}, {item.genre})")
+            print_missing(found.missing)
+
+        elif args.command == "events":
+            found = library.upcoming_events(args.limit)
+            if not found.results:
+                print("❌ No upcoming events.")
+            for event in found.results:
+                print(f"📅 {event.scheduled_date} {event.scheduled_time} {event.branch}:{event.event_id} {event.name}")
+            print_missing(found.missing)
+
+        elif args.command == "home":
+            print(f"🏠 {args.email} belongs to {library.home_branch(args.email)}.")
+    except LibraryError as error:
+        print(f"❌ {error}")
+        return 1
+    finally:
+        library.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from records import LibraryError, Record
+from schema import ensure_schema, rebuild_item_trigrams
+from transactions import immediate_transaction
+
+# Bulk catalog import: a branch's collection, a pallet of donations
+#
+#   python bulk_import.py collection.csv
+#   python bulk_import.py donations.jsonl --defer-indexes --rejects rejects.csv
+#
+# Rows are streamed from the file (CSV with a header row, or JSON lines) and
+# checked one at a time. Good rows go in CHUNK_SIZE per transaction through
+# executemany, bad ones to the rejects file with the reason -> Memory use is
+# the same for 2k rows or 2M. Records rows and trigram postings are added per
+# chunk with one INSERT ... SELECT each instead of the per-row
+# add_record_on_item_insert / item_trigrams_insert triggers (dropped and put
+# back inside the chunk's transaction, so no other writer ever sees them
+# missing).
+#
+# --defer-indexes also sets aside Item's indexes and the search-index and
+# trigram triggers for the whole run and catches them up once at the end: much
+# faster for a big load, but new items don't show up in search until the run
+# finishes. What was set aside is kept in ImportDeferred, so a killed run is
+# put right by the next.
+
+# Items per transaction
+CHUNK_SIZE = 5000
+
+# Columns read from the file (status is optional, 'Available' by default)
+FIELDS = ('name', 'author', 'category', 'genre', 'status')
+
+# Column sizes from the Item table (SQLite doesn't enforce them)
+MAX_LENGTH = {'name': 255, 'author': 100, 'category': 50, 'genre': 50}
+
+STATUSES = ('Available', 'Unavailable')
+
+RECORD_TRIGGER = 'add_record_on_item_insert'
+SEARCH_TRIGGER = 'item_search_insert'
+TRIGRAM_TRIGGER = 'item_trigrams_insert'
+
+# Rejected rows echoed to the screen (every one goes to --rejects)
+SHOWN_REJECTS = 10
+
+
+# File we can't read at all (as opposed to a bad row)
+class CatalogImportError(LibraryError):
+    pass
+
+
+# Summary of an import run
+class ImportReport(Record):
+    __slots__ = ("rows", "imported", "rejected", "chunks", "seconds")
+
+
+# (line number, row) from a CSV file with a header row
+def read_csv(file):
+    reader = csv.DictReader(file)
+    if not reader.fieldnames or 'name' not in reader.fieldnames:
+        raise CatalogImportError("The CSV file needs a header row with at least a 'name' column.")
+    for row in reader:
+        yield reader.line_num, row
+
+
+# (line number, row) from a JSON lines file; a line that isn't JSON -> row None
+def read_jsonl(file):
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+
+# One row -> ((name, author, category, genre, status), None) or (None, reason)
+def validate(row):
+    if not isinstance(row, dict):
+        return None, "Not a valid JSON object."
+
+    values = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is not None:
+            value = str(value).strip() or None
+        values[field] = value
+
+    if not values['name']:
+        return None, "Missing name."
+    for field, limit in MAX_LENGTH.items():
+        if values[field] and len(values[field]) > limit:
+            return None, f"{field} is longer than {limit} characters."
+
+    status = (values['status'] or 'Available').capitalize()
+    if status not in STATUSES:
+        return None, f"Unknown status '{values['status']}'."
+
+    return (values['name'], values['author'], values['category'], values['genre'], status), None
+
+
+# Inserts one chunk of items and their Records rows in a single transaction
+def insert_chunk(conn, items):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)",
+                       (RECORD_TRIGGER, TRIGRAM_TRIGGER))
+        triggers = dict(cursor.fetchall())
+        for name in triggers:
+            cursor.execute(f"DROP TRIGGER {name}")
+
+        # We hold the write lock -> Everything above `before` is ours
+        cursor.execute("SELECT COALESCE(MAX(itemID), 0) FROM Item")
+        before = cursor.fetchone()[0]
+        cursor.executemany("INSERT INTO Item (name, author, category, genre, status) VALUES (?, ?, ?, ?, ?)", items)
+
+        # Same rows the triggers would have added, for the whole chunk at once
+        cursor.execute("""
+            INSERT INTO Records (itemID, status, lastUpdated)
+            SELECT itemID, 'In System', DATE('now') FROM Item WHERE itemID > ?
+        """, (before,))
+        # (Set aside by --defer-indexes -> Caught up at the end instead)
+        if TRIGRAM_TRIGGER in triggers:
+            rebuild_item_trigrams(cursor, before + 1)
+
+        for sql in triggers.values():
+            cursor.execute(sql)
+
+
+# Sets aside Item's indexes and the search-index / trigram triggers until restore_deferred()
+def defer_indexes(conn):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("SELECT COALESCE(MAX(itemID), 0) + 1 FROM Item")
+        from_id = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'Item' AND sql IS NOT NULL AND (type = 'index' OR name IN (?, ?))
+        """, (SEARCH_TRIGGER, TRIGRAM_TRIGGER))
+        for kind, name, sql in cursor.fetchall():
+            cursor.execute("INSERT OR IGNORE INTO ImportDeferred (name, sql, fromItemID) VALUES (?, ?, ?)",
+                           (name, sql, from_id))
+            cursor.execute(f"DROP {kind.upper()} {name}")
+
+
+# Puts back whatever defer_indexes() set aside and adds the items imported
+# meanwhile to the search and trigram indexes -> Number of indexes / triggers restored
+def restore_deferred(conn):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("SELECT name, sql, fromItemID FROM ImportDeferred")
+        deferred = cursor.fetchall()
+        for _, sql, _ in deferred:
+            cursor.execute(sql)
+
+        if any(name == SEARCH_TRIGGER for name, _, _ in deferred):
+            cursor.execute("""
+                INSERT INTO ItemSearch (rowid, name, author, category, genre)
+                SELECT itemID, name, author, category, genre FROM Item WHERE itemID >= ?
+            """, (min(from_id for _, _, from_id in deferred),))
+        if any(name == TRIGRAM_TRIGGER for name, _, _ in deferred):
+            rebuild_item_trigrams(cursor, min(from_id for _, _, from_id in deferred))
+        cursor.execute("DELETE FROM ImportDeferred")
+    return len(deferred)
+
+
+# Imports (line number, row) pairs -> ImportReport
+# on_reject(line_number, row, reason) is called for every bad row,
+# progress(report) after every chunk
+def import_items(conn, rows, chunk_size=CHUNK_SIZE, defer=False, on_reject=None, progress=None):
+    started = time.perf_counter()
+    report = ImportReport(0, 0, 0, 0, 0.0)
+
+    # A killed --defer-indexes run left things set aside -> Put them back first
+    restore_deferred(conn)
+    if defer:
+        defer_indexes(conn)
+
+    def flush(items):
+        insert_chunk(conn, items)
+        report.imported += len(items)
+        report.chunks += 1
+        report.seconds = time.perf_counter() - started
+        if progress:
+            progress(report)
+
+    try:
+        items = []
+        for line_number, row in rows:
+            report.rows += 1
+            item, reason = validate(row)
+            if item is None:
+                report.rejected += 1
+                if on_reject:
+                    on_reject(line_number, row, reason)
+                continue
+
+            items.append(item)
+            if len(items) >= chunk_size:
+                flush(items)
+                items = []
+        if items:
+            flush(items)
+    finally:
+        if defer:
+            restore_deferred(conn)
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def print_progress(report):
+    rate = report.imported / report.seconds if report.seconds else 0
+    print(f"\r⏳ {report.imported} imported, {report.rejected} rejected ({rate:.0f} rows/s)", end="", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import items into the catalog from a CSV or JSON lines file")
+    parser.add_argument("file", help="CSV with a header row (name, author, category, genre[, status]) or .jsonl")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="file format (default: from the extension)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="items per transaction")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="rebuild the item indexes and search index once at the end")
+    parser.add_argument("--rejects", help="write rejected rows here (CSV: line, reason, row)")
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ("jsonl" if Path(args.file).suffix.lower() in (".jsonl", ".json") else "csv")
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    shown = 0
+    rejects_file = open(args.rejects, "w", newline="") if args.rejects else None
+    rejects = csv.writer(rejects_file) if rejects_file else None
+    if rejects:
+        rejects.writerow(["line", "reason", "row"])
+
+    def on_reject(line_number, row, reason):
+        nonlocal shown
+        if rejects:
+            rejects.writerow([line_number, reason, json.dumps(row)])
+        if shown < SHOWN_REJECTS:
+            print(f"\n❗ Line {line_number}: {reason}", end="")
+            shown += 1
+
+    try:
+        with open(args.file, newline="", encoding="utf-8-sig") as file:
+            rows = read_csv(file) if file_format == "csv" else read_jsonl(file)
+            report = import_items(conn, rows, args.chunk_size, args.defer_indexes, on_reject, print_progress)
+    except (CatalogImportError, OSError) as error:
+        print(f"\n❌ {error}")
+        return 1
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        conn.close()
+
+    print()
+    rate = report.imported / report.seconds if report.seconds else 0
+    print(f"✅ Imported {report.imported} of {report.rows} rows ({report.rejected} rejected) "
+          f"in {report.chunks} chunks, {report.seconds:.2f}s -> {rate:.0f} rows/s.")
+    if report.rejected and args.rejects:
+        print(f"   Rejected rows written to {args.rejects}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
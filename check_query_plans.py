@@ -0,0 +1,153 @@
+import argparse
+import ast
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from replica import REPLICA_STATE
+from schema import ensure_schema
+
+# Fails (exit code 1) if any SQL in the application falls back to a full table scan.
+# Every string literal passed to .execute()/.executemany() is run through
+# EXPLAIN QUERY PLAN against a migrated copy of library.db.
+#
+#   python check_query_plans.py
+#   python check_query_plans.py library_db_application.py circulation.py
+
+FILES = ['library_service.py', 'circulation.py', 'fines.py', 'search_index.py', 'event_calendar.py', 'registration.py', 'recommend.py', 'bulk_import.py', 'maintenance.py', 'analytics.py', 'archive.py', 'holds.py', 'replica.py', 'branches.py']
+
+# Scans that are intended -> (function, table): reason
+ALLOWED_SCANS = {
+    ('build_event_neighbours', 'Attends'): "nightly build reads every sign-up",
+    ('build_event_neighbours', 'ArchivedAttends'): "nightly build reads every sign-up",
+    ('restore_deferred', 'ImportDeferred'): "a handful of rows set aside by bulk_import",
+    ('maintenance_log', 'MaintenanceLog'): "newest rows in rowid order, stops at the LIMIT",
+    ('refresh_events', 'AnalyticsDirty'): "only the event months touched since the last refresh",
+    ('refresh_overdue', 'BorrowTransactions'): "partial index of open loans only, once a day",
+    ('reader_status', 'ChangeLogReaders'): "one row per replica",
+    ('update_event_neighbours', 'AttendanceHistory'): "view materialized from one member's rows (email indexes)",
+    ('_copy_schema', 'SchemaVersion'): "one row per migration, copied into a new branch",
+}
+
+
+# Yields (function name, line, sql) for each literal SQL string passed to execute()/executemany()
+def find_queries(path):
+    tree = ast.parse(Path(path).read_text(), filename=str(path))
+
+    def visit(node, function):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = node.name
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany') and node.args):
+            sql = node.args[0]
+            if isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+                yield function, node.lineno, sql.value
+            elif isinstance(sql, ast.Name):
+                # query = '''...''' earlier in the same function
+                value = constants.get((function, sql.id), constants.get(('<module>', sql.id)))
+                if value is not None:
+                    yield function, node.lineno, value
+        for child in ast.iter_child_nodes(node):
+            yield from visit(child, function)
+
+    # Simple `name = "SQL"` assignments, by function (module level -> '<module>')
+    constants = {}
+    scopes = [tree] + [node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
+    for scope in scopes:
+        name = getattr(scope, 'name', '<module>')
+        for node in ast.iter_child_nodes(scope) if scope is tree else ast.walk(scope):
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)
+                    and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)):
+                constants[(name, node.targets[0].id)] = node.value.value
+
+    for function, line, sql in visit(tree, '<module>'):
+        yield function, line, sql
+
+
+# Dummy parameters so the statement can be planned
+def placeholder_params(sql):
+    names = re.findall(r"[:@$](\w+)", sql)
+    if names:
+        return {name: None for name in names}
+    return [None] * sql.count("?")
+
+
+# Names of tables fully scanned in a plan (subqueries, CTEs and virtual tables aside)
+def full_scans(plan):
+    derived = set()
+    scans = []
+    for _, _, _, detail in plan:
+        match = re.match(r"(?:CO-ROUTINE|MATERIALIZE) (\S+)", detail)
+        if match:
+            derived.add(match.group(1))
+            continue
+        match = re.match(r"SCAN (\S+)", detail)
+        if not match or match.group(1) in derived or 'VIRTUAL TABLE' in detail:
+            continue
+        # CONSTANT ROW, and SQLite's own one-row-per-table sqlite_sequence
+        if match.group(1) == 'CONSTANT' or match.group(1).startswith('sqlite_'):
+            continue
+        scans.append((match.group(1), detail))
+    return scans
+
+
+def check(conn, files):
+    failures = 0
+    checked = 0
+    for path in files:
+        for function, line, sql in find_queries(path):
+            statement = sql.strip()
+            if not re.match(r"(SELECT|INSERT|UPDATE|DELETE|WITH)\b", statement, re.IGNORECASE):
+                continue
+            try:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + statement, placeholder_params(statement)).fetchall()
+            except sqlite3.Error as error:
+                print(f"❗ {path}:{line} ({function}): could not plan: {error}")
+                failures += 1
+                continue
+            checked += 1
+
+            # Aliases -> table names, so `FROM Fines F` reports as Fines
+            aliases = dict(re.findall(r"\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)", statement, re.IGNORECASE))
+            aliases = {alias: table for table, alias in aliases.items()}
+
+            for name, detail in full_scans(plan):
+                table = aliases.get(name, name)
+                if (function, table) in ALLOWED_SCANS:
+                    continue
+                print(f"❌ {path}:{line} ({function}): {detail}")
+                print("    " + " ".join(statement.split())[:160])
+                failures += 1
+    return checked, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that no application query does a full table scan")
+    parser.add_argument("files", nargs="*", default=FILES, help="Python files to check")
+    parser.add_argument("--db", default="library.db", help="database to take the schema from")
+    args = parser.parse_args(argv)
+
+    # Work on a migrated copy -> The real database is never touched
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = Path(tmp) / "plan.db"
+        shutil.copy(args.db, copy)
+        conn = sqlite3.connect(copy)
+        ensure_schema(conn)
+        # Tables only replicas have
+        for statement in REPLICA_STATE:
+            conn.execute(statement)
+        checked, failures = check(conn, args.files)
+        conn.close()
+
+    if failures:
+        print(f"\n❌ {failures} problem(s) in {checked} queries.")
+        return 1
+    print(f"✅ {checked} queries checked, no full table scans.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import json
+from datetime import date
+
+from records import BatchResult, CheckoutReceipt, LibraryError, MemberNotFound
+from transactions import immediate_transaction
+
+# Checkout / check-in paths used by the desk
+#
+# A returned item with holds on it (holds.py) goes to the head of its queue in
+# the same transaction: the hold turns ready for PICKUP_DAYS and the item stays
+# 'Unavailable' to everyone but that member.
+
+# Days a member has to collect an item held for them
+PICKUP_DAYS = 7
+
+# Base class for circulation errors -> str(error) is the message to show
+class CirculationError(LibraryError):
+    pass
+
+
+class ItemNotFound(CirculationError):
+    pass
+
+
+# Item was not 'Available' when we tried to take it (e.g. another desk got there first)
+class CheckoutConflict(CirculationError):
+    pass
+
+
+# Items come back (or a ready hold lapses) -> Each goes to the next hold in its
+# queue, or back on the shelf. Caller holds the write lock.
+# -> {item_id: email} of the holds that became ready
+def release_items(cursor, item_ids, today):
+    cursor.execute("""
+        SELECT ids.value, (SELECT holdID FROM ItemHolds WHERE itemID = ids.value ORDER BY holdID LIMIT 1)
+        FROM json_each(?) AS ids
+    """, (json.dumps(list(item_ids)),))
+    heads = cursor.fetchall()
+
+    cursor.execute("SELECT DATE(?, ?)", (today, f"+{PICKUP_DAYS} days"))
+    expires = cursor.fetchone()[0]
+    ready = {}
+    for item_id, hold_id in heads:
+        if hold_id is not None:
+            cursor.execute("UPDATE ItemHolds SET readyAt = ?, expiresAt = ? WHERE holdID = ? RETURNING email",
+                           (today, expires, hold_id))
+            ready[item_id] = cursor.fetchone()[0]
+
+    cursor.executemany("UPDATE Item SET status = 'Available' WHERE itemID = ?",
+                       [(item_id,) for item_id, hold_id in heads if hold_id is None])
+    cursor.executemany("UPDATE Item SET status = 'Unavailable' WHERE itemID = ?",
+                       [(item_id,) for item_id in ready])
+    return ready
+
+
+# Collects an item waiting on the hold shelf for `email` -> Its name, or None
+def _collect_hold(cursor, email, item_id):
+    cursor.execute("DELETE FROM ItemHolds WHERE itemID = ? AND email = ? AND readyAt IS NOT NULL",
+                   (item_id, email))
+    if cursor.rowcount == 0:
+        return None
+    cursor.execute("SELECT name FROM Item WHERE itemID = ?", (item_id,))
+    return cursor.fetchone()[0]
+
+
+# Borrows one item in a single transaction
+# -> The guarded UPDATE only succeeds while the item is still 'Available',
+#    so two desks can never lend out the same copy (or it is on the hold
+#    shelf for this member)
+def checkout(conn, email, item_id, borrow_date=None):
+    if borrow_date is None:
+        borrow_date = date.today().strftime("%Y-%m-%d")
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM Member WHERE email = ?", (email,))
+    if cursor.fetchone() is None:
+        raise MemberNotFound("No membership found with this email. Please create a membership first.")
+
+    with immediate_transaction(conn):
+        # Claim the item
+        cursor.execute("""
+            UPDATE Item SET status = 'Unavailable'
+            WHERE itemID = ? AND status = 'Available'
+            RETURNING name
+        """, (item_id,))
+        claimed = cursor.fetchone()
+        if claimed is None:
+            name = _collect_hold(cursor, email, item_id)
+            claimed = (name,) if name is not None else None
+
+        if claimed is None:
+            cursor.execute("SELECT 1 FROM Item WHERE itemID = ?", (item_id,))
+            if cursor.fetchone() is None:
+                raise ItemNotFound("Item not found.")
+            cursor.execute("SELECT 1 FROM ItemHolds WHERE itemID = ? AND readyAt IS NOT NULL", (item_id,))
+            if cursor.fetchone() is not None:
+                raise CheckoutConflict("The item is on the hold shelf for another member.")
+            raise CheckoutConflict("The item is currently unavailable for borrowing.")
+
+        # New borrow transaction (return date -> 1 month later, same as SetReturnDate)
+        cursor.execute("SELECT DATE(?, '+1 month')", (borrow_date,))
+        return_date = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO BorrowTransactions (borrowDate, returnDate, email, itemID) VALUES (?, ?, ?, ?)",
+                       (borrow_date, return_date, email, item_id))
+        borrow_id = cursor.lastrowid
+
+        cursor.execute("INSERT INTO Borrow (borrowID, email, itemID) VALUES (?, ?, ?)",
+                       (borrow_id, email, item_id))
+
+    return CheckoutReceipt(borrow_id, item_id, claimed[0], return_date)
+
+
+# Drops repeated IDs (keeps the first) -> (unique ids, results for the repeats)
+def _dedupe(item_ids):
+    seen = set()
+    unique = []
+    repeats = []
+    for item_id in item_ids:
+        if item_id in seen:
+            repeats.append(BatchResult(item_id, False, "Listed more than once."))
+        else:
+            seen.add(item_id)
+            unique.append(item_id)
+    return unique, repeats
+
+
+# Puts the report back in the order the IDs were given
+def _in_order(unique_ids, results, repeats):
+    by_id = {result.item_id: result for result in results}
+    return [by_id[item_id] for item_id in unique_ids] + repeats
+
+
+# Borrows many items for one member in a single transaction
+# -> Returns one BatchResult per item; items that can't be borrowed are skipped, not fatal
+def checkout_many(conn, email, item_ids, borrow_date=None):
+    if borrow_date is None:
+        borrow_date = date.today().strftime("%Y-%m-%d")
+    unique_ids, repeats = _dedupe(item_ids)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM Member WHERE email = ?", (email,))
+    if cursor.fetchone() is None:
+        raise MemberNotFound("No membership found with this email. Please create a membership first.")
+
+    results = []
+    with immediate_transaction(conn):
+        # Validate every item (and find holds waiting for this member) with one query
+        cursor.execute("""
+            SELECT ids.value, Item.itemID, Item.name, Item.status, h.holdID
+            FROM json_each(?) AS ids
+            LEFT JOIN Item ON Item.itemID = ids.value
+            LEFT JOIN ItemHolds h ON h.itemID = ids.value AND h.email = ? AND h.readyAt IS NOT NULL
+        """, (json.dumps(unique_ids), email))
+
+        borrowable = []
+        collected = []
+        for item_id, found_id, name, status, hold_id in cursor.fetchall():
+            if found_id is None:
+                results.append(BatchResult(item_id, False, "Item not found."))
+            elif hold_id is not None:
+                collected.append((hold_id,))
+                borrowable.append((item_id, name))
+            elif status != 'Available':
+                results.append(BatchResult(item_id, False, "The item is currently unavailable for borrowing."))
+            else:
+                borrowable.append((item_id, name))
+        cursor.executemany("DELETE FROM ItemHolds WHERE holdID = ?", collected)
+
+        if borrowable:
+            cursor.execute("SELECT DATE(?, '+1 month')", (borrow_date,))
+            return_date = cursor.fetchone()[0]
+
+            cursor.executemany("UPDATE Item SET status = 'Unavailable' WHERE itemID = ?",
+                               [(item_id,) for item_id, _ in borrowable])
+            # borrowIDs from AUTOINCREMENT, one insert each, as in checkout()
+            borrow_ids = []
+            for item_id, _ in borrowable:
+                cursor.execute("INSERT INTO BorrowTransactions (borrowDate, returnDate, email, itemID) VALUES (?, ?, ?, ?)",
+                               (borrow_date, return_date, email, item_id))
+                borrow_ids.append(cursor.lastrowid)
+            cursor.executemany("INSERT INTO Borrow (borrowID, email, itemID) VALUES (?, ?, ?)",
+                               [(borrow_id, email, item_id)
+                                for borrow_id, (item_id, _) in zip(borrow_ids, borrowable)])
+
+            for item_id, name in borrowable:
+                results.append(BatchResult(item_id, True, f"Borrowed '{name}', due back {return_date}."))
+
+    return _in_order(unique_ids, results, repeats)
+
+
+# Returns many items (e.g. a return bin) in a single transaction
+# -> Returns one BatchResult per item
+def checkin_many(conn, item_ids, return_date=None):
+    if return_date is None:
+        return_date = date.today().strftime("%Y-%m-%d")
+    unique_ids, repeats = _dedupe(item_ids)
+
+    cursor = conn.cursor()
+    results = []
+    with immediate_transaction(conn):
+        # Validate every item (and find its open loans) with one query
+        cursor.execute("""
+            SELECT ids.value, Item.itemID, Item.name, Borrow.borrowID
+            FROM json_each(?) AS ids
+            LEFT JOIN Item ON Item.itemID = ids.value
+            LEFT JOIN Borrow ON Borrow.itemID = ids.value
+        """, (json.dumps(unique_ids),))
+
+        names = {}
+        loans = []
+        for item_id, found_id, name, borrow_id in cursor.fetchall():
+            if found_id is None:
+                results.append(BatchResult(item_id, False, "Item not found."))
+            elif borrow_id is None:
+                results.append(BatchResult(item_id, False, "The item is not checked out."))
+            else:
+                names[item_id] = name
+                loans.append((item_id, borrow_id))
+
+        if loans:
+            # Back on the shelf, or to the next member in its hold queue
+            ready = release_items(cursor, names, return_date)
+            cursor.executemany("""
+                UPDATE BorrowTransactions SET status = 'Returned', returnDate = ?
+                WHERE borrowID = ?
+            """, [(return_date, borrow_id) for _, borrow_id in loans])
+            cursor.executemany("DELETE FROM Borrow WHERE borrowID = ? AND itemID = ?",
+                               [(borrow_id, item_id) for item_id, borrow_id in loans])
+
+            for item_id, name in names.items():
+                if item_id in ready:
+                    results.append(BatchResult(item_id, True, f"Returned '{name}'. On hold for {ready[item_id]}: "
+                                                              f"put it on the hold shelf."))
+                else:
+                    results.append(BatchResult(item_id, True, f"Returned '{name}'."))
+
+    return _in_order(unique_ids, results, repeats)
+
+
+# Reads item IDs, one per line (blank lines and # comments skipped)
+# -> (item ids, lines that weren't a number)
+def read_item_ids(lines):
+    item_ids = []
+    bad_lines = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            item_ids.append(int(line))
+        except ValueError:
+            bad_lines.append(line)
+    return item_ids, bad_lines
@@ -0,0 +1,300 @@
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from fines import FLAT_FINE
+from schema import ensure_schema, rebuild_analytics, rebuild_event_occupancy, rebuild_item_trigrams
+
+# Synthetic library data at benchmark scale
+#
+#   python datagen.py --scale 10k --out bench.db
+#   python datagen.py --scale 1m --out bench-1m.db --seed 7
+#   python datagen.py --items 50000 --loans 200000 --out custom.db
+#
+# Same seed + same --today -> byte-for-byte the same rows. The schema is taken
+# from library.db (a copy, emptied), so the output is exactly what the app runs on.
+#
+# Skew: a few titles, authors and members account for most of the activity
+# (rank = n * u^SKEW -> roughly Zipf-like), loans pile up in recent months, and
+# a small share of loans are late, open or fined.
+
+# Row counts per preset
+SCALES = {
+    "10k": dict(items=10_000, members=2_500, loans=30_000, events=500, attendances=20_000),
+    "1m": dict(items=1_000_000, members=200_000, loans=3_000_000, events=20_000, attendances=2_000_000),
+    "10m": dict(items=10_000_000, members=1_000_000, loans=30_000_000, events=100_000, attendances=20_000_000),
+}
+
+# Rows per executemany / transaction
+CHUNK_SIZE = 50_000
+
+# Higher -> more of the activity on the most popular rows
+SKEW = 2.0
+
+# How far back the loan and event history goes
+HISTORY_DAYS = 3 * 365
+
+# Share of returned loans that came back late (and were fined) / of those, paid since
+LATE_RETURN_RATE = 0.08
+PAID_RATE = 0.7
+
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Daniel", "Emma", "Farah", "George", "Hana", "Isaac", "Jia",
+               "Kofi", "Lena", "Mateo", "Nadia", "Omar", "Priya", "Quinn", "Rosa", "Samir", "Tara",
+               "Uma", "Victor", "Wen", "Xavier", "Yara", "Zoe"]
+LAST_NAMES = ["Smith", "Nguyen", "Garcia", "Chen", "Okafor", "Kowalski", "Singh", "Martin", "Haddad",
+              "Tanaka", "Rossi", "Dubois", "Ivanova", "Murphy", "Silva", "Kim", "Novak", "Jensen",
+              "Ahmed", "Walker", "Fischer", "Lopez", "Park", "Moreau", "Tolkien", "Austen"]
+TITLE_WORDS = ["Shadow", "River", "Garden", "Empire", "Silent", "Winter", "Secret", "Last", "Glass",
+               "Storm", "Northern", "Hidden", "Crown", "Ocean", "Night", "Iron", "Paper", "Golden",
+               "Forest", "Machine", "Memory", "City", "Letters", "Journey", "House", "Light", "Broken",
+               "Wild", "Distant", "Stone", "Sky", "Kingdom", "Map", "Fire", "Song", "Clock"]
+CATEGORIES = [("Book", 70), ("DVD", 8), ("Magazine", 7), ("Audiobook", 6), ("eBook", 6), ("CD", 3)]
+GENRES = ["Fiction", "Fantasy", "Mystery", "Science Fiction", "Romance", "History", "Biography",
+          "Children", "Thriller", "Poetry", "Science", "Self-Help", "Travel", "Cooking"]
+AUDIENCES = ["All Ages", "Children", "Teens", "Adults", "Teens and Adults", "Children and Families",
+             "Seniors", "Volunteers"]
+EVENT_KINDS = ["Book Club", "Storytime", "Author Talk", "Coding Workshop", "Film Screening",
+               "Craft Workshop", "Lecture", "Study Hall", "Chess Club", "Writing Circle"]
+EVENT_TIMES = ["09:00:00", "10:30:00", "12:00:00", "14:00:00", "16:00:00", "18:00:00", "19:00:00"]
+POSITIONS = [("Librarian", 20000), ("Assistant Librarian", 15000), ("Security", 25000), ("Cleaner", 18000)]
+ROOMS = 40
+
+# Tables emptied before loading, children first
+DATA_TABLES = ["Fines", "Borrow", "BorrowTransactions", "Attends", "EventWaitlist", "EventOccupancy", "Hold",
+               "Located", "Records", "Staff", "Volunteer", "Events", "Room", "Item", "Member", "SweepCheckpoint",
+               "ItemNeighbours", "EventNeighbours", "ItemBorrowers", "RecommendCheckpoint",
+               "LoanStats", "FineStats", "OverdueStats", "EventStats", "RoomStats", "AnalyticsDirty",
+               "ArchivedLoans", "ArchivedFines", "ArchivedAttends", "ArchivedItems", "ItemTrigrams",
+               "ItemHolds", "ChangeLog", "ChangeLogReaders"]
+
+
+# Rank 0..n-1, low ranks far more likely
+def skewed(rng, n):
+    return min(n - 1, int(n * rng.random() ** SKEW))
+
+
+# Spreads popular ranks over the id range (a stride coprime with n is a permutation)
+def scatter(rank, n, first_id):
+    stride = 7_919
+    while n % stride == 0:
+        stride += 2
+    return first_id + (rank * stride) % n
+
+
+def email_for(number):
+    return f"member{number}@example.com"
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def members(rng, n, today):
+    for number in range(n):
+        birthday = today - timedelta(days=rng.randint(8 * 365, 85 * 365))
+        yield (email_for(number), f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", birthday.isoformat())
+
+
+def items(rng, n, first_id):
+    # Authors also follow a popularity curve -> A few write many titles
+    authors = max(1, n // 8)
+    categories = [name for name, weight in CATEGORIES for _ in range(weight)]
+    for offset in range(n):
+        words = rng.sample(TITLE_WORDS, rng.randint(2, 4))
+        title = "The " + " ".join(words) if rng.random() < 0.3 else " ".join(words)
+        author_rank = skewed(rng, authors)
+        author = f"{FIRST_NAMES[author_rank % len(FIRST_NAMES)]} {LAST_NAMES[(author_rank // len(FIRST_NAMES)) % len(LAST_NAMES)]}"
+        if author_rank >= len(FIRST_NAMES) * len(LAST_NAMES):
+            author += f" {author_rank // (len(FIRST_NAMES) * len(LAST_NAMES))}"
+        yield (first_id + offset, title, author, rng.choice(categories), rng.choice(GENRES), 'Available')
+
+
+# Loans in date order, oldest first -> (loan row, open loan row or None, fine row or None)
+def loans(rng, counts, today, first_item):
+    open_items = set()
+    start = today - timedelta(days=HISTORY_DAYS)
+    n = counts["loans"]
+
+    for borrow_id in range(1, n + 1):
+        borrow_date = start + timedelta(days=HISTORY_DAYS * (borrow_id - 1) // n)
+        return_date = (borrow_date + timedelta(days=30)).isoformat()
+        email = email_for(scatter(skewed(rng, counts["members"]), counts["members"], 0))
+        item_id = scatter(skewed(rng, counts["items"]), counts["items"], first_item)
+        age = (today - borrow_date).days
+
+        # Recent loans are mostly still out; a few older ones never came back (overdue)
+        still_out = (age <= 30 and rng.random() < 0.9) or (30 < age <= 120 and rng.random() < 0.05)
+        if still_out and item_id not in open_items:
+            open_items.add(item_id)
+            loan = (borrow_id, borrow_date.isoformat(), return_date, 'Borrowed', email, item_id)
+            fine = (borrow_id, 'Unpaid', FLAT_FINE, FLAT_FINE) if return_date < today.isoformat() else None
+            yield loan, (borrow_id, email, item_id), fine
+            continue
+
+        loan = (borrow_id, borrow_date.isoformat(), return_date, 'Returned', email, item_id)
+        fine = None
+        if rng.random() < LATE_RETURN_RATE:
+            fine = (borrow_id, 'Paid', 0, FLAT_FINE) if rng.random() < PAID_RATE \
+                else (borrow_id, 'Unpaid', FLAT_FINE, FLAT_FINE)
+        yield loan, None, fine
+
+
+def events(rng, n, today, first_id):
+    span = HISTORY_DAYS + 180
+    start = today - timedelta(days=HISTORY_DAYS)
+    for offset in range(n):
+        when = start + timedelta(days=span * offset // n)
+        yield (first_id + offset, f"{rng.choice(EVENT_KINDS)} #{offset + 1}", rng.choice(EVENT_TIMES),
+               when.isoformat(), rng.choice(AUDIENCES))
+
+
+def attendances(rng, counts, first_event):
+    for _ in range(counts["attendances"]):
+        yield (email_for(scatter(skewed(rng, counts["members"]), counts["members"], 0)),
+               scatter(skewed(rng, counts["events"]), counts["events"], first_event))
+
+
+# Empty copy of `template` at `out`, migrated, with triggers and indexes set aside
+# -> [(name, sql)] to put back once the data is in
+def prepare(template, out):
+    out = Path(out)
+    if out.exists():
+        out.unlink()
+    shutil.copyfile(template, out)
+
+    conn = sqlite3.connect(out)
+    ensure_schema(conn)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    deferred = conn.execute("""
+        SELECT name, sql FROM sqlite_master
+        WHERE type IN ('trigger', 'index') AND sql IS NOT NULL
+        ORDER BY type DESC
+    """).fetchall()
+    for name, sql in deferred:
+        kind = "TRIGGER" if sql.lstrip().upper().startswith("CREATE TRIGGER") else "INDEX"
+        conn.execute(f"DROP {kind} {name}")
+    for table in DATA_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("INSERT INTO ItemSearch (ItemSearch) VALUES ('delete-all')")
+    conn.execute("DELETE FROM sqlite_sequence")
+    conn.commit()
+    return conn, deferred
+
+
+def load(conn, table, columns, rows, verb="INSERT"):
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    total = 0
+    for chunk in chunked(rows):
+        conn.executemany(sql, chunk)
+        conn.commit()
+        total += len(chunk)
+    return total
+
+
+def generate(out, counts, seed=42, today=None, template="library.db", progress=print):
+    today = today or date.today()
+    rng = random.Random(seed)
+    first_item, first_event = 1, 1
+    started = time.perf_counter()
+
+    conn, deferred = prepare(template, out)
+
+    def step(label, count):
+        progress(f"⏳ {label}: {count} rows ({time.perf_counter() - started:.1f}s)")
+
+    step("Member", load(conn, "Member", ["email", "name", "birthday"], members(rng, counts["members"], today)))
+    step("Item", load(conn, "Item", ["itemID", "name", "author", "category", "genre", "status"],
+                      items(rng, counts["items"], first_item)))
+
+    # Loans, open loans and fines come out of one pass over the history
+    loaded = 0
+    for chunk in chunked(loans(rng, counts, today, first_item)):
+        conn.executemany("""
+            INSERT INTO BorrowTransactions (borrowID, borrowDate, returnDate, status, email, itemID)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [loan for loan, _, _ in chunk])
+        conn.executemany("INSERT INTO Borrow (borrowID, email, itemID) VALUES (?, ?, ?)",
+                         [borrow for _, borrow, _ in chunk if borrow])
+        conn.executemany("INSERT INTO Fines (borrowID, status, amount, assessed) VALUES (?, ?, ?, ?)",
+                         [fine for _, _, fine in chunk if fine])
+        conn.commit()
+        loaded += len(chunk)
+    step("BorrowTransactions", loaded)
+
+    conn.execute("UPDATE Item SET status = 'Unavailable' WHERE itemID IN (SELECT itemID FROM Borrow)")
+    conn.execute("INSERT INTO Records (itemID, status, lastUpdated) SELECT itemID, 'In System', ? FROM Item",
+                 (today.isoformat(),))
+    conn.commit()
+
+    load(conn, "Room", ["roomNum", "maxCap"], ((room, rng.choice([20, 30, 50, 100, 200])) for room in range(1, ROOMS + 1)))
+    step("Events", load(conn, "Events", ["eventID", "name", "scheduledTime", "scheduledDate", "targetAudience"],
+                        events(rng, counts["events"], today, first_event)))
+    load(conn, "Located", ["eventID", "roomNum"],
+         ((first_event + offset, rng.randint(1, ROOMS)) for offset in range(counts["events"])))
+    step("Attends", load(conn, "Attends", ["email", "eventID"], attendances(rng, counts, first_event),
+                         verb="INSERT OR IGNORE"))
+
+    # Staff and volunteers: disjoint slices of the member list
+    staff = max(1, counts["members"] // 500)
+    load(conn, "Staff", ["email", "position", "wage", "employmentDate", "employmentStatus"],
+         ((email_for(number), *rng.choice(POSITIONS), (today - timedelta(days=rng.randint(0, HISTORY_DAYS))).isoformat(),
+           'Working' if rng.random() < 0.9 else 'Resigned') for number in range(staff)))
+    load(conn, "Volunteer", ["email", "employmentDate"],
+         ((email_for(number), (today - timedelta(days=rng.randint(0, HISTORY_DAYS))).isoformat())
+          for number in range(staff, staff + max(1, counts["members"] // 200))))
+
+    # Indexes and triggers back, search indexes, seat counts and report summaries rebuilt in one go
+    for name, sql in deferred:
+        conn.execute(sql)
+    conn.execute("INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild')")
+    rebuild_item_trigrams(conn.cursor())
+    rebuild_event_occupancy(conn.cursor())
+    rebuild_analytics(conn.cursor())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+    step("Indexes, triggers and search index", len(deferred))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic library database")
+    parser.add_argument("--scale", choices=SCALES, default="10k", help="preset row counts (default: 10k)")
+    for name in SCALES["10k"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the number of {name}")
+    parser.add_argument("--out", default="bench.db", help="database to create (replaced if it exists)")
+    parser.add_argument("--template", default="library.db", help="database to take the schema from")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", type=date.fromisoformat, help="date the data is generated around (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    counts = dict(SCALES[args.scale])
+    for name in counts:
+        if getattr(args, name) is not None:
+            counts[name] = getattr(args, name)
+
+    if Path(args.out).resolve() == Path(args.template).resolve():
+        parser.error("--out must not be the template database")
+
+    started = time.perf_counter()
+    generate(args.out, counts, args.seed, args.today, args.template)
+    print(f"✅ Wrote {args.out} in {time.perf_counter() - started:.1f}s "
+          f"({', '.join(f'{count} {name}' for name, count in counts.items())})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from records import Event
+
+# Event listings without reading the whole Events table
+#
+# Past/upcoming and date ranges are filtered in SQL on the EventsSchedule index
+# (scheduledDate, scheduledTime[, eventID]) and paged with keyset cursors: a page
+# starts after the (date, time, eventID) key of the last event shown, so page
+# 100 costs the same as page 1.
+#
+# EventCalendar keeps the upcoming events in memory. Each refresh only reads
+# events added since the last one (eventID > highest seen) and drops the ones
+# that have passed -> Listing upcoming events costs the same on day one and in
+# year ten, however much history piles up.
+
+# Events per page
+PAGE_SIZE = 10
+
+# Full reload at least this often (s) -> Picks up edited or deleted events
+FULL_RELOAD_SECONDS = 300
+
+
+# Sort / keyset key of an event -> (date, time, eventID)
+def event_key(event):
+    return (event.scheduled_date or "", event.scheduled_time or "", event.event_id)
+
+
+# Upcoming events (on or after `today`) in date order, starting after key `after`
+def upcoming_events(conn, today, limit=PAGE_SIZE, after=None):
+    after = after or (today, "", 0)
+    rows = conn.execute("""
+        SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+        FROM Events
+        WHERE scheduledDate >= ? AND (scheduledDate, scheduledTime, eventID) > (?, ?, ?)
+        ORDER BY scheduledDate, scheduledTime, eventID
+        LIMIT ?
+    """, (today, *after, limit)).fetchall()
+    return [Event(*row) for row in rows]
+
+
+# Past events (before `today`), most recent first, starting before key `before`
+def past_events(conn, today, limit=PAGE_SIZE, before=None):
+    before = before or (today, "", 0)
+    rows = conn.execute("""
+        SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+        FROM Events
+        WHERE scheduledDate < ? AND (scheduledDate, scheduledTime, eventID) < (?, ?, ?)
+        ORDER BY scheduledDate DESC, scheduledTime DESC, eventID DESC
+        LIMIT ?
+    """, (today, *before, limit)).fetchall()
+    return [Event(*row) for row in rows]
+
+
+# Events from `start` to `end` (inclusive dates) in date order, starting after key `after`
+def events_between(conn, start, end, limit=PAGE_SIZE, after=None):
+    after = after or (start, "", 0)
+    rows = conn.execute("""
+        SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+        FROM Events
+        WHERE scheduledDate BETWEEN ? AND ? AND (scheduledDate, scheduledTime, eventID) > (?, ?, ?)
+        ORDER BY scheduledDate, scheduledTime, eventID
+        LIMIT ?
+    """, (start, end, *after, limit)).fetchall()
+    return [Event(*row) for row in rows]
+
+
+# In-memory list of upcoming events, kept current incrementally.
+# Safe to share between threads (the server shares one).
+class EventCalendar:
+    def __init__(self, full_reload_seconds=FULL_RELOAD_SECONDS, clock=time.monotonic):
+        self.full_reload_seconds = full_reload_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._events = []
+        self._keys = []
+        self._today = None
+        self._last_id = None
+        self._loaded_at = None
+        self.full_loads = self.incremental_loads = 0
+
+    # Brings the calendar up to date for `today`
+    def refresh(self, conn, today):
+        with self._lock:
+            stale = (self._last_id is None or today < self._today
+                     or self._clock() - self._loaded_at >= self.full_reload_seconds)
+            if stale:
+                self._load_all(conn, today)
+            else:
+                self._load_new(conn, today)
+            self._today = today
+
+    def _load_all(self, conn, today):
+        # Highest id first -> An event added while we read is picked up next time
+        last_id = conn.execute("SELECT MAX(eventID) FROM Events").fetchone()[0] or 0
+        rows = conn.execute("""
+            SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+            FROM Events
+            WHERE scheduledDate >= ? AND eventID <= ?
+            ORDER BY scheduledDate, scheduledTime, eventID
+        """, (today, last_id)).fetchall()
+        self._events = [Event(*row) for row in rows]
+        self._keys = [event_key(event) for event in self._events]
+        self._last_id = last_id
+        self._loaded_at = self._clock()
+        self.full_loads += 1
+
+    def _load_new(self, conn, today):
+        rows = conn.execute("""
+            SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+            FROM Events
+            WHERE eventID > ?
+            ORDER BY eventID
+        """, (self._last_id,)).fetchall()
+        for row in rows:
+            event = Event(*row)
+            if (event.scheduled_date or "") >= today:
+                key = event_key(event)
+                position = bisect_left(self._keys, key)
+                self._keys.insert(position, key)
+                self._events.insert(position, event)
+        if rows:
+            self._last_id = rows[-1][0]
+
+        # Events that have passed since the last refresh
+        passed = bisect_left(self._keys, (today,))
+        del self._keys[:passed]
+        del self._events[:passed]
+        self.incremental_loads += 1
+
+    # Up to `limit` upcoming events after key `after` (call refresh() first)
+    def page(self, limit=PAGE_SIZE, after=None):
+        with self._lock:
+            start = bisect_right(self._keys, after) if after else 0
+            return self._events[start:start + limit]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._events)
+
+    # Forces a full reload on the next refresh (e.g. after editing an event)
+    def invalidate(self):
+        with self._lock:
+            self._last_id = None
@@ -0,0 +1,244 @@
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from records import FineLine, FineSummary, LibraryError, Payment, Record
+from schema import ensure_schema
+from transactions import immediate_transaction
+
+# Fines: member balances, payments and the nightly overdue sweep
+#
+#   python fines.py sweep                          # flat $10 per overdue loan
+#   python fines.py sweep --per-day 0.50 --cap 20  # $0.50 a day, at most $20
+
+# What the old AddFineForOverdue* triggers charged
+FLAT_FINE = 10.00
+
+# Loans handled per transaction -> Keeps each write lock short so the desk isn't blocked
+SWEEP_CHUNK_SIZE = 1000
+
+SWEEP_JOB = 'overdue_sweep'
+
+# Payment that can't be applied (nothing owed, zero, or more than owed)
+class PaymentError(LibraryError):
+    pass
+
+
+# Summary of a sweep run
+class SweepReport(Record):
+    __slots__ = ("run_date", "scanned", "fined", "chunks", "seconds", "resumed")
+
+
+# Fine for a loan that is `days_overdue` days late
+def fine_amount(days_overdue, per_day=None, cap=None):
+    if per_day is None:
+        amount = FLAT_FINE
+    else:
+        amount = days_overdue * per_day
+    if cap is not None:
+        amount = min(amount, cap)
+    return round(amount, 2)
+
+
+# Outstanding fines for a member, read through the loan history (BorrowTransactions),
+# so fines on returned items still count -> One query however long the history is.
+# Loans with unpaid fines are never archived; the item may have been retired
+# since, hence ItemHistory for its name.
+def fine_summary(conn, email):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT F.borrowID, T.itemID, (SELECT name FROM ItemHistory WHERE itemID = T.itemID),
+               T.returnDate, T.status, F.amount
+        FROM BorrowTransactions T
+        JOIN Fines F ON F.borrowID = T.borrowID
+        WHERE T.email = ? AND F.status = 'Unpaid' AND F.amount > 0
+        ORDER BY F.borrowID
+    """, (email,))
+    loans = [FineLine(*row) for row in cursor.fetchall()]
+    return FineSummary(email, round(sum(line.amount for line in loans), 2), loans)
+
+
+# Pays `amount` off a member's fines, oldest first, in one transaction.
+# A running total in cents (window function) decides in SQL how much of each
+# fine is covered -> One UPDATE however many fines there are.
+def pay_fines(conn, email, amount):
+    amount = round(amount, 2)
+    if amount <= 0:
+        raise PaymentError("Amount must be greater than zero.")
+
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("""
+            SELECT COALESCE(SUM(F.amount), 0)
+            FROM BorrowTransactions T
+            JOIN Fines F ON F.borrowID = T.borrowID
+            WHERE T.email = ? AND F.status = 'Unpaid'
+        """, (email,))
+        owed = round(cursor.fetchone()[0], 2)
+
+        if owed == 0:
+            raise PaymentError("No fines to pay!")
+        if amount > owed:
+            raise PaymentError("You cannot overpay. Enter a valid amount.")
+
+        # Compared in whole cents: in floats 0.10 + 0.20 is just over 0.30,
+        # and paying 0.30 would leave a fine of 0.00 still Unpaid
+        cursor.execute("""
+            UPDATE Fines
+            SET amount = CASE WHEN owing.running <= :paid THEN 0
+                              ELSE (owing.running - :paid) / 100.0 END,
+                status = CASE WHEN owing.running <= :paid THEN 'Paid' ELSE 'Unpaid' END
+            FROM (
+                SELECT F.borrowID,
+                       CAST(ROUND(F.amount * 100) AS INTEGER) AS cents,
+                       SUM(CAST(ROUND(F.amount * 100) AS INTEGER)) OVER (ORDER BY F.borrowID) AS running
+                FROM BorrowTransactions T
+                JOIN Fines F ON F.borrowID = T.borrowID
+                WHERE T.email = :email AND F.status = 'Unpaid'
+            ) AS owing
+            WHERE Fines.borrowID = owing.borrowID
+              AND owing.running - owing.cents < :paid
+            RETURNING Fines.status
+        """, {"email": email, "paid": round(amount * 100)})
+        cleared = sum(1 for (status,) in cursor.fetchall() if status == 'Paid')
+
+    return Payment(email, amount, round(owed - amount, 2), cleared)
+
+
+# Insert a new fine, or raise an existing one to the newly assessed total.
+# Only the increase is added to what is owed, so earlier payments still count.
+UPSERT_FINE = """
+    INSERT INTO Fines (borrowID, status, amount, assessed)
+    VALUES (?, 'Unpaid', ?, ?)
+    ON CONFLICT (borrowID) DO UPDATE SET
+        amount = Fines.amount + excluded.assessed - COALESCE(Fines.assessed, Fines.amount),
+        assessed = excluded.assessed,
+        status = 'Unpaid'
+    WHERE excluded.assessed > COALESCE(Fines.assessed, Fines.amount)
+"""
+
+
+# Where to start today's run -> (after_return_date, after_borrow_id, resumed)
+def _start_point(cursor, job, run_date, restart):
+    cursor.execute("SELECT runDate, lastReturnDate, lastBorrowID, finished FROM SweepCheckpoint WHERE job = ?",
+                   (job,))
+    checkpoint = cursor.fetchone()
+
+    if checkpoint and not restart and checkpoint[0] == run_date:
+        if checkpoint[3]:
+            return None
+        if checkpoint[1] is not None:
+            return checkpoint[1], checkpoint[2], True
+
+    cursor.execute("""
+        INSERT INTO SweepCheckpoint (job, runDate, lastReturnDate, lastBorrowID, finished)
+        VALUES (?, ?, NULL, NULL, 0)
+        ON CONFLICT (job) DO UPDATE SET
+            runDate = excluded.runDate, lastReturnDate = NULL, lastBorrowID = NULL, finished = 0
+    """, (job, run_date))
+    cursor.connection.commit()
+    return '', 0, False
+
+
+# Fines every loan that is still 'Borrowed' after its return date.
+# Walks the open-loan index in (returnDate, borrowID) order, one chunk per
+# transaction, saving a checkpoint with each chunk -> A killed run carries on
+# where it stopped when started again the same day (restart=True starts over).
+# progress(done, total) is called after each chunk.
+def sweep_overdue(conn, run_date=None, per_day=None, cap=None, chunk_size=SWEEP_CHUNK_SIZE,
+                  progress=None, restart=False, job=SWEEP_JOB):
+    if run_date is None:
+        run_date = date.today().strftime("%Y-%m-%d")
+    today = date.fromisoformat(run_date)
+    started = time.perf_counter()
+
+    cursor = conn.cursor()
+    start = _start_point(cursor, job, run_date, restart)
+    if start is None:
+        return SweepReport(run_date, 0, 0, 0, 0.0, True)
+    after_date, after_id, resumed = start
+
+    cursor.execute("""
+        SELECT COUNT(*) FROM BorrowTransactions
+        WHERE status = 'Borrowed' AND returnDate < ? AND (returnDate, borrowID) > (?, ?)
+    """, (run_date, after_date, after_id))
+    total = cursor.fetchone()[0]
+
+    scanned = fined = chunks = 0
+    while True:
+        with immediate_transaction(conn):
+            # Next chunk of overdue loans (range scan on BorrowTransactionsOverdue)
+            cursor.execute("""
+                SELECT borrowID, returnDate FROM BorrowTransactions
+                WHERE status = 'Borrowed' AND returnDate < ? AND (returnDate, borrowID) > (?, ?)
+                ORDER BY returnDate, borrowID
+                LIMIT ?
+            """, (run_date, after_date, after_id, chunk_size))
+            loans = cursor.fetchall()
+
+            if loans:
+                fines = []
+                for borrow_id, return_date in loans:
+                    days_overdue = (today - date.fromisoformat(return_date)).days
+                    amount = fine_amount(days_overdue, per_day, cap)
+                    fines.append((borrow_id, amount, amount))
+                cursor.executemany(UPSERT_FINE, fines)
+                fined += cursor.rowcount
+                after_id, after_date = loans[-1]
+
+            cursor.execute("""
+                UPDATE SweepCheckpoint SET lastReturnDate = ?, lastBorrowID = ?, finished = ?
+                WHERE job = ?
+            """, (after_date, after_id, int(len(loans) < chunk_size), job))
+
+        scanned += len(loans)
+        chunks += 1
+        if progress:
+            progress(scanned, total)
+        if len(loans) < chunk_size:
+            break
+
+    return SweepReport(run_date, scanned, fined, chunks, time.perf_counter() - started, resumed)
+
+
+# Prints sweep progress on one line
+def print_progress(done, total):
+    percent = 100 * done / total if total else 100
+    print(f"\r⏳ {done}/{total} overdue loans checked ({percent:.0f}%)", end="", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library fines maintenance")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sweep = commands.add_parser("sweep", help="fine every overdue loan")
+    sweep.add_argument("--date", help="run as if today were DATE (YYYY-MM-DD)")
+    sweep.add_argument("--per-day", type=float, help="charge this much per day overdue instead of a flat fine")
+    sweep.add_argument("--cap", type=float, help="largest fine for a single loan")
+    sweep.add_argument("--chunk-size", type=int, default=SWEEP_CHUNK_SIZE, help="loans per transaction")
+    sweep.add_argument("--restart", action="store_true", help="ignore today's checkpoint and start over")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    if args.command == "sweep":
+        report = sweep_overdue(conn, args.date, args.per_day, args.cap, args.chunk_size,
+                               progress=print_progress, restart=args.restart)
+        print()
+        if report.resumed and report.scanned == 0:
+            print(f"✅ Sweep for {report.run_date} already finished.")
+        else:
+            resumed = " (resumed)" if report.resumed else ""
+            print(f"✅ Sweep for {report.run_date}{resumed}: {report.scanned} overdue loans, "
+                  f"{report.fined} fines added or raised, {report.chunks} chunks in {report.seconds:.2f}s.")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import argparse
+import sqlite3
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from circulation import ItemNotFound, release_items
+from records import Hold, LibraryError, MemberNotFound, Record
+from schema import ensure_schema
+from transactions import immediate_transaction
+
+# Holds: a place in the queue for an item that is out
+#
+#   python holds.py expire                 # nightly: lapse holds nobody collected
+#   python holds.py queue 4012             # who is waiting for an item
+#
+# Members join an item's queue (ItemHolds, schema.py) instead of checking back
+# at the desk until it turns up. Returning the item hands it to the head of
+# the queue in the same transaction (circulation.release_items): the hold is
+# ready for PICKUP_DAYS, the member sees it in their holds, and only they can
+# borrow it. A ready hold that isn't collected in time lapses in the nightly
+# expire run and the item goes to the next member, or back on the shelf.
+
+# Ready holds lapsed per transaction
+EXPIRE_CHUNK_SIZE = 500
+
+
+class HoldError(LibraryError):
+    pass
+
+
+class HoldNotFound(HoldError):
+    pass
+
+
+# Summary of an expire run
+class ExpireReport(Record):
+    __slots__ = ("run_date", "expired", "promoted", "chunks", "seconds")
+
+
+def _today():
+    return date.today().strftime("%Y-%m-%d")
+
+
+# Place of a hold in its item's queue (1 = next in)
+def _position(cursor, item_id, email):
+    cursor.execute("""
+        SELECT COUNT(*) FROM ItemHolds
+        WHERE itemID = ?
+          AND holdID <= (SELECT holdID FROM ItemHolds WHERE itemID = ? AND email = ?)
+    """, (item_id, item_id, email))
+    return cursor.fetchone()[0]
+
+
+# Joins the queue for an item that is out -> Hold
+def place_hold(conn, email, item_id, today=None):
+    today = today or _today()
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM Member WHERE email = ?", (email,))
+    if cursor.fetchone() is None:
+        raise MemberNotFound("No membership found with this email. Please create a membership first.")
+
+    with immediate_transaction(conn):
+        cursor.execute("SELECT name, status FROM Item WHERE itemID = ?", (item_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ItemNotFound("Item not found.")
+        name, status = row
+
+        cursor.execute("SELECT 1 FROM Records WHERE itemID = ? AND status = 'Archived'", (item_id,))
+        if cursor.fetchone() is not None:
+            raise HoldError(f"'{name}' has been taken out of circulation.")
+        if status == 'Available':
+            raise HoldError(f"'{name}' is on the shelf. Borrow it instead.")
+        cursor.execute("SELECT 1 FROM Borrow WHERE itemID = ? AND email = ?", (item_id, email))
+        if cursor.fetchone() is not None:
+            raise HoldError(f"You already have '{name}'.")
+
+        try:
+            cursor.execute("INSERT INTO ItemHolds (itemID, email, placedAt) VALUES (?, ?, ?)",
+                           (item_id, email, today))
+        except sqlite3.IntegrityError:
+            raise HoldError(f"You already have a hold on '{name}'.")
+        position = _position(cursor, item_id, email)
+
+    return Hold(item_id, name, email, 'Waiting', position, None)
+
+
+# Leaves the queue. A ready hold passes the item on in the same transaction
+# -> Email of the member it went to, if any
+def cancel_hold(conn, email, item_id, today=None):
+    today = today or _today()
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("DELETE FROM ItemHolds WHERE itemID = ? AND email = ? RETURNING readyAt",
+                       (item_id, email))
+        row = cursor.fetchone()
+        if row is None:
+            raise HoldNotFound("You have no hold on this item.")
+        if row[0] is None:
+            return None
+        return release_items(cursor, [item_id], today).get(item_id)
+
+
+# A member's holds, ready ones first
+def member_holds(conn, email):
+    rows = conn.execute("""
+        SELECT h.itemID, Item.name, h.email,
+               CASE WHEN h.readyAt IS NULL THEN 'Waiting' ELSE 'Ready' END,
+               (SELECT COUNT(*) FROM ItemHolds q WHERE q.itemID = h.itemID AND q.holdID <= h.holdID),
+               h.expiresAt
+        FROM ItemHolds h
+        JOIN Item ON Item.itemID = h.itemID
+        WHERE h.email = ?
+        ORDER BY h.readyAt IS NULL, h.holdID
+    """, (email,)).fetchall()
+    return [Hold(*row) for row in rows]
+
+
+# Queue for one item, in order
+def item_queue(conn, item_id):
+    rows = conn.execute("""
+        SELECT h.itemID, Item.name, h.email,
+               CASE WHEN h.readyAt IS NULL THEN 'Waiting' ELSE 'Ready' END,
+               ROW_NUMBER() OVER (ORDER BY h.holdID),
+               h.expiresAt
+        FROM ItemHolds h
+        JOIN Item ON Item.itemID = h.itemID
+        WHERE h.itemID = ?
+        ORDER BY h.holdID
+    """, (item_id,)).fetchall()
+    return [Hold(*row) for row in rows]
+
+
+# Lapses ready holds whose pickup deadline has passed, EXPIRE_CHUNK_SIZE per
+# transaction (range scan on ItemHoldsExpiry); each item goes to the next hold
+# or back on the shelf. Holds that become ready get a deadline after run_date
+# -> Not picked up again by the same run.
+# progress(expired so far) is called after each chunk.
+def expire_holds(conn, run_date=None, chunk_size=EXPIRE_CHUNK_SIZE, progress=None):
+    run_date = run_date or _today()
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    expired = promoted = chunks = 0
+
+    while True:
+        with immediate_transaction(conn):
+            cursor.execute("""
+                DELETE FROM ItemHolds
+                WHERE holdID IN (SELECT holdID FROM ItemHolds
+                                 WHERE readyAt IS NOT NULL AND expiresAt < ?
+                                 ORDER BY expiresAt
+                                 LIMIT ?)
+                RETURNING itemID
+            """, (run_date, chunk_size))
+            item_ids = [item_id for (item_id,) in cursor.fetchall()]
+            if item_ids:
+                promoted += len(release_items(cursor, item_ids, run_date))
+        expired += len(item_ids)
+        chunks += 1
+
+        if progress:
+            progress(expired)
+        if len(item_ids) < chunk_size:
+            return ExpireReport(run_date, expired, promoted, chunks, time.perf_counter() - started)
+
+
+def print_progress(expired):
+    print(f"\r⏳ {expired} holds expired", end="", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Item holds maintenance")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    expire = commands.add_parser("expire", help="lapse ready holds nobody collected")
+    expire.add_argument("--date", help="run as if today were DATE (YYYY-MM-DD)")
+    expire.add_argument("--chunk-size", type=int, default=EXPIRE_CHUNK_SIZE, help="holds per transaction")
+
+    queue = commands.add_parser("queue", help="members waiting for an item")
+    queue.add_argument("item_id", type=int)
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    if args.command == "expire":
+        report = expire_holds(conn, args.date, args.chunk_size, print_progress)
+        print()
+        print(f"✅ Holds for {report.run_date}: {report.expired} expired, {report.promoted} passed on "
+              f"to the next member, {report.chunks} chunks in {report.seconds:.2f}s.")
+
+    elif args.command == "queue":
+        holds = item_queue(conn, args.item_id)
+        if not holds:
+            print(f"❌ No holds on item {args.item_id}.")
+        for hold in holds:
+            ready = f"ready until {hold.expires_at}" if hold.status == 'Ready' else "waiting"
+            print(f"  {hold.position:>3}. {hold.email:<40} {ready}")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from records import Record
+
+perf_counter = time.perf_counter
+
+# Per-statement timing for the sqlite3 connection
+#
+#   conn = open_library(instrument=True)       # or sqlite3.connect(path, factory=InstrumentedConnection)
+#   with workflow("borrow_item"):
+#       service.borrow(email, item_id)
+#   print(format_report(conn.stats))
+#
+# Every statement is timed from execute() until its last row is fetched (or its
+# cursor is reused / dropped) and filed under the workflow that ran it. Slow
+# statements are kept with their EXPLAIN QUERY PLAN.
+#
+# The timing is all that happens per statement: it is queued as a tuple and
+# the queue is added up (statement text normalized, histogram, per-statement
+# totals) every FOLD_EVERY statements or when the stats are read. No progress
+# handler or trace callback -> SQLite runs the statement exactly as it would
+# on a plain connection.
+#
+# A plain sqlite3.connect() connection is not touched -> No cost when it's off.
+
+# Statements slower than this go to the slow-query log (ms)
+SLOW_MS = 50.0
+
+# Slow-query entries kept (oldest dropped first)
+SLOW_LOG_SIZE = 100
+
+# Timings queued before they are added up
+FOLD_EVERY = 1000
+
+# Histogram bucket upper bounds (ms); the last bucket is everything slower
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+# Workflow the current statements belong to (e.g. 'borrow_item')
+current_workflow = ContextVar("current_workflow", default=None)
+
+
+# Tags every statement run inside the block with `name`
+@contextmanager
+def workflow(name):
+    token = current_workflow.set(name)
+    try:
+        yield
+    finally:
+        current_workflow.reset(token)
+
+
+# Collapses whitespace so the same statement always maps to one entry
+def normalize(sql):
+    return " ".join(sql.split())
+
+
+# Normalized text of statements seen so far (the app runs a small, fixed set)
+_normalized = {}
+NORMALIZED_CACHE_SIZE = 10_000
+
+
+def normalize_cached(sql):
+    normalized = normalize(sql)
+    if len(_normalized) < NORMALIZED_CACHE_SIZE:
+        _normalized[sql] = normalized
+    return normalized
+
+
+class StatementStats(Record):
+    __slots__ = ("workflow", "sql", "calls", "seconds", "max_seconds", "rows")
+
+
+class SlowQuery(Record):
+    __slots__ = ("at", "workflow", "sql", "params", "ms", "rows", "plan")
+
+
+# Everything recorded for one connection (or shared between several)
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_MS):
+        self.slow_ms = slow_ms
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._statements = {}
+        self._histogram = [0] * (len(BUCKETS_MS) + 1)
+        # (workflow, sql, seconds, rows) not added up yet; deque -> Appends from
+        # several threads need no lock
+        self._timings = deque()
+        self._lock = threading.Lock()
+
+    def record(self, workflow, sql, seconds, rows):
+        self._timings.append((workflow, sql, seconds, rows))
+        if len(self._timings) >= FOLD_EVERY:
+            self._fold()
+
+    # Adds the queued timings to the totals
+    def _fold(self):
+        with self._lock:
+            for _ in range(len(self._timings)):
+                workflow, sql, seconds, rows = self._timings.popleft()
+                sql = _normalized.get(sql) or normalize_cached(sql)
+                entry = self._statements.get((workflow, sql))
+                if entry is None:
+                    entry = self._statements[(workflow, sql)] = StatementStats(workflow, sql, 0, 0.0, 0.0, 0)
+                entry.calls += 1
+                entry.seconds += seconds
+                entry.max_seconds = max(entry.max_seconds, seconds)
+                entry.rows += rows
+                self._histogram[bisect_right(BUCKETS_MS, seconds * 1000)] += 1
+
+    # {(workflow, normalized sql): StatementStats}
+    @property
+    def statements(self):
+        self._fold()
+        return self._statements
+
+    # Statement count per BUCKETS_MS bucket
+    @property
+    def histogram(self):
+        self._fold()
+        return self._histogram
+
+    def record_slow(self, entry):
+        with self._lock:
+            self.slow.append(entry)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._statements.clear()
+            self._histogram = [0] * (len(BUCKETS_MS) + 1)
+            self.slow.clear()
+
+
+# The base class methods, called directly -> No super() lookup per statement
+_execute = sqlite3.Cursor.execute
+_fetchone = sqlite3.Cursor.fetchone
+_fetchall = sqlite3.Cursor.fetchall
+_cursor = sqlite3.Connection.cursor
+
+
+# Cursor that reports each statement to its connection's QueryStats.
+# Kept lean: this runs around every statement, most of which take microseconds.
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None
+    _seconds = 0.0
+    _rows = 0
+
+    def execute(self, sql, parameters=()):
+        if self._pending is not None:
+            self._finish()
+        self._pending = (current_workflow.get(), sql, parameters)
+        self._rows = 0
+        started = perf_counter()
+        try:
+            return _execute(self, sql, parameters)
+        finally:
+            self._seconds = perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._pending is not None:
+            self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        self._pending = (current_workflow.get(), sql, seq_of_parameters[0] if seq_of_parameters else ())
+        started = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._seconds = perf_counter() - started
+            self._rows = max(self.rowcount, 0)
+
+    def executescript(self, sql_script):
+        if self._pending is not None:
+            self._finish()
+        return super().executescript(sql_script)
+
+    # Statement done -> Record it (once); only a slow one costs more than that
+    def _finish(self):
+        workflow, sql, params = self._pending
+        self._pending = None
+        stats = self.connection.stats
+        stats.record(workflow, sql, self._seconds, self._rows)
+        if self._seconds * 1000 >= stats.slow_ms:
+            sql = _normalized.get(sql) or normalize_cached(sql)
+            stats.record_slow(SlowQuery(time.strftime("%Y-%m-%d %H:%M:%S"), workflow, sql, params,
+                                        round(self._seconds * 1000, 3), self._rows,
+                                        self.connection.query_plan(sql, params)))
+
+    def fetchone(self):
+        started = perf_counter()
+        row = _fetchone(self)
+        self._seconds += perf_counter() - started
+        if row is not None:
+            self._rows += 1
+        elif self._pending is not None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = perf_counter()
+        rows = super().fetchmany(size)
+        self._seconds += perf_counter() - started
+        self._rows += len(rows)
+        if len(rows) < size and self._pending is not None:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        started = perf_counter()
+        rows = _fetchall(self)
+        self._seconds += perf_counter() - started
+        self._rows += len(rows)
+        if self._pending is not None:
+            self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        if self._pending is not None:
+            self._finish()
+        super().close()
+
+    def __del__(self):
+        if self._pending is not None:
+            try:
+                self._finish()
+            except sqlite3.ProgrammingError:
+                pass
+
+
+# sqlite3.connect(..., factory=InstrumentedConnection) -> conn.stats
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats if stats is not None else QueryStats()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return _cursor(self, InstrumentedCursor).execute(sql, parameters)
+
+    # COMMIT is where the fsync happens -> Timed like any statement
+    def commit(self):
+        self._timed_call("COMMIT", super().commit)
+
+    def rollback(self):
+        self._timed_call("ROLLBACK", super().rollback)
+
+    def _timed_call(self, sql, method):
+        started = perf_counter()
+        try:
+            method()
+        finally:
+            self.stats.record(current_workflow.get(), sql, perf_counter() - started, 0)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _cursor(self, InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+    # EXPLAIN QUERY PLAN lines for a statement, run outside the instrumentation
+    def query_plan(self, sql, params=()):
+        if not re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", sql, re.IGNORECASE):
+            return []
+        try:
+            cursor = sqlite3.Cursor(self)
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [detail for _, _, _, detail in cursor.fetchall()]
+        except sqlite3.Error as error:
+            return [f"(no plan: {error})"]
+
+
+# Text report: latency histogram, time per workflow, costliest statements, slow log
+def format_report(stats, top=15):
+    lines = ["📊 Query statistics", ""]
+
+    total = sum(stats.histogram)
+    lines.append(f"Latency histogram ({total} statements):")
+    lower = 0
+    for bound, count in zip(list(BUCKETS_MS) + [None], stats.histogram):
+        label = f"{lower:>6g}-{bound:<6g} ms" if bound is not None else f"{lower:>6g}+       ms"
+        bar = "#" * (round(40 * count / total) if total else 0)
+        lines.append(f"  {label} {count:>8} {bar}")
+        lower = bound
+
+    by_workflow = {}
+    for entry in stats.statements.values():
+        calls, seconds = by_workflow.get(entry.workflow, (0, 0.0))
+        by_workflow[entry.workflow] = (calls + entry.calls, seconds + entry.seconds)
+    lines += ["", "By workflow:"]
+    for name, (calls, seconds) in sorted(by_workflow.items(), key=lambda item: -item[1][1]):
+        lines.append(f"  {name or '(none)':<20} {calls:>8} statements {seconds * 1000:>10.2f} ms")
+
+    lines += ["", f"Top {top} statements by total time:"]
+    for entry in sorted(stats.statements.values(), key=lambda e: -e.seconds)[:top]:
+        lines.append(f"  {entry.seconds * 1000:>9.2f} ms  {entry.calls:>6} calls  max {entry.max_seconds * 1000:.2f} ms  "
+                     f"{entry.rows} rows  [{entry.workflow or '-'}]")
+        lines.append(f"      {entry.sql[:150]}")
+
+    lines += ["", f"Slow queries (>= {stats.slow_ms:g} ms): {len(stats.slow)}"]
+    for entry in stats.slow:
+        lines.append(f"  {entry.at}  {entry.ms:.2f} ms  {entry.rows} rows  [{entry.workflow or '-'}]")
+        lines.append(f"      {entry.sql[:150]}")
+        lines += [f"      plan: {step}" for step in entry.plan]
+
+    return "\n".join(lines)
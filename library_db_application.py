@@ -1,12 +1,43 @@
-import sqlite3
-from pathlib import Path
-from datetime import date
-from datetime import datetime
+import argparse
 import re
+import sys
+from datetime import date
 
-db_path = Path("library.db").resolve()
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
+from branches import BRANCHES_FILE, load_branches
+from circulation import CheckoutConflict, read_item_ids
+from instrumentation import format_report, workflow, SLOW_MS
+from library_service import LibraryService, open_library, DEFAULT_DB, POSITIONS
+from records import LibraryError
+from registration import AlreadyRegistered, EventFull
+from replay import print_report, replay, run_operation
+
+# Interactive desk program: a thin shell over LibraryService.
+# Nothing happens on import -> main() opens the database and starts the menu.
+#
+# With a command it runs that one operation and exits, no menu (see replay.py):
+#   python library_db_application.py search tolkien --field author
+#   python library_db_application.py borrow ana@example.com 4012
+#   python library_db_application.py return ana@example.com 4012
+#   python library_db_application.py donate "The Hobbit" "J. R. R. Tolkien" Book Fantasy
+#   python library_db_application.py register ana@example.com 17 [--waitlist]
+#   python library_db_application.py pay ana@example.com 2.50
+#   python library_db_application.py replay day.jsonl [--workers 4]
+
+# Set by main()
+service = None
+
+# Signed-in member (MemberProfile), set by check_membership() / create_membership()
+# -> Menu actions use it instead of asking for the email again
+session_member = None
+
+# Set by main() when started with --profile -> Statement timings (see instrumentation.py)
+query_stats = None
+
+# Number of search results shown before asking for the next page
+SEARCH_PAGE_SIZE = 10
+
+# Number of events shown per list (upcoming / past) before asking for the next page
+EVENT_PAGE_SIZE = 10
 
 # Make sure input is nonempty
 def nonEmpty(prompt):
@@ -16,14 +47,6 @@ def nonEmpty(prompt):
             return value
         print("❌ Input cannot be empty. Please try again.\n")
         
-# Helper function: Valid email
-def get_valid_email():
-    while True:
-        email = input("\nEnter your email: ")
-        if re.match(r"^[\w\.-]+@[\w\.-]+\.\w+$", email):
-            return email
-        print("\n❌ Invalid email format. Please enter a valid email.")
-
 # Helper function: Valid date
 def get_valid_date(prompt):
     while True:
@@ -32,8 +55,28 @@ def get_valid_date(prompt):
             return date_input
         print("\n❌ Invalid date format. Please use YYYY-MM-DD.")
         
+# Helper function: (y)/(n) answer -> True for yes
+def yes_no():
+    while True:
+        answer = input("Enter (y) for Yes or (n) for No: ").strip().lower()
+        if answer in ('y', 'n'):
+            return answer == 'y'
+        print("\n❌ Invalid input. Please try again.")
+
+# Email of the signed-in member
+def session_email():
+    return session_member.email
+
+
+# Re-reads the signed-in member (after their roles change)
+def refresh_session():
+    global session_member
+    session_member = service.profile(session_member.email)
+
+
 # Checks if someone has a membership
 def check_membership():
+    global session_member
     print("\n\n---------------------------------------")
     print("\n\nDo you have an existing membership with us?")
     answer = input("Enter (y) for Yes or (n) for No: ").lower()
@@ -45,13 +88,12 @@ def check_membership():
     # User response: y
     elif answer == 'y':
         email = input("Please enter your email: ")
-        query = "SELECT * FROM Member WHERE email = ?"
-        cursor.execute(query, (email,))
-        member = cursor.fetchone()
+        member = service.profile(email)
         
-        # If member -> Proceed
+        # If member -> Proceed (and remember them for the rest of the session)
         if member:
-            print(f"\nWelcome back, {member[1]}!")
+            session_member = member
+            print(f"\nWelcome back, {member.name}!")
             return True
         # Retry if input not in db
         else:
@@ -64,6 +106,7 @@ def check_membership():
 
 # Creates membership
 def create_membership():
+    global session_member
     print("\nTo access the library, you need to create a membership.")
 
     name = nonEmpty("\nEnter your full name: ")
@@ -84,8 +127,7 @@ def create_membership():
             continue  # Restart email input
 
         # If entered email already in db -> Retry 
-        cursor.execute("SELECT email FROM Member WHERE email = ?", (email,))
-        if cursor.fetchone():
+        if service.get_member(email):
             print("\n❌ This email is already registered.\nRedirecting to membership check...")
             check_membership()
             return
@@ -93,10 +135,8 @@ def create_membership():
         break
 
     # Valid inputs + Email not in db -> Create new member
-    query = '''INSERT INTO Member (name, birthday, email) 
-               VALUES (?, ?, ?)'''
-    cursor.execute(query, (name, birthday, email))
-    conn.commit()
+    service.create_member(name, birthday, email)
+    session_member = service.profile(email)
 
     print(f"\n✅ Membership created successfully for {name}. Welcome to our library!")
 
@@ -118,72 +158,68 @@ def introPage():
 # Finds item
 def find_item():
     print("\n\nPlease enter either the Name, Author, or Genre of the item you're looking for: ")
-    item_type = input("(1) Name, (2) Author, (3) Genre: ")
+    item_type = input("(1) Name, (2) Author, (3) Genre, (4) Any of these: ")
 
     if item_type == '1':
-        search_value = input('Enter the item name (partial match allowed): ')
-        query = 'SELECT itemID FROM Item WHERE name LIKE ?'
+        search_value = input('Enter the item name (partial words allowed): ')
+        field = 'name'
     elif item_type == '2':
-        search_value = input("Enter the author name (partial match allowed): ")
-        query = 'SELECT itemID FROM Item WHERE author LIKE ?'
+        search_value = input("Enter the author name (partial words allowed): ")
+        field = 'author'
     elif item_type == '3':
-        search_value = input('Enter the genre (partial match allowed): ')
-        query = 'SELECT itemID FROM Item WHERE genre LIKE ?'
+        search_value = input('Enter the genre (partial words allowed): ')
+        field = 'genre'
+    elif item_type == '4':
+        search_value = input('Enter any words from the name, author, category or genre: ')
+        field = None
     else:
         print('❌ Invalid choice')
         return
     
-    # Search
-    search_value = '%' + search_value + '%'
-
-    cursor.execute(query, (search_value,))
-    itemIDs = cursor.fetchall()
-
-    if itemIDs:
-        available_items = []
-        unavailable_items = []
-
-        # Sort items -> Available, unavailable
-        for itemID in itemIDs:
-            cursor.execute("SELECT * FROM Item WHERE itemID = ?", (itemID[0],))
-            item_attributes = cursor.fetchone()
-
-            if item_attributes[5].lower() == 'available':
-                available_items.append(item_attributes)
-            else:
-                unavailable_items.append(item_attributes)
-
-        # Print available items
-        if available_items:
-            print("\n✅ Available Items:")
-            for item in available_items:
-                print(f"ItemID: {item[0]}, Name: {item[1]}, Author: {item[2]}, Category: {item[3]}, Genre: {item[4]}, Status: {item[5]}")
-        else:
-            print("\nNo available items found.")
-
-        # Print unavailable items
-        if unavailable_items:
-            print("\n❌ Unavailable Items:")
-            for item in unavailable_items:
-                print(f"ItemID: {item[0]}, Name: {item[1]}, Author: {item[2]}, Category: {item[3]}, Genre: {item[4]}, Status: {item[5]}")
-        else:
-            print("\nNo unavailable items found.")
-
-    else:
-        print("\n❌ No item found matching your search input :(")
+    # Search (full-text index) -> One query, streamed a page at a time
+    pages = service.search_pages(search_value, field, page_size=SEARCH_PAGE_SIZE)
+    shown = 0
+    current_status = None
+
+    for page in pages:
+        for item in page:
+            # Available items come first -> Print a heading when the status changes
+            if item.status != current_status:
+                current_status = item.status
+                if current_status.lower() == 'available':
+                    print("\n✅ Available Items:")
+                else:
+                    print("\n❌ Unavailable Items:")
+            print(f"ItemID: {item.item_id}, Name: {item.name}, Author: {item.author}, Category: {item.category}, Genre: {item.genre}, Status: {item.status}")
+        shown += len(page)
+
+        # Full page -> There may be more
+        if len(page) < SEARCH_PAGE_SIZE:
+            break
+        more = input(f"\nShowing {shown} items. (n) Next page, anything else to stop: ").strip().lower()
+        if more != 'n':
+            pages.close()
+            break
 
+    if shown == 0:
+        # Nothing spelled like that -> Closest names / authors instead
+        closest = service.fuzzy_search(search_value, field) if field in (None, 'name', 'author') else []
+        if not closest:
+            print("\n❌ No item found matching your search input :(")
+            return
+        print("\n🔎 No exact match. Did you mean:")
+        for item in closest:
+            print(f"ItemID: {item.item_id}, Name: {item.name}, Author: {item.author}, Category: {item.category}, Genre: {item.genre}, Status: {item.status}")
 
 
 
 def borrow_item():
-    email = input("\nEnter your email: ")
+    email = session_email()
 
-    # Checks if member exists
-    cursor.execute("SELECT * FROM Member WHERE email = ?", (email,))
-    member = cursor.fetchone()
-    if not member:
-        print("\n❌ No membership found with this email. Please create a membership first.")
-        return
+    # Holds that came in for the member -> No need to come back and check
+    for hold in service.holds(email):
+        if hold.status == 'Ready':
+            print(f"📬 On the hold shelf for you until {hold.expires_at}: {hold.item_id}: {hold.item_name}")
 
     # Ask for itemID
     while True:
@@ -193,68 +229,34 @@ def borrow_item():
         except ValueError:
             print("❌ Invalid input! Please enter a numeric item ID.")
 
-    # Check item status
-    cursor.execute("SELECT status FROM Item WHERE itemID = ?", (item_id,))
-    item = cursor.fetchone()
-    # Item doesn't exist
-    if item is None:
-        print("\n❌ Item not found.")
+    # Borrow in one transaction (fails cleanly if someone else got it first)
+    try:
+        receipt = service.borrow(email, item_id)
+    except CheckoutConflict as error:
+        print(f"\n❌ {error}")
+        # Out -> Offer a place in the queue instead of checking back later
+        if input("Place a hold so it is kept for you when it comes back? (y/n): ").strip().lower() == 'y':
+            try:
+                hold = service.place_hold(email, item_id)
+            except LibraryError as error:
+                print(f"\n❌ {error}")
+                return
+            print(f"\n✅ Hold placed on '{hold.item_name}'. You are number {hold.position} in line.")
         return
-    status = item[0]
-    # Item currently unavailable
-    if status == 'Unavailable':
-        print("\n❌ The item is currently unavailable for borrowing.")
+    except LibraryError as error:
+        print(f"\n❌ {error}")
         return
 
-    # New borrow transaction
-    cursor.execute("INSERT INTO Borrow (email, itemID) VALUES (?, ?)", (email, item_id))
-    conn.commit()
-
-    # Insert into BorrowTransactions (NULL borrowID) and get borrowID (created using trigger)
-    borrow_date = date.today().strftime("%Y-%m-%d")
-    cursor.execute("INSERT INTO BorrowTransactions (borrowID, borrowDate) VALUES (NULL, ?)", (borrow_date,))
-    conn.commit()
-    borrow_id = cursor.lastrowid
-
-    # Update Borrow table
-    cursor.execute("UPDATE Borrow SET borrowID = ? WHERE email = ? AND itemID = ?", (borrow_id, email, item_id))
-    conn.commit()
-
-    # Get return date
-    cursor.execute("SELECT returnDate FROM BorrowTransactions WHERE borrowID = ?", (borrow_id,))
-    return_date = cursor.fetchone()[0]
-
-    # Make item -> Unavailable
-    cursor.execute("UPDATE Item SET status = 'Unavailable' WHERE itemID = ?", (item_id,))
-    conn.commit()
-
-    # Success output
-    cursor.execute("SELECT name FROM Item WHERE itemID = ?", (item_id,))
-    item_name = cursor.fetchone()[0]
-
-    print(f"\n✅ Success! You borrowed '{item_name}'.")
-    print(f"Return Date: {return_date}")
+    print(f"\n✅ Success! You borrowed '{receipt.item_name}'.")
+    print(f"Return Date: {receipt.return_date}")
         
 
 # Return borrowed item
 def return_item():
-    email = input("\nEnter your email: ")
+    email = session_email()
 
-    # Get member info
-    cursor.execute("SELECT * FROM Member WHERE email = ?", (email,))
-    member = cursor.fetchone()
-    if not member:
-        print("\n❌ No membership found with this email.")
-        return
-
-    # (If exists) print all borrowed items 
-    cursor.execute("""
-        SELECT Item.itemID, Item.name 
-        FROM Item
-        JOIN Borrow ON Item.itemID = Borrow.itemID
-        WHERE Borrow.email = ?
-    """, (email,))
-    borrowed_items = cursor.fetchall()
+    # Print all borrowed items 
+    borrowed_items = service.borrowed_items(email)
     
     if not borrowed_items:
         print("\n❌ You have no borrowed items.")
@@ -262,40 +264,25 @@ def return_item():
     
     print("\n📌 Your borrowed items:")
     for item in borrowed_items:
-        print(f"- {item[0]}: {item[1]}")
+        print(f"- {item.item_id}: {item.name}")
     
     # Get itemID
-    item_id = input("\nEnter the item ID of the item you want to return: ")
-    
-    # Return if pass checks / error
-    cursor.execute("SELECT borrowID FROM Borrow WHERE email = ? AND itemID = ?", (email, item_id))
-    borrow_record = cursor.fetchone()
-    
-    if borrow_record is None:
-        print("\n❌ You have not borrowed this item or it does not exist.")
+    item_id = input("\nEnter the item ID of the item you want to return: ").strip()
+    if not item_id.isdigit():
+        print("\n❌ Invalid input! Please enter a numeric item ID.")
         return
     
-    borrow_id = borrow_record[0] 
-    
-    # Item Status -> Available
-    cursor.execute("UPDATE Item SET status = 'Available' WHERE itemID = ?", (item_id,))
-    conn.commit()
-    
-    # BorrowTransactions status -> Returned
-    return_date = date.today().strftime("%Y-%m-%d")
-    cursor.execute("UPDATE BorrowTransactions SET status = 'Returned', returnDate = ? WHERE borrowID = ?", 
-                   (return_date, borrow_id))
-    conn.commit()
-    
-    # Delete Borrow record
-    cursor.execute("DELETE FROM Borrow WHERE email = ? AND itemID = ?", (email, item_id))
-    conn.commit()
-    
-    # Success output
-    cursor.execute("SELECT name FROM Item WHERE itemID = ?", (item_id,))
-    item_name = cursor.fetchone()[0]
-    
-    print(f"\n✅ Success! You returned '{item_name}'.")
+    # Item -> Available, loan -> Returned, Borrow record removed (one transaction)
+    try:
+        result = service.return_item(email, int(item_id))
+    except LibraryError as error:
+        print(f"\n❌ {error}")
+        return
+
+    if result.ok:
+        print(f"\n✅ Success! {result.message}")
+    else:
+        print(f"\n❌ {result.message}")
 
 # Donates item (add item)
 def donate_item():
@@ -306,10 +293,7 @@ def donate_item():
     genre = nonEmpty("\nEnter the genre of the item: ")
 
     # Add new item (-> Automatically adds to history also)
-    query = """INSERT INTO Item (name, author, category, genre, status)
-               VALUES (?, ?, ?, ?, ?)"""
-    cursor.execute(query, (full_name, author, category, genre, 'Available'))
-    conn.commit()
+    service.donate(full_name, author, category, genre)
 
     # Success output
     print(f"\n✅ Successfully donated the item: '{full_name}' by {author}.")
@@ -317,32 +301,18 @@ def donate_item():
 
 # Prints past and future events
 def find_events():
-    # Get today's date
-    today = datetime.today().date()
+    # First page of each: upcoming in date order, past most recent first
+    upcoming = service.upcoming_events(EVENT_PAGE_SIZE)
+    past = service.past_events(EVENT_PAGE_SIZE)
 
-    # Retrieve all events ordered by date
-    query = "SELECT eventID, name, scheduledTime, scheduledDate, targetAudience FROM Events ORDER BY scheduledDate, scheduledTime"
-    cursor.execute(query)
-    events = cursor.fetchall()
-
-    if not events:
+    if not upcoming and not past:
         print("\n❌ No events found.")
         return
 
-    # Get future and past events
-    future_events = []
-    past_events = []
-
-    for event in events:
-        event_date = datetime.strptime(event[3], "%Y-%m-%d").date() 
-        if event_date >= today:
-            future_events.append(event)
-        else:
-            past_events.append(event)
-
-    def print_events(title, event_list):
-        if not event_list:
-            print(f"\n❌ No {title.lower()} events found.")
+    # Prints `page`, then asks for the next one (next_page(last event shown)) while pages are full
+    def print_events(title, label, page, next_page):
+        if not page:
+            print(f"\n❌ No {label} events found.")
             return
 
         print(f"\n{title}")
@@ -350,108 +320,107 @@ def find_events():
         print(f"{'ID':<5} {'Event Name':<25} {'Time':<10} {'Date':<12}{'Audience':<15}")
         print("-" * 90)
 
-        for event_id, name, time, date, audience in event_list:
-            print(f"{event_id:<5} {name:<25} {time:<10} {date:<12} {'N/A':<20} {audience:<15}")
+        shown = 0
+        while page:
+            for event in page:
+                print(f"{event.event_id:<5} {event.name:<25} {event.scheduled_time:<10} {event.scheduled_date:<12} {'N/A':<20} {event.target_audience:<15}")
+            shown += len(page)
+
+            # Full page -> There may be more
+            if len(page) < EVENT_PAGE_SIZE:
+                break
+            more = input(f"\nShowing {shown} {label} events. (n) Next page, anything else to stop: ").strip().lower()
+            if more != 'n':
+                break
+            page = next_page(page[-1])
 
         print("-" * 90)
 
     # Print
-    print_events("\n✅ Upcoming Events", future_events)
-    print_events("❌ Past Events", past_events)
+    print_events("\n✅ Upcoming Events", "upcoming", upcoming,
+                 lambda last: service.upcoming_events(EVENT_PAGE_SIZE, after=last))
+    print_events("❌ Past Events", "past", past,
+                 lambda last: service.past_events(EVENT_PAGE_SIZE, before=last))
 
 # Registers member for event
 def register_event():
-    email = input("\nEnter your email: ")
-
-    # Get member
-    cursor.execute("SELECT * FROM Member WHERE email = ?", (email,))
-    member = cursor.fetchone()
-    if not member:
-        print("\n❗ No membership found with this email. Please create a membership first.")
-        return
+    email = session_email()
 
     # Get eventID and its details
     event_id = input("\nEnter the Event ID you want to register for: ")
-    cursor.execute("""
-        SELECT e.name, e.scheduledTime, e.scheduledDate, e.targetAudience, l.roomNum 
-        FROM Events e 
-        LEFT JOIN Located l ON e.eventID = l.eventID 
-        WHERE e.eventID = ?
-    """, (event_id,))
-    
-    event = cursor.fetchone()
+    event = service.get_event(event_id)
 
     # Check if event exists
     if event is None:
         print("\n❌ Event not found.")
         return
 
-    # If it does -> Get details
-    event_name, scheduled_time, scheduled_date, target_audience, room_num = event
+    # Take a seat (fails if the event has passed / already registered / full)
+    try:
+        result = service.register(email, event.event_id)
+    except AlreadyRegistered as error:
+        print(f"\n❗ {error}")
+        offer_cancel(email, event)
+        return
+    except EventFull as error:
+        print(f"\n❗ {error}")
+        print("Would you like to join the waitlist? You will get the first seat that frees up.")
+        if not yes_no():
+            return
+        try:
+            result = service.register(email, event.event_id, waitlist=True)
+        except LibraryError as error:
+            print(f"\n❌ {error}")
+            return
+    except LibraryError as error:
+        print(f"\n❌ {error}")
+        return
 
-    # Make sure event is in future
-    event_date = datetime.strptime(scheduled_date, "%Y-%m-%d").date()
-    if event_date < datetime.today().date():
-        print(f"\n❌ You cannot register for '{event_name}' because the event has already passed.")
+    if result.status == "Waitlisted":
+        print(f"\n⏳ You are number {result.position} on the waitlist for '{event.name}'.")
         return
 
     # Display event details
     print("\nEvent Details:")
-    print(f"Name: {event_name}")
-    print(f"Scheduled Time: {scheduled_time}")
-    print(f"Scheduled Date: {scheduled_date}")
-    print(f"Target Audience: {target_audience}")
-    print(f"Room Number: {room_num if room_num else 'Not assigned'}")
+    print(f"Name: {event.name}")
+    print(f"Scheduled Time: {event.scheduled_time}")
+    print(f"Scheduled Date: {event.scheduled_date}")
+    print(f"Target Audience: {event.target_audience}")
+    print(f"Room Number: {event.room_num if event.room_num else 'Not assigned'}")
 
-    # Insert into Attends table
-    try:
-        cursor.execute("INSERT INTO Attends (email, eventID) VALUES (?, ?)", (email, event_id))
-        conn.commit()
-        print(f"\n✅ Success! You are now registered for '{event_name}'\n\t- ⏰ Time: {scheduled_time}\n\t- Date: 📅 {scheduled_date}\n\t- #️⃣ Room Number: {room_num}.")
-    except sqlite3.IntegrityError:
-        print("\n❗ You are already registered for this event.")
+    print(f"\n✅ Success! You are now registered for '{event.name}'\n\t- ⏰ Time: {event.scheduled_time}\n\t- Date: 📅 {event.scheduled_date}\n\t- #️⃣ Room Number: {event.room_num}.")
 
 
+# Helper function: Cancel a registration (or waitlist place) if the member wants to
+def offer_cancel(email, event):
+    print(f"Would you like to cancel your place for '{event.name}'?")
+    if not yes_no():
+        return
+    try:
+        promoted = service.cancel_registration(email, event.event_id)
+    except LibraryError as error:
+        print(f"\n❌ {error}")
+        return
+    print(f"\n✅ Your place for '{event.name}' has been cancelled.")
+    for result in promoted:
+        print(f"📨 {result.email} moved up from the waitlist.")
+
 # Volunteer for library
 def volunteer_library():
     print("\nBecome a Library Volunteer!")
+    email = session_email()
 
-    # Validate email format
-    while True:
-        email = input("Enter your email: ")
-
-        if not re.match(r"^[\w\.-]+@[\w\.-]+\.\w+$", email):
-            print("\n❌ Invalid email. Please enter a valid email address.")
-            continue
-
-        # Check: Member
-        cursor.execute("SELECT email FROM Member WHERE email = ?", (email,))
-        if not cursor.fetchone():
-            print("\n❗ You must be a registered library member to volunteer.")
-            return 
-
-        # Check: Member is volunteer?
-        cursor.execute("SELECT email FROM Volunteer WHERE email = ?", (email,))
-        if cursor.fetchone():
-            print("\n❗ You are already registered as a volunteer.")
-            return
-
-        # Check: Member is staff?
-        cursor.execute("SELECT email FROM Staff WHERE email = ?", (email,))
-        if cursor.fetchone():
-            print("\n❗ You cannot volunteer as you are already registered as a staff member.")
-            return 
-
-        break
-    
+    # Checks membership and existing roles, then adds to Volunteer table
     employment_date = date.today().strftime("%Y-%m-%d")
-    # Insert into Volunteer table
-    query = '''INSERT INTO Volunteer (email, employmentDate) 
-               VALUES (?, ?)'''
-    cursor.execute(query, (email, employment_date))
-    conn.commit()
+    try:
+        volunteer_id = service.volunteer(email, employment_date)
+    except LibraryError as error:
+        print(f"\n❗ {error}")
+        return
 
+    refresh_session()
     print(f"\n✅ Thank you! You are now registered as a library volunteer starting from {employment_date}.")
+    print(f"Your volunteer ID is {volunteer_id}.")
 
 # Ask for help from librarian 
 def ask_librarian():
@@ -462,26 +431,153 @@ def ask_librarian():
         print("2. Do I have any outstanding fines?")
         print("3. Pay my fines")
         print("4. Recommend me events")
-        print("5. Exit")
+        print("5. Recommend me items")
+        print("6. Process a return bin")
+        print("7. Check out several items at once")
+        print("8. Register a group for an event")
+        print("9. Show query statistics")
+        print("10. Exit")
 
         choice = input("\nEnter the number of your choice: ")
 
         if choice == "1":
-            apply_librarian()
+            run_workflow(apply_librarian)
         elif choice == "2":
-            check_fines()
+            run_workflow(check_fines)
         elif choice == "3":
             print("\n\n---------------------------------------")
             print("\n\nPay Your Fines!")
-            email = get_valid_email()
-            pay_fines(email)
+            run_workflow(pay_fines, session_email())
         elif choice == "4":
-            recommend_events()
+            run_workflow(recommend_events)
         elif choice == "5":
+            run_workflow(recommend_items)
+        elif choice == "6":
+            run_workflow(bulk_return)
+        elif choice == "7":
+            run_workflow(bulk_checkout)
+        elif choice == "8":
+            run_workflow(group_registration)
+        elif choice == "9":
+            show_query_stats()
+        elif choice == "10":
             print("\n👋 Exiting Ask a Librarian.")
             break
         else:
-            print("\n❌ Invalid input. Please enter a number from 1 to 5.")
+            print("\n❌ Invalid input. Please enter a number from 1 to 10.")
+
+# Statement timings collected so far (--profile) and member cache counters
+def show_query_stats():
+    if query_stats is None:
+        print("\n❗ Query statistics are off. Start the program with --profile to collect them.")
+    else:
+        print("\n" + format_report(query_stats))
+
+    cache = service.member_cache.stats()
+    print(f"\n👤 Member cache: {cache.size} entries, {cache.hits} hits, {cache.misses} misses, "
+          f"{cache.evictions} evictions, {cache.invalidations} invalidations")
+
+# Helper function: Item IDs typed in (comma separated) or read from a file (one per line)
+def get_item_ids():
+    source = input("\n(1) Type the item IDs, (2) Read them from a file: ")
+
+    if source == '1':
+        lines = input("Enter the item IDs, separated by commas: ").split(",")
+    elif source == '2':
+        path = nonEmpty("Enter the path of the file (one item ID per line): ")
+        try:
+            with open(path) as file:
+                lines = file.readlines()
+        except OSError as error:
+            print(f"\n❌ Could not read the file: {error}")
+            return []
+    else:
+        print("\n❌ Invalid choice")
+        return []
+
+    item_ids, bad_lines = read_item_ids(lines)
+    for line in bad_lines:
+        print(f"❗ Skipping '{line}' (not an item ID)")
+    return item_ids
+
+# Helper function: Print a batch report
+def print_batch_report(results):
+    for result in results:
+        mark = "✅" if result.ok else "❌"
+        print(f"{mark} {result.item_id}: {result.message}")
+
+    done = sum(1 for result in results if result.ok)
+    print(f"\n{done} of {len(results)} items processed.")
+
+# Return every item in a return bin at once
+def bulk_return():
+    print("\n\n---------------------------------------")
+    print("\n\n📦 Process a Return Bin:")
+    item_ids = get_item_ids()
+    if not item_ids:
+        print("\n❌ No item IDs given.")
+        return
+
+    print_batch_report(service.return_many(item_ids))
+
+# Borrow several items for one member at once
+def bulk_checkout():
+    print("\n\n---------------------------------------")
+    print("\n\n📚 Check Out Several Items:")
+    email = session_email()
+    item_ids = get_item_ids()
+    if not item_ids:
+        print("\n❌ No item IDs given.")
+        return
+
+    try:
+        print_batch_report(service.borrow_many(email, item_ids))
+    except LibraryError as error:
+        print(f"\n❌ {error}")
+
+# Items borrowed by members with similar borrowing history
+def recommend_items():
+    print("\n\n---------------------------------------")
+    print("\n\n📚 Recommended for You:")
+    items = service.recommend_items(session_email())
+
+    if not items:
+        print("\n❌ No recommendations yet. Borrow a few items and check back!")
+        return
+
+    print("Members who borrowed what you borrowed also enjoyed:\n")
+    for item in items:
+        print(f"ItemID: {item.item_id}, Name: {item.name}, Author: {item.author}, Category: {item.category}, Genre: {item.genre}, Status: {item.status}")
+
+# Sign up a group (e.g. a school class) for one event
+def group_registration():
+    print("\n\n---------------------------------------")
+    print("\n\n🏫 Register a Group for an Event:")
+    event_id = input("Enter the Event ID: ").strip()
+    seats = service.seats(event_id) if event_id.isdigit() else None
+    if seats is None:
+        print("\n❌ Event not found.")
+        return
+    if seats.capacity is not None:
+        print(f"🪑 {max(0, seats.capacity - seats.attendees)} of {seats.capacity} seats free, {seats.waitlisted} on the waitlist.")
+
+    emails = [email.strip() for email in input("Enter the members' emails, separated by commas: ").split(",") if email.strip()]
+    if not emails:
+        print("\n❌ No emails given.")
+        return
+
+    try:
+        results = service.register_group(int(event_id), emails)
+    except LibraryError as error:
+        print(f"\n❌ {error}")
+        return
+
+    marks = {"Registered": "✅", "Waitlisted": "⏳", "Rejected": "❌"}
+    for result in results:
+        print(f"{marks[result.status]} {result.email}: {result.message}")
+    registered = sum(1 for result in results if result.status == "Registered")
+    waitlisted = sum(1 for result in results if result.status == "Waitlisted")
+    print(f"\n{registered} registered, {waitlisted} on the waitlist, {len(results) - registered - waitlisted} rejected.")
 
 # Apply to become a librarian
 def apply_librarian():
@@ -489,147 +585,103 @@ def apply_librarian():
     print("\n\n📖 How to Apply as a Librarian:")
     print("To apply, please provide the following details.")
 
-    email = get_valid_email()
+    email = session_email()
 
     # Check: If member already staff
-    cursor.execute("SELECT email FROM Staff WHERE email = ?", (email,))
-    if cursor.fetchone():
+    if service.is_staff(email):
         print("\n❗ You are already a staff member!")
         return
 
     employment_date = get_valid_date("Enter your employment start date (YYYY-MM-DD): ")
 
     # Ask for the position
-    positions = {
-        "1": ("Librarian", 20000),
-        "2": ("Assistant Librarian", 15000),
-        "3": ("Security", 25000),
-        "4": ("Cleaner", 18000)
-    }
-
     print("\nAvailable Positions:")
-    for key, (role, wage) in positions.items():
+    for key, (role, wage) in POSITIONS.items():
         print(f"{key}. {role} - ${wage}/year")
 
     while True:
         choice = input("\nEnter the number corresponding to your chosen position: ")
-        if choice in positions:
-            position, wage = positions[choice]
+        if choice in POSITIONS:
+            position, wage = POSITIONS[choice]
             break
         print("\n❌ Invalid choice. Please enter a valid number (1-4).")
 
     # Insert into Staff table
-    cursor.execute(
-        "INSERT INTO Staff (email, employmentDate, position, wage, employmentStatus) VALUES (?, ?, ?, ?, ?)",
-        (email, employment_date, position, wage, "Working")
-    )
-    conn.commit()
+    try:
+        staff_id = service.apply_staff(email, employment_date, position, wage)
+    except LibraryError as error:
+        print(f"\n❗ {error}")
+        return
 
+    refresh_session()
     print(f"\n✅ Application successful! You are now a {position} earning ${wage}/year.")
+    print(f"Your staff ID is {staff_id}.")
 
 
 # Check fines
 def check_fines():
     print("\n\n---------------------------------------")
     print("\n\nCheck my fines:")
-    email = get_valid_email()
-
-    # Get borrowIDs linked to the email
-    cursor.execute("SELECT borrowID FROM Borrow WHERE email = ?", (email,))
-    borrow_ids = cursor.fetchall()
-
-    if not borrow_ids:
-        print("\n❌ No borrowing records found for this email.")
-        return
+    email = session_email()
 
-    # Retrieve fines for correspongding borrow transactions
-    total_fines = 0
-    for borrow_id in borrow_ids:
-        cursor.execute("SELECT SUM(amount) FROM Fines WHERE borrowID = ?", (borrow_id[0],))
-        fine = cursor.fetchone()[0]
-        
-        if fine:
-            total_fines += fine
+    # Total + per-loan breakdown (includes items already returned)
+    summary = service.fines(email)
 
-    # Display the total fine amount
-    if total_fines > 0:
-        print(f"\n💰 You have outstanding fines totaling ${total_fines:.2f}.")
+    # Display the fines
+    if summary.total > 0:
+        print(f"\n💰 You have outstanding fines totaling ${summary.total:.2f}.")
+        for line in summary.loans:
+            print(f"- Borrow {line.borrow_id}: '{line.item_name}' (due {line.return_date}, {line.loan_status.lower()}) -> ${line.amount:.2f}")
     else:
         print("\n✅ You have no fines!")
 
 # Function to pay fines
 def pay_fines(email):
     print("\n\n---------------------------------------")
-    cursor.execute("""
-        SELECT F.borrowID, F.amount
-        FROM Fines F
-        JOIN Borrow B ON F.borrowID = B.borrowID
-        WHERE B.email = ? AND F.status != 'Paid'
-    """, (email,))
-    
-    fines = cursor.fetchall()
+    summary = service.fines(email)
 
-    if not fines:
+    if summary.total <= 0:
         print("\n\n✅ No fines to pay!")
         return
 
-    total_fine = sum(fine[1] for fine in fines)
-    print(f"\n💰 Your total outstanding fine is: ${total_fine:.2f}")
+    print(f"\n💰 Your total outstanding fine is: ${summary.total:.2f}")
 
     while True:
         amount = input("Enter the amount you want to pay: $")
         try:
             amount = float(amount)
-            if amount <= 0:
-                print("\n❌ Amount must be greater than zero.")
-            elif amount > total_fine:
-                print("\n❌ You cannot overpay. Enter a valid amount.")
-            else:
-                # Deduct payment amount from fines -> When amount=0 -> status=paid !!!
-                for borrow_id, fine_amount in fines:
-                    if amount <= 0:
-                        break
-
-                    if amount >= fine_amount:
-                        cursor.execute("""
-                            UPDATE Fines
-                            SET amount = 0, status = 'Paid'
-                            WHERE borrowID = ?
-                        """, (borrow_id,))
-                        amount -= fine_amount
-                    else:
-                        cursor.execute("""
-                            UPDATE Fines
-                            SET amount = amount - ?
-                            WHERE borrowID = ?
-                        """, (amount, borrow_id))
-                        amount = 0 
-
-                conn.commit()
-
-                print("\n✅ Payment successful! Your updated fine status has been recorded.")
-
-                # Dont pay if your fines are already paid or you dont have any
-                cursor.execute("""
-                    SELECT SUM(amount)
-                    FROM Fines
-                    JOIN Borrow ON Fines.borrowID = Borrow.borrowID
-                    WHERE Borrow.email = ?
-                """, (email,))
-                remaining_fine = cursor.fetchone()[0]
-
-                if not remaining_fine or remaining_fine == 0:
-                    print("\n🎉 All your fines are fully paid!")
-
-                return
         except ValueError:
             print("\n❌ Invalid input. Please enter a numeric value.")
+            continue
+
+        # Oldest fines are paid off first (one transaction)
+        try:
+            payment = service.pay_fines(email, amount)
+        except LibraryError as error:
+            print(f"\n❌ {error}")
+            continue
+
+        print("\n✅ Payment successful! Your updated fine status has been recorded.")
+
+        if payment.remaining == 0:
+            print("\n🎉 All your fines are fully paid!")
+        else:
+            print(f"Remaining balance: ${payment.remaining:.2f}")
+        return
 
 # Recommend events based on target audience
 def recommend_events():
     print("\n\n---------------------------------------")
     print("\n\n🎭 Discover Events Based on Your Interests!")
-    print("Please select a category that best suits you:")
+
+    # Picks from the events the member has been to (members who went there also signed up for ...)
+    picks = service.recommend_events(session_email(), limit=5)
+    if picks:
+        print("\n🎯 Picked for you, from events you have attended:")
+        for event in picks:
+            print(f"  🆔 {event.event_id}  📌 {event.name}  📅 {event.scheduled_date}  ⏰ {event.scheduled_time}")
+
+    print("\nPlease select a category that best suits you:")
 
     audience_options = {
         "1": "All Ages",
@@ -651,13 +703,7 @@ def recommend_events():
         print("\n❌ Invalid choice. Please enter a number between 1 and 6.")
 
     # Get events based on target audience (input)
-    cursor.execute("""
-        SELECT eventID, name, scheduledDate, scheduledTime
-        FROM Events
-        WHERE targetAudience = ?
-    """, (target_audience,))
-    
-    events = cursor.fetchall()
+    events = service.events_for_audience(target_audience)
 
     if not events:
         print("\n❌ No events found for your selected category.")
@@ -665,11 +711,10 @@ def recommend_events():
 
     print(f"\n📅 Events for '{target_audience}':")
     for event in events:
-        event_id, name, date, time = event
-        print(f"\n🆔 Event ID: {event_id}")
-        print(f"📌 Name: {name}")
-        print(f"📅 Date: {date}")
-        print(f"⏰ Time: {time}")
+        print(f"\n🆔 Event ID: {event.event_id}")
+        print(f"📌 Name: {event.name}")
+        print(f"📅 Date: {event.scheduled_date}")
+        print(f"⏰ Time: {event.scheduled_time}")
 
     # Asks if wants to sign up for event (shortcut)
     while True:
@@ -686,38 +731,173 @@ def recommend_events():
 def user_question(option):
     print("\n\n---------------------------------------")
     if option == '1': 
-        find_item()
+        run_workflow(find_item)
     if option == '2':
-        borrow_item()
+        run_workflow(borrow_item)
     if option == '3':
-        return_item()
+        run_workflow(return_item)
     if option == '4':
-        donate_item()
+        run_workflow(donate_item)
     if option == '5':
-        find_events()
+        run_workflow(find_events)
     if option == '6':
-        register_event()
+        run_workflow(register_event)
     if option == '7':
-        volunteer_library()
+        run_workflow(volunteer_library)
     if option == '8':
         ask_librarian()
 
 
-# Check if member
-membership_verified = check_membership()
+# Fields each command passes to replay.run_operation
+COMMAND_FIELDS = {
+    "search": ("text", "field", "limit"),
+    "borrow": ("email", "item_id"),
+    "return": ("email", "item_id"),
+    "donate": ("name", "author", "category", "genre"),
+    "register": ("email", "event_id", "waitlist"),
+    "pay": ("email", "amount"),
+}
 
-# If they have membership -> Continue
-if membership_verified:
-    user_choice = introPage()
 
-    while user_choice != '9':
-        if user_choice in {'1', '2', '3', '4', '5', '6', '7', '8'}:
-            user_question(user_choice)
-        else:
-            print("\n❌ Invalid choice! Please enter a number between 1 and 9.")
+# One operation from the command line, through the same call as a replay -> Exit code
+def run_command(args):
+    operation = {"op": args.command, **{field: getattr(args, field) for field in COMMAND_FIELDS[args.command]}}
+    closest = []
+    try:
+        with workflow(args.command):
+            result = run_operation(service, operation)
+            # Nothing spelled like that -> Closest names / authors, as find_item does
+            if args.command == "search" and not result and args.field in (None, 'name', 'author'):
+                closest = service.fuzzy_search(args.text, args.field, args.limit)
+    except LibraryError as error:
+        print(f"❌ {error}")
+        return 1
+
+    if args.command == "search":
+        if closest:
+            print("🔎 No exact match. Did you mean:")
+            result = closest
+        elif not result:
+            print("❌ No items found.")
+        for item in result:
+            print(f"ItemID: {item.item_id}, Name: {item.name}, Author: {item.author}, Category: {item.category}, Genre: {item.genre}, Status: {item.status}")
+    elif args.command == "borrow":
+        print(f"✅ Success! You borrowed '{result.item_name}'. Return Date: {result.return_date}")
+    elif args.command == "return":
+        print(f"{'✅ Success!' if result.ok else '❌'} {result.message}")
+        return 0 if result.ok else 1
+    elif args.command == "donate":
+        print(f"✅ Successfully donated the item: '{result.name}' by {result.author} (ItemID: {result.item_id}).")
+    elif args.command == "register":
+        print(f"✅ {result.message}")
+    elif args.command == "pay":
+        print(f"✅ Paid ${result.paid:.2f}. Remaining balance: ${result.remaining:.2f}")
+    return 0
+
+
+# Runs a menu action with its queries filed under the action's name
+def run_workflow(action, *args):
+    with workflow(action.__name__):
+        return action(*args)
+
+
+# --workers: at least one, or nothing would run the operations
+def worker_count(value):
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return count
+
+
+def main(argv=None):
+    global service, query_stats
+    parser = argparse.ArgumentParser(description="Library desk")
+    parser.add_argument("--db", default=DEFAULT_DB, help="database file (default: library.db)")
+    parser.add_argument("--branch", help="run this branch's desk: its database from --branches")
+    parser.add_argument("--branches", default=BRANCHES_FILE, help=f"branches file (default: {BRANCHES_FILE})")
+    parser.add_argument("--profile", action="store_true",
+                        help="time every statement; report via Ask the Librarian and on exit")
+    parser.add_argument("--slow-ms", type=float, default=SLOW_MS,
+                        help=f"with --profile, log statements slower than this (default: {SLOW_MS:g})")
+
+    commands = parser.add_subparsers(dest="command", metavar="command",
+                                     help="run one operation and exit instead of starting the menu")
+    search = commands.add_parser("search", help="search the catalog")
+    search.add_argument("text")
+    search.add_argument("--field", choices=('name', 'author', 'category', 'genre'))
+    search.add_argument("--limit", type=int, default=SEARCH_PAGE_SIZE)
+    for name, summary in (("borrow", "borrow an item"), ("return", "return a borrowed item")):
+        command = commands.add_parser(name, help=summary)
+        command.add_argument("email")
+        command.add_argument("item_id", type=int)
+    donate = commands.add_parser("donate", help="add a donated item")
+    for field in ("name", "author", "category", "genre"):
+        donate.add_argument(field)
+    register = commands.add_parser("register", help="sign up for an event")
+    register.add_argument("email")
+    register.add_argument("event_id", type=int)
+    register.add_argument("--waitlist", action="store_true", help="join the waitlist if it is full")
+    pay = commands.add_parser("pay", help="pay off fines, oldest first")
+    pay.add_argument("email")
+    pay.add_argument("amount", type=float)
+    replay_file = commands.add_parser("replay", help="run a JSONL workload (see replay.py) and report timings")
+    replay_file.add_argument("file")
+    replay_file.add_argument("--workers", type=worker_count, default=1, help="operations run at once, one connection each")
+    args = parser.parse_args(argv)
+
+    db = args.db
+    if args.branch:
+        paths = {branch.name: branch.path for branch in load_branches(args.branches)}
+        if args.branch not in paths:
+            print(f"❌ No branch called {args.branch} in {args.branches}.")
+            return 1
+        db = paths[args.branch]
+
+    # Workers open their own connections
+    if args.command == "replay":
+        try:
+            with open(args.file) as lines:
+                report = replay(db, lines, args.workers)
+        except OSError as error:
+            print(f"❌ {error}")
+            return 1
+        print_report(report)
+        return
+
+    conn = open_library(db, instrument=args.profile, slow_ms=args.slow_ms)
+    query_stats = conn.stats if args.profile else None
+    service = LibraryService(conn)
+
+    if args.command:
+        try:
+            return run_command(args)
+        finally:
+            if query_stats is not None:
+                print("\n" + format_report(query_stats))
+            service.close()
+
+    try:
+        # Check if member
+        membership_verified = run_workflow(check_membership)
+
+        # If they have membership -> Continue
+        if membership_verified:
+            user_choice = introPage()
+
+            while user_choice != '9':
+                if user_choice in {'1', '2', '3', '4', '5', '6', '7', '8'}:
+                    user_question(user_choice)
+                else:
+                    print("\n❌ Invalid choice! Please enter a number between 1 and 9.")
+
+                user_choice = introPage()
 
-        user_choice = introPage()
+            print('Thanks for using our library database!')
+    finally:
+        if query_stats is not None:
+            print("\n" + format_report(query_stats))
+        service.close()
 
-    print('Thanks for using our library database!')
 
-conn.close()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
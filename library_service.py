@@ -0,0 +1,320 @@
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+import analytics
+import circulation
+import event_calendar
+import fines
+import holds
+import recommend
+import registration
+from event_calendar import EventCalendar, event_key
+from instrumentation import InstrumentedConnection, QueryStats, SLOW_MS
+from member_cache import MemberCache
+from records import Event, EventDetails, Item, LibraryError, Member, MemberNotFound, MemberProfile
+from schema import ensure_schema
+from search_index import fuzzy_search, iter_search_pages, search_items, PAGE_SIZE
+
+# Non-interactive library API: no input(), no print(). The CLI
+# (library_db_application.py), batch jobs and benchmarks all go through here.
+
+DEFAULT_DB = "library.db"
+
+# Staff positions offered to applicants -> (position, yearly wage)
+POSITIONS = {
+    "1": ("Librarian", 20000),
+    "2": ("Assistant Librarian", 15000),
+    "3": ("Security", 25000),
+    "4": ("Cleaner", 18000),
+}
+
+
+class MemberExists(LibraryError):
+    pass
+
+
+# Asked to volunteer / join staff while already in that (or a conflicting) role
+class RoleConflict(LibraryError):
+    pass
+
+
+# Opens library.db (or another file) with the schema brought up to date.
+# instrument=True -> Statement timings collected in conn.stats (see instrumentation.py)
+def open_library(db_path=DEFAULT_DB, instrument=False, slow_ms=SLOW_MS, **connect_args):
+    if instrument:
+        conn = InstrumentedConnection(Path(db_path).resolve(), stats=QueryStats(slow_ms), **connect_args)
+    else:
+        conn = sqlite3.connect(Path(db_path).resolve(), **connect_args)
+    ensure_schema(conn)
+    return conn
+
+
+def _today():
+    return date.today().strftime("%Y-%m-%d")
+
+
+# Event / EventDetails / key tuple / None -> Keyset cursor
+def _key(position):
+    if position is None or isinstance(position, tuple):
+        return position
+    return event_key(position)
+
+
+# Takes an open sqlite3 connection, or a zero-argument factory that returns one
+# (called on first use). Services that share a MemberCache / EventCalendar (e.g.
+# one service per request in the server) share them; by default each has its own.
+class LibraryService:
+    def __init__(self, connection, member_cache=None, calendar=None):
+        self.member_cache = member_cache if member_cache is not None else MemberCache()
+        self.calendar = calendar if calendar is not None else EventCalendar()
+        if isinstance(connection, sqlite3.Connection):
+            self._conn = connection
+            self._connect = None
+        else:
+            self._conn = None
+            self._connect = connection
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # Members
+
+    # Member details + roles in one query (cached)
+    def profile(self, email):
+        return self.member_cache.get(email, self._load_profile)
+
+    def _load_profile(self, email):
+        row = self.conn.execute("""
+            SELECT m.email, m.name, m.birthday,
+                   EXISTS (SELECT 1 FROM Staff s WHERE s.email = m.email),
+                   EXISTS (SELECT 1 FROM Volunteer v WHERE v.email = m.email)
+            FROM Member m
+            WHERE m.email = ?
+        """, (email,)).fetchone()
+        if row is None:
+            return None
+        return MemberProfile(row[0], row[1], row[2], bool(row[3]), bool(row[4]))
+
+    def get_member(self, email):
+        profile = self.profile(email)
+        return Member(profile.email, profile.name, profile.birthday) if profile else None
+
+    def require_member(self, email):
+        member = self.get_member(email)
+        if member is None:
+            raise MemberNotFound("No membership found with this email. Please create a membership first.")
+        return member
+
+    def create_member(self, name, birthday, email):
+        try:
+            self.conn.execute("INSERT INTO Member (name, birthday, email) VALUES (?, ?, ?)", (name, birthday, email))
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            raise MemberExists("This email is already registered.")
+        self.conn.commit()
+        self.member_cache.invalidate(email)
+        return Member(email, name, birthday)
+
+    # Catalog
+
+    # Best matches, as a list (limit=None -> all of them)
+    def search_items(self, text, field=None, limit=None):
+        return [Item(*row) for row in search_items(self.conn, text, field, limit)]
+
+    # Streams matches a page (list of Items) at a time, available items first
+    def search_pages(self, text, field=None, page_size=PAGE_SIZE):
+        for page in iter_search_pages(self.conn, text, field, page_size):
+            yield [Item(*row) for row in page]
+
+    # Close matches for misspelled names / authors (trigram index), best first
+    def fuzzy_search(self, text, field=None, limit=PAGE_SIZE):
+        return [Item(*row) for row in fuzzy_search(self.conn, text, field, limit)]
+
+    def get_item(self, item_id):
+        row = self.conn.execute("""
+            SELECT itemID, name, author, category, genre, status FROM Item WHERE itemID = ?
+        """, (item_id,)).fetchone()
+        return Item(*row) if row else None
+
+    # Adds a donated item -> The new Item
+    def donate(self, name, author, category, genre):
+        cursor = self.conn.execute("""
+            INSERT INTO Item (name, author, category, genre, status)
+            VALUES (?, ?, ?, ?, 'Available')
+        """, (name, author, category, genre))
+        self.conn.commit()
+        return Item(cursor.lastrowid, name, author, category, genre, 'Available')
+
+    # Circulation
+
+    def borrow(self, email, item_id):
+        return circulation.checkout(self.conn, email, item_id)
+
+    def borrow_many(self, email, item_ids):
+        return circulation.checkout_many(self.conn, email, item_ids)
+
+    def return_many(self, item_ids):
+        return circulation.checkin_many(self.conn, item_ids)
+
+    # Items a member currently has out
+    def borrowed_items(self, email):
+        rows = self.conn.execute("""
+            SELECT Item.itemID, Item.name, Item.author, Item.category, Item.genre, Item.status
+            FROM Item
+            JOIN Borrow ON Item.itemID = Borrow.itemID
+            WHERE Borrow.email = ?
+        """, (email,)).fetchall()
+        return [Item(*row) for row in rows]
+
+    # Returns an item the member has borrowed -> BatchResult
+    def return_item(self, email, item_id):
+        self.require_member(email)
+        row = self.conn.execute("SELECT borrowID FROM Borrow WHERE email = ? AND itemID = ?",
+                                (email, item_id)).fetchone()
+        if row is None:
+            raise circulation.CirculationError("You have not borrowed this item or it does not exist.")
+        return circulation.checkin_many(self.conn, [item_id])[0]
+
+    # Joins the queue for an item that is out -> Hold
+    def place_hold(self, email, item_id, today=None):
+        return holds.place_hold(self.conn, email, item_id, today or _today())
+
+    # -> Email of the member a ready item went to next, if any
+    def cancel_hold(self, email, item_id, today=None):
+        return holds.cancel_hold(self.conn, email, item_id, today or _today())
+
+    # A member's holds, ready to collect first
+    def holds(self, email):
+        return holds.member_holds(self.conn, email)
+
+    # Items the member hasn't borrowed yet, from what similar borrowers took out
+    def recommend_items(self, email, limit=10):
+        return recommend.recommend_items(self.conn, email, limit)
+
+    def similar_items(self, item_id, limit=10):
+        return recommend.similar_items(self.conn, item_id, limit)
+
+    # Events
+
+    # Paging: pass the last event of a page (or its event_key) as after/before
+    # to get the next one
+
+    # Upcoming events in date order, from the in-memory calendar
+    def upcoming_events(self, limit=event_calendar.PAGE_SIZE, after=None, today=None):
+        self.calendar.refresh(self.conn, today or _today())
+        return self.calendar.page(limit, _key(after))
+
+    # Past events, most recent first
+    def past_events(self, limit=event_calendar.PAGE_SIZE, before=None, today=None):
+        return event_calendar.past_events(self.conn, today or _today(), limit, _key(before))
+
+    # Events between two dates (inclusive), in date order
+    def events_between(self, start, end, limit=event_calendar.PAGE_SIZE, after=None):
+        return event_calendar.events_between(self.conn, start, end, limit, _key(after))
+
+    # -> (upcoming, past): the first page of each
+    def list_events(self, today=None, limit=event_calendar.PAGE_SIZE):
+        today = today or _today()
+        return self.upcoming_events(limit, today=today), self.past_events(limit, today=today)
+
+    # Upcoming events liked by members who went to the same events as this one
+    def recommend_events(self, email, limit=10, today=None):
+        return recommend.recommend_events(self.conn, email, today or _today(), limit)
+
+    def events_for_audience(self, audience):
+        rows = self.conn.execute("""
+            SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+            FROM Events
+            WHERE targetAudience = ?
+        """, (audience,)).fetchall()
+        return [Event(*row) for row in rows]
+
+    def get_event(self, event_id):
+        row = self.conn.execute("""
+            SELECT e.eventID, e.name, e.scheduledTime, e.scheduledDate, e.targetAudience, l.roomNum
+            FROM Events e
+            LEFT JOIN Located l ON e.eventID = l.eventID
+            WHERE e.eventID = ?
+        """, (event_id,)).fetchone()
+        return EventDetails(*row) if row else None
+
+    # Signs a member up for an upcoming event -> RegistrationResult
+    # Full -> EventFull, or a place on the waitlist with waitlist=True
+    def register(self, email, event_id, today=None, waitlist=False):
+        return registration.register(self.conn, email, event_id, today or _today(), waitlist)
+
+    # Signs up a group (e.g. a school class) -> One RegistrationResult per email
+    def register_group(self, event_id, emails, today=None, waitlist=True):
+        return registration.register_group(self.conn, event_id, emails, today or _today(), waitlist)
+
+    # -> RegistrationResults for the members moved up from the waitlist
+    def cancel_registration(self, email, event_id):
+        return registration.cancel(self.conn, email, event_id)
+
+    # Capacity / attendees / waitlisted of an event, None if it doesn't exist
+    def seats(self, event_id):
+        return registration.seats(self.conn, event_id)
+
+    # Roles
+
+    # -> New volunteerID
+    def volunteer(self, email, employment_date=None):
+        profile = self.profile(email)
+        if profile is None:
+            raise MemberNotFound("You must be a registered library member to volunteer.")
+        if profile.is_volunteer:
+            raise RoleConflict("You are already registered as a volunteer.")
+        if profile.is_staff:
+            raise RoleConflict("You cannot volunteer as you are already registered as a staff member.")
+
+        cursor = self.conn.execute("""
+            INSERT INTO Volunteer (email, employmentDate) VALUES (?, ?)
+            RETURNING volunteerID
+        """, (email, employment_date or _today()))
+        volunteer_id = cursor.fetchone()[0]
+        self.conn.commit()
+        self.member_cache.invalidate(email)
+        return volunteer_id
+
+    def is_staff(self, email):
+        profile = self.profile(email)
+        return profile is not None and profile.is_staff
+
+    # -> New staffID
+    def apply_staff(self, email, employment_date, position, wage):
+        if self.is_staff(email):
+            raise RoleConflict("You are already a staff member!")
+
+        cursor = self.conn.execute("""
+            INSERT INTO Staff (email, employmentDate, position, wage, employmentStatus)
+            VALUES (?, ?, ?, ?, 'Working')
+            RETURNING staffID
+        """, (email, employment_date, position, wage))
+        staff_id = cursor.fetchone()[0]
+        self.conn.commit()
+        # remove_volunteer_if_staff may also have dropped a volunteer role
+        self.member_cache.invalidate(email)
+        return staff_id
+
+    # Fines
+
+    def fines(self, email):
+        return fines.fine_summary(self.conn, email)
+
+    def pay_fines(self, email, amount):
+        return fines.pay_fines(self.conn, email, amount)
+
+    # Reports
+
+    # Management report for the days start..end (default: the last 30 days)
+    def report(self, start=None, end=None):
+        return analytics.report(self.conn, start, end)
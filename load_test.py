@@ -0,0 +1,100 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# Load test for server.py: N client threads hitting a running server
+#
+#   python server.py --port 8080 &
+#   python load_test.py --clients 16 --requests 500 --query harry --query potter
+#
+# Mix: catalog searches and event listings, plus --write-ratio of borrow/return
+# pairs against --item (needs --email of an existing member).
+
+
+# One request -> (seconds, HTTP status)
+def call(url, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        status = error.code
+    return time.perf_counter() - started, status
+
+
+# p-th percentile of an already sorted list
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def client(args, seed, timings, statuses, lock):
+    rng = random.Random(seed)
+    local_timings, local_statuses = [], {}
+
+    for _ in range(args.requests):
+        roll = rng.random()
+        if args.email and args.item and roll < args.write_ratio:
+            calls = [(f"{args.url}/borrow", {"email": args.email, "item_id": args.item}),
+                     (f"{args.url}/return", {"email": args.email, "item_id": args.item})]
+        elif roll < 0.8:
+            calls = [(f"{args.url}/items?q={urllib.request.quote(rng.choice(args.query))}", None)]
+        else:
+            calls = [(f"{args.url}/events", None)]
+
+        for url, body in calls:
+            seconds, status = call(url, body)
+            local_timings.append(seconds)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+
+    with lock:
+        timings.extend(local_timings)
+        for status, count in local_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running library server")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--query", action="append", help="search text (repeatable)")
+    parser.add_argument("--email", help="member to borrow/return as")
+    parser.add_argument("--item", type=int, help="item to borrow/return")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of borrow/return pairs")
+    args = parser.parse_args(argv)
+    args.url = args.url.rstrip("/")
+    args.query = args.query or ["the"]
+
+    timings, statuses, lock = [], {}, threading.Lock()
+    threads = [threading.Thread(target=client, args=(args, seed, timings, statuses, lock))
+               for seed in range(args.clients)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    print(f"✅ {len(timings)} requests from {args.clients} clients in {elapsed:.2f}s "
+          f"-> {len(timings) / elapsed:.0f} req/s")
+    print(f"   latency p50 {percentile(timings, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(timings, 95) * 1000:.1f} ms, p99 {percentile(timings, 99) * 1000:.1f} ms")
+    print("   status " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
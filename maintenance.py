@@ -0,0 +1,447 @@
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from records import LibraryError, Record
+from schema import ensure_schema
+from transactions import immediate_transaction
+
+# Backups and upkeep for library.db, safe to run while the desk is open
+#
+#   python maintenance.py snapshot --gzip        # consistent copy into snapshots/
+#   python maintenance.py restore snapshots/library-20261018-020000.db.gz
+#   python maintenance.py nightly                # from cron: whatever is due
+#   python maintenance.py stats
+#
+# Snapshots use SQLite's online backup API, BACKUP_PAGES pages per step with a
+# short pause in between. In WAL mode (the server's) the steps all run inside
+# one read transaction: the copy is of one committed state, and writers carry
+# on meanwhile. In rollback-journal mode a step holds the read lock only while
+# it runs, so a checkout waits milliseconds, not for the whole copy; but a
+# write from another connection restarts the copy from the first page. After
+# MAX_RESTARTS of those the rest is copied in one step, or a busy desk would
+# keep it from ever finishing.
+# The copy goes to a .partial file and is renamed once checked -> A snapshot on
+# disk is always complete. Compression runs afterwards, off the live database.
+#
+# Restore goes through the backup API too, into the live file: other
+# connections (e.g. the server's) see the restored data on their next
+# statement instead of a file swapped under them. The current database is
+# snapshotted first unless told otherwise.
+#
+# VACUUM INTO writes a compacted copy (no free pages, tables and indexes laid
+# out in order) -> The nightly job makes that its snapshot once a week, or
+# when a lot of the file is free pages. ANALYZE refreshes the planner's
+# statistics; PRAGMA optimize does the same only for tables that need it.
+
+# Pages copied per backup step (1 MB with 4 KB pages)
+BACKUP_PAGES = 256
+
+# Pause between backup steps (s) -> Writers get the database in between
+BACKUP_PAUSE = 0.005
+
+# Restarts (rollback-journal mode) before the rest is copied in one step
+MAX_RESTARTS = 3
+
+SNAPSHOT_DIR = "snapshots"
+
+# Snapshots kept by --keep / nightly (oldest removed first)
+KEEP_SNAPSHOTS = 14
+
+# Nightly: compacted snapshot (VACUUM INTO) every this many days,
+# or sooner when this share of the file is free pages
+VACUUM_EVERY_DAYS = 7
+VACUUM_FREELIST_RATIO = 0.25
+
+# Nightly: full ANALYZE every this many days, PRAGMA optimize the other nights
+ANALYZE_EVERY_DAYS = 7
+
+# Rows PRAGMA optimize looks at per index (keeps it quick on big tables)
+OPTIMIZE_ANALYSIS_LIMIT = 1000
+
+
+# Snapshot that is missing, unreadable or fails its integrity check
+class MaintenanceError(LibraryError):
+    pass
+
+
+# Raised from the backup progress callback to give up on stepping
+class _TooManyRestarts(Exception):
+    pass
+
+
+# Size of a database file
+class DatabaseStats(Record):
+    __slots__ = ("page_size", "pages", "freelist", "bytes", "journal_mode")
+
+
+# What one job did
+class MaintenanceReport(Record):
+    __slots__ = ("job", "path", "pages", "freelist", "bytes", "seconds")
+
+
+def database_stats(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    return DatabaseStats(page_size, pages, freelist, page_size * pages, journal_mode)
+
+
+# Path of the main database file of a connection
+def database_path(conn):
+    for _, name, path in conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return Path(path) if path else None
+
+
+# Newest first: [(job, ranAt, seconds, pages, freelist, bytes, path)]
+def maintenance_log(conn, limit=20):
+    return conn.execute("""
+        SELECT job, ranAt, seconds, pages, freelist, bytes, path
+        FROM MaintenanceLog
+        ORDER BY logID DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+# When `job` last ran (datetime), None if never
+def last_run(conn, job):
+    ran_at = conn.execute("SELECT MAX(ranAt) FROM MaintenanceLog WHERE job = ?", (job,)).fetchone()[0]
+    return datetime.fromisoformat(ran_at) if ran_at else None
+
+
+def _log(conn, report):
+    with immediate_transaction(conn):
+        conn.execute("""
+            INSERT INTO MaintenanceLog (job, ranAt, seconds, pages, freelist, bytes, path)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (report.job, datetime.now().isoformat(timespec="seconds"), round(report.seconds, 3),
+              report.pages, report.freelist, report.bytes, str(report.path) if report.path else None))
+
+
+def _snapshot_name(conn, label=None):
+    stem = (database_path(conn) or Path("library.db")).stem
+    name = f"{stem}-{datetime.now():%Y%m%d-%H%M%S}"
+    return f"{name}-{label}.db" if label else f"{name}.db"
+
+
+# Raises MaintenanceError unless the database at `path` passes PRAGMA quick_check
+def _check(path):
+    try:
+        check = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            result = check.execute("PRAGMA quick_check").fetchone()[0]
+            pages = check.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            check.close()
+    except sqlite3.DatabaseError as error:
+        raise MaintenanceError(f"{path} is not a readable database ({error}).")
+    if result != "ok":
+        raise MaintenanceError(f"{path} failed its integrity check: {result}")
+    return pages
+
+
+# file -> file.gz, streamed; the original is removed
+def _compress(path):
+    target = path.with_name(path.name + ".gz")
+    partial = target.with_name(target.name + ".partial")
+    with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as destination:
+        shutil.copyfileobj(source, destination, 1 << 20)
+    os.replace(partial, target)
+    path.unlink()
+    return target
+
+
+# Copies the live database into `out_dir` -> MaintenanceReport
+# progress(copied_pages, total_pages) is called after every step
+def snapshot(conn, out_dir=SNAPSHOT_DIR, compress=False, pages=BACKUP_PAGES, pause=BACKUP_PAUSE,
+             progress=None, label=None, log=True):
+    started = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / _snapshot_name(conn, label)
+    partial = path.with_name(path.name + ".partial")
+
+    copied = restarts = 0
+
+    def step(status, remaining, total):
+        nonlocal copied, restarts
+        # Every step moves forward -> Fewer pages done than last time means it started over
+        if remaining and copied and total - remaining <= copied:
+            restarts += 1
+            if restarts >= MAX_RESTARTS:
+                raise _TooManyRestarts()
+        copied = total - remaining
+        if progress:
+            progress(copied, total)
+        if pause and remaining:
+            time.sleep(pause)
+
+    stats = database_stats(conn)
+    wal = stats.journal_mode == "wal"
+    destination = sqlite3.connect(partial)
+    try:
+        conn.commit()
+        if wal:
+            conn.execute("BEGIN")
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            conn.backup(destination, pages=pages, progress=step)
+        except _TooManyRestarts:
+            conn.backup(destination, pages=-1, progress=step)
+        finally:
+            if wal:
+                conn.rollback()
+        # The copy comes out in the live file's journal mode; a WAL-mode
+        # snapshot would leave -wal / -shm files next to it when it is checked
+        if wal:
+            destination.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        destination.close()
+
+    snapshot_pages = _check(partial)
+    os.replace(partial, path)
+    if compress:
+        path = _compress(path)
+
+    report = MaintenanceReport("snapshot", path, snapshot_pages, stats.freelist, path.stat().st_size,
+                               time.perf_counter() - started)
+    if log:
+        _log(conn, report)
+    return report
+
+
+# Compacted copy of the live database (VACUUM INTO) -> MaintenanceReport
+# Holds one read transaction for the whole copy: in WAL mode writers carry on,
+# in rollback-journal mode they wait for it
+def vacuum_into(conn, out_dir=SNAPSHOT_DIR, compress=False):
+    started = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / _snapshot_name(conn, "vacuum")
+    partial = path.with_name(path.name + ".partial")
+    if partial.exists():
+        partial.unlink()
+
+    freelist = database_stats(conn).freelist
+    conn.commit()
+    conn.execute("VACUUM INTO ?", (str(partial),))
+    pages = _check(partial)
+    os.replace(partial, path)
+    if compress:
+        path = _compress(path)
+
+    report = MaintenanceReport("vacuum", path, pages, freelist, path.stat().st_size, time.perf_counter() - started)
+    _log(conn, report)
+    return report
+
+
+# Replaces the live database with a snapshot (plain or .gz) -> MaintenanceReport
+# The snapshot is checked before anything is overwritten
+def restore(conn, snapshot_path, progress=None):
+    started = time.perf_counter()
+    snapshot_path = Path(snapshot_path)
+    if not snapshot_path.is_file():
+        raise MaintenanceError(f"No snapshot at {snapshot_path}.")
+
+    unpacked = None
+    source_path = snapshot_path
+    if snapshot_path.suffix == ".gz":
+        target_dir = (database_path(conn) or snapshot_path).parent
+        handle, name = tempfile.mkstemp(suffix=".db", dir=target_dir)
+        unpacked = Path(name)
+        try:
+            with os.fdopen(handle, "wb") as destination, gzip.open(snapshot_path, "rb") as source:
+                shutil.copyfileobj(source, destination, 1 << 20)
+        except (OSError, EOFError) as error:
+            unpacked.unlink()
+            raise MaintenanceError(f"Could not unpack {snapshot_path} ({error}).")
+        source_path = unpacked
+
+    try:
+        pages = _check(source_path)
+        source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+        try:
+            conn.commit()
+            # All pages in one step -> One short exclusive lock instead of many
+            source.backup(conn, pages=-1, progress=(lambda status, remaining, total: progress(total - remaining, total))
+                          if progress else None)
+        finally:
+            source.close()
+    finally:
+        if unpacked:
+            unpacked.unlink()
+
+    # An older snapshot may predate some migrations
+    ensure_schema(conn)
+    stats = database_stats(conn)
+    report = MaintenanceReport("restore", snapshot_path, pages, stats.freelist, stats.bytes,
+                               time.perf_counter() - started)
+    _log(conn, report)
+    return report
+
+
+# Planner statistics: full ANALYZE, or PRAGMA optimize (only tables that need it)
+def analyze(conn, full=True):
+    started = time.perf_counter()
+    conn.commit()
+    if full:
+        conn.execute("ANALYZE")
+    else:
+        conn.execute(f"PRAGMA analysis_limit = {OPTIMIZE_ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize")
+    conn.commit()
+    stats = database_stats(conn)
+    report = MaintenanceReport("analyze" if full else "optimize", None, stats.pages, stats.freelist, stats.bytes,
+                               time.perf_counter() - started)
+    _log(conn, report)
+    return report
+
+
+# Removes all but the newest `keep` snapshots of this database in `out_dir`
+# (restore safety copies included) -> Paths removed
+def prune_snapshots(conn, out_dir=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS):
+    stem = (database_path(conn) or Path("library.db")).stem
+    snapshots = sorted(path for pattern in (f"{stem}-*.db", f"{stem}-*.db.gz")
+                       for path in Path(out_dir).glob(pattern))
+    removed = snapshots[:max(0, len(snapshots) - keep)]
+    for path in removed:
+        path.unlink()
+    return removed
+
+
+def _days_since(conn, job, now):
+    ran_at = last_run(conn, job)
+    return None if ran_at is None else (now - ran_at).total_seconds() / 86400
+
+
+# The nightly run -> [MaintenanceReport] for the jobs that ran
+#   snapshot  -> Every night; a compacted one (VACUUM INTO) when that is due
+#   statistics -> Full ANALYZE when due, PRAGMA optimize otherwise
+def nightly(conn, out_dir=SNAPSHOT_DIR, keep=KEEP_SNAPSHOTS, compress=True, progress=None, now=None):
+    now = now or datetime.now()
+    stats = database_stats(conn)
+    reports = []
+
+    since_vacuum = _days_since(conn, "vacuum", now)
+    if (since_vacuum is None or since_vacuum >= VACUUM_EVERY_DAYS
+            or stats.freelist >= VACUUM_FREELIST_RATIO * stats.pages):
+        reports.append(vacuum_into(conn, out_dir, compress))
+    else:
+        reports.append(snapshot(conn, out_dir, compress, progress=progress))
+
+    since_analyze = _days_since(conn, "analyze", now)
+    reports.append(analyze(conn, full=since_analyze is None or since_analyze >= ANALYZE_EVERY_DAYS))
+
+    prune_snapshots(conn, out_dir, keep)
+    return reports
+
+
+def print_progress(copied, total):
+    print(f"\r⏳ {copied}/{total} pages copied", end="", flush=True)
+
+
+def _size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def print_report(report):
+    where = f" -> {report.path}" if report.path else ""
+    print(f"✅ {report.job}: {report.pages} pages, {report.freelist} free, "
+          f"{_size(report.bytes)} in {report.seconds:.2f}s{where}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library database backups and upkeep")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snap = commands.add_parser("snapshot", help="online copy of the database")
+    snap.add_argument("--dir", default=SNAPSHOT_DIR, help=f"where snapshots go (default: {SNAPSHOT_DIR})")
+    snap.add_argument("--gzip", action="store_true", help="compress the snapshot")
+    snap.add_argument("--pages", type=int, default=BACKUP_PAGES, help="pages copied per step")
+    snap.add_argument("--pause", type=float, default=BACKUP_PAUSE, help="pause between steps (s)")
+    snap.add_argument("--keep", type=int, help="then remove all but the newest KEEP snapshots")
+
+    rest = commands.add_parser("restore", help="replace the database with a snapshot")
+    rest.add_argument("snapshot", help="snapshot file (.db or .db.gz)")
+    rest.add_argument("--dir", default=SNAPSHOT_DIR, help="where the safety copy goes")
+    rest.add_argument("--no-safety-copy", action="store_true", help="don't snapshot the current database first")
+
+    vacuum = commands.add_parser("vacuum", help="compacted copy of the database (VACUUM INTO)")
+    vacuum.add_argument("--dir", default=SNAPSHOT_DIR, help=f"where the copy goes (default: {SNAPSHOT_DIR})")
+    vacuum.add_argument("--gzip", action="store_true", help="compress the copy")
+
+    commands.add_parser("analyze", help="refresh the query planner's statistics (ANALYZE)")
+    commands.add_parser("optimize", help="PRAGMA optimize")
+
+    night = commands.add_parser("nightly", help="snapshot and statistics, whichever are due")
+    night.add_argument("--dir", default=SNAPSHOT_DIR, help=f"where snapshots go (default: {SNAPSHOT_DIR})")
+    night.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="snapshots kept")
+
+    commands.add_parser("stats", help="page counts, free pages and recent runs")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    try:
+        if args.command == "snapshot":
+            report = snapshot(conn, args.dir, args.gzip, args.pages, args.pause, print_progress)
+            print()
+            print_report(report)
+            if args.keep is not None:
+                for path in prune_snapshots(conn, args.dir, args.keep):
+                    print(f"🗑️  Removed {path}")
+
+        elif args.command == "restore":
+            if not args.no_safety_copy:
+                report = snapshot(conn, args.dir, compress=True, label="before-restore")
+                print(f"💾 Current database saved to {report.path}")
+            report = restore(conn, args.snapshot, print_progress)
+            print()
+            print_report(report)
+
+        elif args.command == "vacuum":
+            print_report(vacuum_into(conn, args.dir, args.gzip))
+
+        elif args.command in ("analyze", "optimize"):
+            print_report(analyze(conn, full=args.command == "analyze"))
+
+        elif args.command == "nightly":
+            for report in nightly(conn, args.dir, args.keep, progress=print_progress):
+                if report.job == "snapshot":
+                    print()
+                print_report(report)
+
+        elif args.command == "stats":
+            stats = database_stats(conn)
+            print(f"📊 {database_path(conn)}: {stats.pages} pages of {stats.page_size} bytes "
+                  f"({_size(stats.bytes)}), {stats.freelist} free "
+                  f"({stats.freelist / stats.pages:.1%}), journal mode {stats.journal_mode}")
+            log = maintenance_log(conn)
+            if log:
+                print("\nRecent runs:")
+            for job, ran_at, seconds, pages, freelist, size, path in log:
+                print(f"  {ran_at}  {job:<9} {seconds:>8.2f}s  {pages} pages, {freelist} free, "
+                      f"{_size(size or 0)}  {path or ''}")
+    except (MaintenanceError, sqlite3.Error, OSError) as error:
+        print(f"\n❌ {error}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
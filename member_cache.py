@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import OrderedDict
+
+from records import Record
+
+# In-process cache of member profiles (MemberProfile: details + staff/volunteer roles)
+#
+# Bounded LRU with a time-to-live. "No such member" is cached too, so a bad
+# email typed twice costs one query. Writers in this process invalidate the
+# entry they change; the TTL bounds how stale an entry can get when another
+# process (or the server's other writer) changes a member.
+
+MAX_SIZE = 1024
+
+# Seconds an entry stays valid
+TTL_SECONDS = 300
+
+# Cached "no such member"
+_MISSING = object()
+
+
+class CacheStats(Record):
+    __slots__ = ("size", "hits", "misses", "evictions", "invalidations")
+
+
+class MemberCache:
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL_SECONDS, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every invalidation -> A load that raced with a write isn't stored
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    # Cached profile for `email`, or load(email) (-> MemberProfile or None) on a miss
+    def get(self, email, load):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(email)
+                self.hits += 1
+                return None if entry[0] is _MISSING else entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        # Load outside the lock -> A slow query doesn't hold up other threads
+        profile = load(email)
+
+        with self._lock:
+            if generation != self._generation:
+                return profile
+            self._entries[email] = (_MISSING if profile is None else profile, now + self.ttl)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return profile
+
+    # Drops `email` so the next get() reads the database
+    def invalidate(self, email):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(email, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(len(self._entries), self.hits, self.misses, self.evictions, self.invalidations)
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from replica import MAX_STALENESS_SECONDS, replica_lag
+from schema import ensure_schema
+
+# Connection pool for concurrent use of library.db (e.g. the HTTP server)
+#
+#   readers -> One connection per thread, opened on first use, read-only
+#   writer  -> One shared connection; callers take turns through a lock
+#   replica readers -> Like readers, but on a read replica (replica.py); each
+#              thread sticks to one, the threads are spread over all of them
+#
+# WAL mode lets the readers run alongside the writer instead of waiting on it.
+# A replica is only read while it is no more than max_staleness seconds behind
+# the primary; otherwise replica_reader() hands out the primary reader.
+
+# How long a connection waits on a locked database before giving up (ms)
+BUSY_TIMEOUT_MS = 5000
+
+
+class ConnectionPool:
+    def __init__(self, db_path="library.db", busy_timeout=BUSY_TIMEOUT_MS, replicas=(),
+                 max_staleness=MAX_STALENESS_SECONDS):
+        self.db_path = Path(db_path).resolve()
+        self.busy_timeout = busy_timeout
+        self.replicas = [Path(path).resolve() for path in replicas]
+        self.max_staleness = max_staleness
+        self._replica_turn = 0
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        # The writer brings the schema up to date and switches the file to WAL
+        # (journal_mode is stored in the file, so the readers inherit it)
+        self._writer = self._connect(check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        ensure_schema(self._writer)
+
+    def _connect(self, path=None, **connect_args):
+        conn = sqlite3.connect(path or self.db_path, timeout=self.busy_timeout / 1000, **connect_args)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        # In WAL mode NORMAL only syncs at checkpoints -> Still safe against corruption
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    # This thread's read connection (writes on it fail with "attempt to write a readonly database")
+    def reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only ever used by this thread; check_same_thread is off so close() can close it
+            conn = self._connect(check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    # This thread's connection to a replica, if it is recent enough for
+    # max_staleness; no replicas or too far behind -> reader()
+    # The follower writes to the replicas -> Fine for searches and listings,
+    # not for reading back what this request just wrote
+    def replica_reader(self):
+        if not self.replicas:
+            return self.reader()
+        conn = getattr(self._local, "replica", None)
+        if conn is None:
+            with self._readers_lock:
+                path = self.replicas[self._replica_turn % len(self.replicas)]
+                self._replica_turn += 1
+            conn = self._connect(path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self._local.replica = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+
+        lag = replica_lag(conn)
+        if lag is None or lag > self.max_staleness:
+            return self.reader()
+        return conn
+
+    # The write connection, held by one caller at a time:
+    #   with pool.writer() as conn:
+    #       checkout(conn, email, item_id)
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                raise
+            if self._writer.in_transaction:
+                self._writer.commit()
+
+    # Number of read connections opened so far
+    def reader_count(self):
+        with self._readers_lock:
+            return len(self._readers)
+
+    # Closes every connection; only call once no thread is using the pool
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
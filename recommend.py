@@ -0,0 +1,510 @@
+import argparse
+import json
+import math
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+from records import Event, Item, LibraryError, Record
+from schema import ensure_schema
+from transactions import immediate_transaction
+
+try:
+    import numpy as np
+except ImportError:  # Only the batch build needs it
+    np = None
+
+# "Members who borrowed this also borrowed ..." for items and events
+#
+#   python recommend.py build      # nightly: recount everything (needs NumPy)
+#   python recommend.py update     # every few minutes: fold in new loans / sign-ups
+#
+# Two items are neighbours when the same members borrowed both; the score is
+# the co-borrow count scaled by how popular each is (cosine similarity:
+# together / sqrt(borrowers_a * borrowers_b)), so bestsellers don't top every
+# list. Events work the same way from Attends, keeping only upcoming events
+# as neighbours (nothing else can be recommended).
+#
+# The build counts every pair with NumPy (one member's recent items at a time,
+# vectorized) and keeps the TOP_K best neighbours of each item in
+# ItemNeighbours / EventNeighbours -> A recommendation is one indexed lookup.
+# Between builds, update() adds the pairs each new loan makes (checkpointed by
+# borrowID / attendID). Those scores use the counts at the time of the
+# loan and a new pair starts from its own count, so they drift a little until
+# the next build puts them right.
+#
+# History (a member's loans / sign-ups, the build's pair counts) is read
+# through LoanHistory / AttendanceHistory, so archived rows (archive.py) still
+# count. update() only ever sees new rows, which are never archived.
+
+# Neighbours kept per item / event
+TOP_K = 20
+
+# A member's most recent items (or events) that pair up -> Bounds what one
+# heavy borrower adds (HISTORY^2 pairs) and favours current tastes
+HISTORY = 50
+
+# Rows read per NumPy block in the build
+BLOCK_ROWS = 200_000
+
+# New loans / sign-ups folded per transaction in update()
+UPDATE_CHUNK_SIZE = 500
+
+ITEM_JOB = 'item_neighbours'
+EVENT_JOB = 'event_neighbours'
+
+
+class RecommendError(LibraryError):
+    pass
+
+
+# Summary of a build / update run (rows = loans or sign-ups read)
+class RecommendReport(Record):
+    __slots__ = ("job", "rows", "pairs", "neighbours", "seconds")
+
+
+def _require_numpy():
+    if np is None:
+        raise RecommendError("The batch build needs NumPy (pip install numpy). "
+                             "'update' works without it, one loan at a time.")
+
+
+def _today():
+    return date.today().strftime("%Y-%m-%d")
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+# Lookups
+
+# Items the member hasn't borrowed, best first, from the neighbours of their recent loans
+def recommend_items(conn, email, limit=10, history=HISTORY):
+    rows = conn.execute("""
+        WITH recent AS (
+            SELECT itemID, MAX(borrowID) AS latest FROM LoanHistory
+            WHERE email = ? AND itemID IS NOT NULL
+            GROUP BY itemID
+            ORDER BY latest DESC
+            LIMIT ?
+        ),
+        ranked AS (
+            SELECT n.neighbourID, SUM(n.score) AS score
+            FROM recent
+            JOIN ItemNeighbours n ON n.itemID = recent.itemID
+            WHERE n.neighbourID NOT IN (SELECT itemID FROM LoanHistory WHERE email = ?)
+            GROUP BY n.neighbourID
+            ORDER BY score DESC, n.neighbourID
+            LIMIT ?
+        )
+        SELECT Item.itemID, Item.name, Item.author, Item.category, Item.genre, Item.status
+        FROM ranked
+        JOIN Item ON Item.itemID = ranked.neighbourID
+        ORDER BY ranked.score DESC, ranked.neighbourID
+    """, (email, history, email, limit)).fetchall()
+    return [Item(*row) for row in rows]
+
+
+# Items most often borrowed by the same members as `item_id`
+def similar_items(conn, item_id, limit=10):
+    rows = conn.execute("""
+        SELECT Item.itemID, Item.name, Item.author, Item.category, Item.genre, Item.status
+        FROM ItemNeighbours n
+        JOIN Item ON Item.itemID = n.neighbourID
+        WHERE n.itemID = ?
+        ORDER BY n.score DESC, n.neighbourID
+        LIMIT ?
+    """, (item_id, limit)).fetchall()
+    return [Item(*row) for row in rows]
+
+
+# Upcoming events the member isn't signed up for, from the neighbours of events they attended
+def recommend_events(conn, email, today=None, limit=10, history=HISTORY):
+    rows = conn.execute("""
+        WITH recent AS (
+            SELECT eventID FROM AttendanceHistory
+            WHERE email = ?
+            ORDER BY attendID DESC
+            LIMIT ?
+        ),
+        ranked AS (
+            SELECT n.neighbourID, SUM(n.score) AS score
+            FROM recent
+            JOIN EventNeighbours n ON n.eventID = recent.eventID
+            WHERE n.neighbourID NOT IN (SELECT eventID FROM AttendanceHistory WHERE email = ?)
+            GROUP BY n.neighbourID
+        )
+        SELECT e.eventID, e.name, e.scheduledTime, e.scheduledDate, e.targetAudience
+        FROM ranked
+        JOIN Events e ON e.eventID = ranked.neighbourID
+        WHERE e.scheduledDate >= ?
+        ORDER BY ranked.score DESC, ranked.neighbourID
+        LIMIT ?
+    """, (email, history, email, today or _today(), limit)).fetchall()
+    return [Event(*row) for row in rows]
+
+
+# Batch build (NumPy)
+
+# (member, id, recent) rows sorted by member -> NumPy blocks that never split a member
+def _member_blocks(cursor, block_rows=BLOCK_ROWS):
+    carry = []
+    while True:
+        rows = cursor.fetchmany(block_rows)
+        if not rows:
+            break
+        rows = carry + rows
+        split = len(rows)
+        while split and rows[split - 1][0] == rows[-1][0]:
+            split -= 1
+        carry = rows[split:]
+        if split:
+            yield np.array(rows[:split], dtype=np.int64)
+    if carry:
+        yield np.array(carry, dtype=np.int64)
+
+
+# Every ordered pair (a, b), a != b, of values within the same group
+# (groups sorted) -> (left, right), without a Python loop per member
+def _pairs(groups, values):
+    if len(groups) == 0:
+        return values[:0], values[:0]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    group_of = np.repeat(np.arange(len(starts)), sizes)
+
+    # Each value pairs with every value of its group (itself dropped below)
+    reps = sizes[group_of]
+    left = np.repeat(values, reps)
+    run_starts = np.repeat(np.cumsum(reps) - reps, reps)
+    right = values[np.repeat(starts[group_of], reps) + np.arange(len(left)) - run_starts]
+
+    keep = left != right
+    return left[keep], right[keep]
+
+
+# Members per id and co-occurrence counts per (id, neighbour) pair
+# -> (members, left, right, together); pairs are encoded as left * size + right
+#    and counted with np.unique, merging block by block
+def _count_pairs(blocks, size, history):
+    members = np.zeros(size, dtype=np.int64)
+    pair_keys = np.empty(0, dtype=np.int64)
+    pair_counts = np.empty(0, dtype=np.int64)
+
+    for block in blocks:
+        members += np.bincount(block[:, 1], minlength=size)
+        recent = block[block[:, 2] <= history]
+        left, right = _pairs(recent[:, 0], recent[:, 1])
+        keys, counts = np.unique(left * size + right, return_counts=True)
+
+        pair_keys, inverse = np.unique(np.concatenate([pair_keys, keys]), return_inverse=True)
+        pair_counts = np.bincount(inverse, weights=np.concatenate([pair_counts, counts]),
+                                  minlength=len(pair_keys)).astype(np.int64)
+
+    return members, pair_keys // size, pair_keys % size, pair_counts
+
+
+# Best `k` neighbours of each id (score, then neighbour id, for ties)
+def _top_k(left, right, together, score, k):
+    order = np.lexsort((right, -score, left))
+    left, right, together, score = left[order], right[order], together[order], score[order]
+    if len(left) == 0:
+        return left, right, together, score
+
+    starts = np.flatnonzero(np.r_[True, left[1:] != left[:-1]])
+    rank = np.arange(len(left)) - np.repeat(starts, np.diff(np.r_[starts, len(left)]))
+    keep = rank < k
+    return left[keep], right[keep], together[keep], score[keep]
+
+
+def _save_checkpoint(cursor, job, last_id, built):
+    now = _now()
+    cursor.execute("""
+        INSERT INTO RecommendCheckpoint (job, lastID, builtAt, updatedAt) VALUES (?, ?, ?, ?)
+        ON CONFLICT (job) DO UPDATE SET
+            lastID = excluded.lastID,
+            builtAt = COALESCE(excluded.builtAt, RecommendCheckpoint.builtAt),
+            updatedAt = excluded.updatedAt
+    """, (job, last_id, now if built else None, now))
+
+
+def _checkpoint(cursor, job):
+    cursor.execute("SELECT lastID FROM RecommendCheckpoint WHERE job = ?", (job,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+# Rewrites ItemNeighbours / ItemBorrowers from the whole loan history
+def build_item_neighbours(conn, k=TOP_K, history=HISTORY):
+    _require_numpy()
+    started = time.perf_counter()
+
+    # Highest borrowID first -> Loans made during the build are left to update()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(borrowID), 0), COALESCE((SELECT MAX(itemID) FROM Item), 0) FROM BorrowTransactions")
+    last_id, max_item = cursor.fetchone()
+
+    # Each member's distinct items, numbered most recent first
+    cursor.execute("""
+        SELECT DENSE_RANK() OVER (ORDER BY email), itemID, recent
+        FROM (
+            SELECT email, itemID, ROW_NUMBER() OVER (PARTITION BY email ORDER BY MAX(borrowID) DESC) AS recent
+            FROM LoanHistory
+            WHERE borrowID <= ? AND email IS NOT NULL AND itemID <= ?
+            GROUP BY email, itemID
+        )
+        ORDER BY 1
+    """, (last_id, max_item))
+    borrowers, left, right, together = _count_pairs(_member_blocks(cursor), max_item + 1, history)
+    rows = int(borrowers.sum())
+
+    score = together / np.sqrt(borrowers[left] * borrowers[right])
+    pairs = len(left)
+    left, right, together, score = _top_k(left, right, together, score, k)
+    items = np.flatnonzero(borrowers)
+
+    with immediate_transaction(conn):
+        cursor.execute("DELETE FROM ItemNeighbours")
+        cursor.executemany("INSERT INTO ItemNeighbours (itemID, neighbourID, together, score) VALUES (?, ?, ?, ?)",
+                           zip(left.tolist(), right.tolist(), together.tolist(), score.tolist()))
+        cursor.execute("DELETE FROM ItemBorrowers")
+        cursor.executemany("INSERT INTO ItemBorrowers (itemID, borrowers) VALUES (?, ?)",
+                           zip(items.tolist(), borrowers[items].tolist()))
+        _save_checkpoint(cursor, ITEM_JOB, last_id, built=True)
+
+    return RecommendReport(ITEM_JOB, rows, pairs, len(left), time.perf_counter() - started)
+
+
+# Rewrites EventNeighbours from every sign-up (neighbours: upcoming events only)
+def build_event_neighbours(conn, today=None, k=TOP_K, history=HISTORY):
+    _require_numpy()
+    started = time.perf_counter()
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE((SELECT MAX(attendID) FROM Attends), 0), COALESCE(MAX(eventID), 0) FROM Events")
+    last_id, max_event = cursor.fetchone()
+    size = max_event + 1
+
+    cursor.execute("SELECT eventID FROM Events WHERE scheduledDate >= ?", (today or _today(),))
+    upcoming = np.zeros(size, dtype=bool)
+    upcoming[np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)] = True
+
+    cursor.execute("""
+        SELECT DENSE_RANK() OVER (ORDER BY email), eventID,
+               ROW_NUMBER() OVER (PARTITION BY email ORDER BY attendID DESC)
+        FROM AttendanceHistory
+        WHERE attendID <= ? AND eventID <= ?
+        ORDER BY 1
+    """, (last_id, max_event))
+    attendees, left, right, together = _count_pairs(_member_blocks(cursor), size, history)
+    rows = int(attendees.sum())
+
+    keep = upcoming[right]
+    left, right, together = left[keep], right[keep], together[keep]
+    score = together / np.sqrt(attendees[left] * attendees[right])
+    pairs = len(left)
+    left, right, together, score = _top_k(left, right, together, score, k)
+
+    with immediate_transaction(conn):
+        cursor.execute("DELETE FROM EventNeighbours")
+        cursor.executemany("INSERT INTO EventNeighbours (eventID, neighbourID, together, score) VALUES (?, ?, ?, ?)",
+                           zip(left.tolist(), right.tolist(), together.tolist(), score.tolist()))
+        _save_checkpoint(cursor, EVENT_JOB, last_id, built=True)
+
+    return RecommendReport(EVENT_JOB, rows, pairs, len(left), time.perf_counter() - started)
+
+
+# Incremental updates (no NumPy)
+
+# Adds one co-occurrence to each (id, neighbour, norm) pair; norm = sqrt(count_a * count_b)
+def _bump(cursor, table, key, pairs):
+    cursor.executemany(f"""
+        INSERT INTO {table} ({key}, neighbourID, together, score) VALUES (:a, :b, 1, 1.0 / :norm)
+        ON CONFLICT ({key}, neighbourID) DO UPDATE SET
+            together = together + 1,
+            score = (together + 1) / :norm
+    """, [{"a": a, "b": b, "norm": norm} for a, b, norm in pairs])
+
+
+# Cuts the neighbour lists of `ids` back to the best k
+def _trim(cursor, table, key, ids, k):
+    cursor.executemany(f"""
+        DELETE FROM {table}
+        WHERE {key} = ? AND neighbourID NOT IN (
+            SELECT neighbourID FROM {table} WHERE {key} = ? ORDER BY score DESC, neighbourID LIMIT ?
+        )
+    """, [(id_, id_, k) for id_ in ids])
+
+
+def _norm(count_a, count_b):
+    return math.sqrt(max(count_a, 1) * max(count_b, 1))
+
+
+# Folds loans made since the last build / update into ItemNeighbours.
+# Never built -> Starts from the first loan (slow on a big history, but needs no NumPy)
+def update_item_neighbours(conn, k=TOP_K, history=HISTORY, chunk_size=UPDATE_CHUNK_SIZE):
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    rows = pairs = 0
+
+    while True:
+        with immediate_transaction(conn):
+            last_id = _checkpoint(cursor, ITEM_JOB)
+            cursor.execute("""
+                SELECT borrowID, email, itemID FROM BorrowTransactions
+                WHERE borrowID > ?
+                ORDER BY borrowID
+                LIMIT ?
+            """, (last_id, chunk_size))
+            loans = cursor.fetchall()
+
+            touched = set()
+            for borrow_id, email, item_id in loans:
+                if email is None or item_id is None:
+                    continue
+
+                # The member's earlier items, most recent first (archived loans too)
+                cursor.execute("""
+                    SELECT itemID, MAX(borrowID) AS latest FROM LoanHistory
+                    WHERE email = ? AND borrowID < ? AND itemID IS NOT NULL
+                    GROUP BY itemID
+                    ORDER BY latest DESC
+                """, (email, borrow_id))
+                earlier = [row[0] for row in cursor.fetchall()]
+                # Borrowed it before -> No new member, no new pairs
+                if item_id in earlier:
+                    continue
+                recent = earlier[:history]
+
+                cursor.execute("""
+                    INSERT INTO ItemBorrowers (itemID, borrowers) VALUES (?, 1)
+                    ON CONFLICT (itemID) DO UPDATE SET borrowers = borrowers + 1
+                    RETURNING borrowers
+                """, (item_id,))
+                count = cursor.fetchone()[0]
+                if not recent:
+                    continue
+
+                cursor.execute("""
+                    SELECT ids.value, COALESCE(ItemBorrowers.borrowers, 1)
+                    FROM json_each(?) AS ids
+                    LEFT JOIN ItemBorrowers ON ItemBorrowers.itemID = ids.value
+                """, (json.dumps(recent),))
+                counts = dict(cursor.fetchall())
+
+                norms = [(other, _norm(count, counts[other])) for other in recent]
+                _bump(cursor, "ItemNeighbours", "itemID",
+                      [(item_id, other, norm) for other, norm in norms] +
+                      [(other, item_id, norm) for other, norm in norms])
+                pairs += 2 * len(recent)
+                touched.add(item_id)
+                touched.update(recent)
+
+            _trim(cursor, "ItemNeighbours", "itemID", touched, k)
+            if loans:
+                _save_checkpoint(cursor, ITEM_JOB, loans[-1][0], built=False)
+
+        rows += len(loans)
+        if len(loans) < chunk_size:
+            break
+
+    return RecommendReport(ITEM_JOB, rows, pairs, None, time.perf_counter() - started)
+
+
+# Folds sign-ups made since the last build / update into EventNeighbours
+def update_event_neighbours(conn, today=None, k=TOP_K, history=HISTORY, chunk_size=UPDATE_CHUNK_SIZE):
+    today = today or _today()
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    rows = pairs = 0
+
+    while True:
+        with immediate_transaction(conn):
+            last_id = _checkpoint(cursor, EVENT_JOB)
+            cursor.execute("""
+                SELECT a.attendID, a.email, a.eventID, e.scheduledDate >= ?, o.attendees
+                FROM Attends a
+                JOIN Events e ON e.eventID = a.eventID
+                LEFT JOIN EventOccupancy o ON o.eventID = a.eventID
+                WHERE a.attendID > ?
+                ORDER BY a.attendID
+                LIMIT ?
+            """, (today, last_id, chunk_size))
+            signups = cursor.fetchall()
+
+            touched = set()
+            for attend_id, email, event_id, is_upcoming, count in signups:
+                # The member's earlier events, most recent first (archived sign-ups too)
+                cursor.execute("""
+                    SELECT a.eventID, e.scheduledDate >= ?, COALESCE(o.attendees, 1)
+                    FROM AttendanceHistory a
+                    JOIN Events e ON e.eventID = a.eventID
+                    LEFT JOIN EventOccupancy o ON o.eventID = a.eventID
+                    WHERE a.email = ? AND a.attendID < ?
+                    ORDER BY a.attendID DESC
+                    LIMIT ?
+                """, (today, email, attend_id, history))
+
+                # Only upcoming events are kept as neighbours
+                batch = []
+                for other, other_upcoming, other_count in cursor.fetchall():
+                    norm = _norm(count or 1, other_count)
+                    if other_upcoming:
+                        batch.append((event_id, other, norm))
+                    if is_upcoming:
+                        batch.append((other, event_id, norm))
+                _bump(cursor, "EventNeighbours", "eventID", batch)
+                pairs += len(batch)
+                touched.update(a for a, _, _ in batch)
+
+            _trim(cursor, "EventNeighbours", "eventID", touched, k)
+            if signups:
+                _save_checkpoint(cursor, EVENT_JOB, signups[-1][0], built=False)
+
+        rows += len(signups)
+        if len(signups) < chunk_size:
+            break
+
+    return RecommendReport(EVENT_JOB, rows, pairs, None, time.perf_counter() - started)
+
+
+def print_report(report, verb):
+    neighbours = f", {report.neighbours} neighbours kept" if report.neighbours is not None else ""
+    print(f"✅ {verb} {report.job}: {report.rows} rows, {report.pairs} pairs{neighbours} in {report.seconds:.2f}s.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Item and event recommendations")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="recount all neighbours from the full history (needs NumPy)")
+    build.add_argument("--top-k", type=int, default=TOP_K, help="neighbours kept per item / event")
+    build.add_argument("--date", help="events on or after DATE count as upcoming (default: today)")
+    update = commands.add_parser("update", help="fold in loans and sign-ups since the last run")
+    update.add_argument("--top-k", type=int, default=TOP_K, help="neighbours kept per item / event")
+    update.add_argument("--date", help="events on or after DATE count as upcoming (default: today)")
+
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(Path(args.db).resolve())
+    ensure_schema(conn)
+
+    try:
+        if args.command == "build":
+            print_report(build_item_neighbours(conn, args.top_k), "Built")
+            print_report(build_event_neighbours(conn, args.date, args.top_k), "Built")
+        elif args.command == "update":
+            print_report(update_item_neighbours(conn, args.top_k), "Updated")
+            print_report(update_event_neighbours(conn, args.date, args.top_k), "Updated")
+    except RecommendError as error:
+        print(f"❌ {error}")
+        return 1
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
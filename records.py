@@ -0,0 +1,116 @@
+# Result records and errors shared by the library services.
+# Records use __slots__ -> No per-instance dict, cheap to create by the thousand.
+
+
+# Base for result records: positional or keyword construction, value equality,
+# readable repr, and as_dict() for JSON output
+class Record:
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self.__slots__):
+            raise TypeError(f"{type(self).__name__} takes at most {len(self.__slots__)} values")
+        values = dict(zip(self.__slots__, args))
+        for name, value in kwargs.items():
+            if name not in self.__slots__:
+                raise TypeError(f"{type(self).__name__} has no field '{name}'")
+            if name in values:
+                raise TypeError(f"{type(self).__name__} got '{name}' twice")
+            values[name] = value
+        missing = [name for name in self.__slots__ if name not in values]
+        if missing:
+            raise TypeError(f"{type(self).__name__} is missing {', '.join(missing)}")
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return {name: _plain(getattr(self, name)) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+# Nested records/lists -> plain dicts/lists
+def _plain(value):
+    if isinstance(value, Record):
+        return value.as_dict()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+class Member(Record):
+    __slots__ = ("email", "name", "birthday")
+
+
+# A member with their roles -> What the member cache holds
+class MemberProfile(Record):
+    __slots__ = ("email", "name", "birthday", "is_staff", "is_volunteer")
+
+
+class Item(Record):
+    __slots__ = ("item_id", "name", "author", "category", "genre", "status")
+
+
+class Event(Record):
+    __slots__ = ("event_id", "name", "scheduled_time", "scheduled_date", "target_audience")
+
+
+# An event with its room (None if not assigned)
+class EventDetails(Record):
+    __slots__ = ("event_id", "name", "scheduled_time", "scheduled_date", "target_audience", "room_num")
+
+
+# What a successful checkout hands back
+class CheckoutReceipt(Record):
+    __slots__ = ("borrow_id", "item_id", "item_name", "return_date")
+
+
+# One line of a batch report (checkout_many / checkin_many)
+class BatchResult(Record):
+    __slots__ = ("item_id", "ok", "message")
+
+
+# Outcome of an event sign-up: status 'Registered', 'Waitlisted' (position = place
+# in the queue, 1 = next in) or 'Rejected' (group bookings only)
+class RegistrationResult(Record):
+    __slots__ = ("email", "event_id", "status", "position", "message")
+
+
+# Seats of an event (capacity None -> no room assigned, no limit)
+class Seats(Record):
+    __slots__ = ("event_id", "capacity", "attendees", "waitlisted")
+
+
+# A hold on an item: status 'Waiting' (position = place in the queue, 1 = next
+# in) or 'Ready' (on the hold shelf until expires_at)
+class Hold(Record):
+    __slots__ = ("item_id", "item_name", "email", "status", "position", "expires_at")
+
+
+# A member's outstanding fines: total + one FineLine per loan (oldest first)
+class FineSummary(Record):
+    __slots__ = ("email", "total", "loans")
+
+
+class FineLine(Record):
+    __slots__ = ("borrow_id", "item_id", "item_name", "return_date", "loan_status", "amount")
+
+
+# Outcome of a fine payment
+class Payment(Record):
+    __slots__ = ("email", "paid", "remaining", "fines_cleared")
+
+
+# Base class for errors the desk should show -> str(error) is the message
+class LibraryError(Exception):
+    pass
+
+
+class MemberNotFound(LibraryError):
+    pass
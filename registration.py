@@ -0,0 +1,240 @@
+import json
+from datetime import date, datetime
+
+from records import LibraryError, MemberNotFound, RegistrationResult, Seats
+from transactions import immediate_transaction
+
+# Event sign-ups: room capacity, waitlist, group bookings
+#
+# Seats come from EventOccupancy (schema.py): attendee and waitlist counts kept
+# by triggers on Attends / EventWaitlist, capacity from the event's rooms. A
+# sign-up reads that one row instead of counting Attends, and runs inside BEGIN
+# IMMEDIATE -> Sign-ups queue for the write lock, so the seat check and the
+# insert can't interleave with another desk's and an event is never overbooked.
+# Cancelling a seat hands it to the head of the waitlist in the same transaction.
+
+# Base class for registration errors -> str(error) is the message to show
+class RegistrationError(LibraryError):
+    pass
+
+
+class EventNotFound(RegistrationError):
+    pass
+
+
+class EventPassed(RegistrationError):
+    pass
+
+
+# Already attending, or already on the waitlist
+class AlreadyRegistered(RegistrationError):
+    pass
+
+
+# No seats left and the member didn't ask to join the waitlist
+class EventFull(RegistrationError):
+    pass
+
+
+class NotRegistered(RegistrationError):
+    pass
+
+
+def _today():
+    return date.today().strftime("%Y-%m-%d")
+
+
+# Seats left (None -> no limit)
+def _free(capacity, attendees):
+    return None if capacity is None else max(0, capacity - attendees)
+
+
+# -> (name, scheduledDate, capacity, attendees, waitlisted)
+def _event_seats(cursor, event_id):
+    cursor.execute("""
+        SELECT e.name, e.scheduledDate, o.capacity, o.attendees, o.waitlisted
+        FROM Events e
+        JOIN EventOccupancy o ON o.eventID = e.eventID
+        WHERE e.eventID = ?
+    """, (event_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise EventNotFound("Event not found.")
+    return row
+
+
+# Place of a member in an event's waitlist (1 = next in), None if not on it
+def _waitlist_position(cursor, email, event_id):
+    cursor.execute("""
+        SELECT COUNT(*) FROM EventWaitlist
+        WHERE eventID = ?
+          AND waitID <= (SELECT waitID FROM EventWaitlist WHERE eventID = ? AND email = ?)
+    """, (event_id, event_id, email))
+    position = cursor.fetchone()[0]
+    return position or None
+
+
+# Moves the head of the waitlist into `free` seats (None -> everyone queued)
+# -> Emails promoted, in queue order
+def _promote(cursor, event_id, free):
+    if free == 0:
+        return []
+    cursor.execute("""
+        SELECT waitID, email FROM EventWaitlist
+        WHERE eventID = ?
+        ORDER BY waitID
+        LIMIT ?
+    """, (event_id, -1 if free is None else free))
+    queued = cursor.fetchall()
+    if queued:
+        cursor.executemany("DELETE FROM EventWaitlist WHERE waitID = ?", [(wait_id,) for wait_id, _ in queued])
+        cursor.executemany("INSERT OR IGNORE INTO Attends (email, eventID) VALUES (?, ?)",
+                           [(email, event_id) for _, email in queued])
+    return [email for _, email in queued]
+
+
+def _promoted(name, event_id, emails):
+    return [RegistrationResult(email, event_id, "Registered", None, f"Moved up from the waitlist for '{name}'.")
+            for email in emails]
+
+
+# Seats of an event, None if it doesn't exist
+def seats(conn, event_id):
+    row = conn.execute("""
+        SELECT eventID, capacity, attendees, waitlisted FROM EventOccupancy WHERE eventID = ?
+    """, (event_id,)).fetchone()
+    return Seats(*row) if row else None
+
+
+# Signs one member up -> RegistrationResult ('Registered' or 'Waitlisted')
+# Full event -> EventFull, or a place on the waitlist with waitlist=True
+def register(conn, email, event_id, today=None, waitlist=False):
+    today = today or _today()
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM Member WHERE email = ?", (email,))
+    if cursor.fetchone() is None:
+        raise MemberNotFound("No membership found with this email. Please create a membership first.")
+
+    with immediate_transaction(conn):
+        name, scheduled_date, capacity, attendees, waitlisted = _event_seats(cursor, event_id)
+        if scheduled_date < today:
+            raise EventPassed(f"You cannot register for '{name}' because the event has already passed.")
+
+        cursor.execute("SELECT 1 FROM Attends WHERE email = ? AND eventID = ?", (email, event_id))
+        if cursor.fetchone() is not None:
+            raise AlreadyRegistered("You are already registered for this event.")
+        position = _waitlist_position(cursor, email, event_id)
+        if position is not None:
+            raise AlreadyRegistered(f"You are already number {position} on the waitlist for this event.")
+
+        # Seats freed without a cancellation (e.g. a bigger room) -> The queue goes first
+        if waitlisted and _free(capacity, attendees) != 0:
+            promoted = len(_promote(cursor, event_id, _free(capacity, attendees)))
+            attendees, waitlisted = attendees + promoted, waitlisted - promoted
+
+        if waitlisted == 0 and _free(capacity, attendees) != 0:
+            cursor.execute("INSERT INTO Attends (email, eventID) VALUES (?, ?)", (email, event_id))
+            return RegistrationResult(email, event_id, "Registered", None, f"You are now registered for '{name}'.")
+
+        if not waitlist:
+            raise EventFull(f"'{name}' is full ({capacity} seats).")
+        cursor.execute("INSERT INTO EventWaitlist (eventID, email, addedAt) VALUES (?, ?, ?)",
+                       (event_id, email, datetime.now().isoformat(timespec="seconds")))
+        return RegistrationResult(email, event_id, "Waitlisted", waitlisted + 1,
+                                  f"'{name}' is full. You are number {waitlisted + 1} on the waitlist.")
+
+
+# Signs up a group (e.g. a school class) in a single transaction
+# -> One RegistrationResult per email, in the order given. Seats go in list
+#    order; the rest join the waitlist (waitlist=True) or are rejected.
+def register_group(conn, event_id, emails, today=None, waitlist=True):
+    today = today or _today()
+
+    # Repeats keep the first
+    unique = list(dict.fromkeys(emails))
+    repeats = []
+    seen = set()
+    for email in emails:
+        if email in seen:
+            repeats.append(RegistrationResult(email, event_id, "Rejected", None, "Listed more than once."))
+        seen.add(email)
+
+    cursor = conn.cursor()
+    results = {}
+    with immediate_transaction(conn):
+        name, scheduled_date, capacity, attendees, waitlisted = _event_seats(cursor, event_id)
+        if scheduled_date < today:
+            raise EventPassed(f"You cannot register for '{name}' because the event has already passed.")
+
+        if waitlisted and _free(capacity, attendees) != 0:
+            promoted = len(_promote(cursor, event_id, _free(capacity, attendees)))
+            attendees, waitlisted = attendees + promoted, waitlisted - promoted
+
+        # Validate every member with one query
+        cursor.execute("""
+            SELECT ids.value, Member.email, Attends.email, EventWaitlist.waitID
+            FROM json_each(?) AS ids
+            LEFT JOIN Member ON Member.email = ids.value
+            LEFT JOIN Attends ON Attends.email = ids.value AND Attends.eventID = ?
+            LEFT JOIN EventWaitlist ON EventWaitlist.email = ids.value AND EventWaitlist.eventID = ?
+            ORDER BY ids.key
+        """, (json.dumps(unique), event_id, event_id))
+
+        joining = []
+        for email, member, attending, wait_id in cursor.fetchall():
+            if member is None:
+                results[email] = RegistrationResult(email, event_id, "Rejected", None, "No membership found with this email.")
+            elif attending is not None:
+                results[email] = RegistrationResult(email, event_id, "Rejected", None, "Already registered for this event.")
+            elif wait_id is not None:
+                results[email] = RegistrationResult(email, event_id, "Rejected", None, "Already on the waitlist for this event.")
+            else:
+                joining.append(email)
+
+        free = _free(capacity, attendees) if waitlisted == 0 else 0
+        seated = joining if free is None else joining[:free]
+        queued = joining[len(seated):]
+
+        cursor.executemany("INSERT INTO Attends (email, eventID) VALUES (?, ?)",
+                           [(email, event_id) for email in seated])
+        for email in seated:
+            results[email] = RegistrationResult(email, event_id, "Registered", None, f"Registered for '{name}'.")
+
+        if waitlist:
+            added_at = datetime.now().isoformat(timespec="seconds")
+            cursor.executemany("INSERT INTO EventWaitlist (eventID, email, addedAt) VALUES (?, ?, ?)",
+                               [(event_id, email, added_at) for email in queued])
+            for position, email in enumerate(queued, start=waitlisted + 1):
+                results[email] = RegistrationResult(email, event_id, "Waitlisted", position,
+                                                    f"'{name}' is full. Number {position} on the waitlist.")
+        else:
+            for email in queued:
+                results[email] = RegistrationResult(email, event_id, "Rejected", None, f"'{name}' is full.")
+
+    return [results[email] for email in unique] + repeats
+
+
+# Gives up a seat (or a place on the waitlist)
+# -> RegistrationResults for the members moved up into the freed seat
+def cancel(conn, email, event_id):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        cursor.execute("DELETE FROM Attends WHERE email = ? AND eventID = ?", (email, event_id))
+        if cursor.rowcount == 0:
+            cursor.execute("DELETE FROM EventWaitlist WHERE eventID = ? AND email = ?", (event_id, email))
+            if cursor.rowcount == 0:
+                raise NotRegistered("You are not registered for this event.")
+            return []
+
+        name, _, capacity, attendees, _ = _event_seats(cursor, event_id)
+        return _promoted(name, event_id, _promote(cursor, event_id, _free(capacity, attendees)))
+
+
+# Fills any free seats from the waitlist (e.g. after moving an event to a bigger room)
+# -> RegistrationResults for the members moved up
+def fill_from_waitlist(conn, event_id):
+    cursor = conn.cursor()
+    with immediate_transaction(conn):
+        name, _, capacity, attendees, _ = _event_seats(cursor, event_id)
+        return _promoted(name, event_id, _promote(cursor, event_id, _free(capacity, attendees)))
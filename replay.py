@@ -0,0 +1,312 @@
+import argparse
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+from library_service import LibraryService, open_library
+from load_test import percentile
+from pool import BUSY_TIMEOUT_MS
+from records import LibraryError, Record
+from search_index import PAGE_SIZE
+
+# Desk operations without the menu: one at a time, or a whole workload file
+#
+#   python library_db_application.py borrow ana@example.com 4012
+#   python library_db_application.py replay day.jsonl --workers 4
+#   python replay.py --db library.db --ops 5000 --out day.jsonl   # a made-up day to replay
+#
+# A workload file has one operation per line:
+#   {"op": "search",   "text": "tolkien", "field": "author", "limit": 20}   field, limit optional
+#   {"op": "borrow",   "email": "ana@example.com", "item_id": 4012}
+#   {"op": "return",   "email": "ana@example.com", "item_id": 4012}
+#   {"op": "donate",   "name": "...", "author": "...", "category": "Book", "genre": "Fantasy"}
+#   {"op": "register", "email": "ana@example.com", "event_id": 17, "waitlist": true}   waitlist optional
+#   {"op": "pay",      "email": "ana@example.com", "amount": 2.5}
+#
+# Every operation is the same LibraryService call the menu makes
+# (run_operation). The file is streamed to the workers through a short queue,
+# and each worker keeps one connection for the whole run. Writes still commit
+# one operation at a time, as at the desk -> The timings are the desk's.
+# Refused operations (item already out, event full, nothing owed, ...) are
+# normal in replayed traffic and counted, not fatal; so are lines that can't
+# be run at all (bad JSON, unknown op, missing field, wrong field type).
+
+# Operations waiting per worker -> The file is never all in memory
+QUEUE_PER_WORKER = 64
+
+# Invalid / failed lines listed in the report
+MAX_ERRORS_SHOWN = 10
+
+# Share of each operation in a generated workload
+MIX = {"search": 0.55, "borrow": 0.15, "return": 0.12, "register": 0.10, "pay": 0.05, "donate": 0.03}
+
+
+class InvalidOperation(LibraryError):
+    pass
+
+
+# Per-op counts and latencies (ms) of a replay
+class OpStats(Record):
+    __slots__ = ("op", "count", "refused", "invalid", "failed", "p50", "p95", "p99")
+
+
+class ReplayReport(Record):
+    __slots__ = ("operations", "seconds", "workers", "stats", "errors")
+
+
+# operation[field], which must be of type `kind` (a wrong type -> InvalidOperation)
+def _get(operation, field, kind, default=None):
+    if field not in operation:
+        if default is not None:
+            return default
+        raise KeyError(field)
+    value = operation[field]
+    # bool is an int -> Not taken for an id or an amount
+    if not isinstance(value, kind) or isinstance(value, bool):
+        expected = {str: "a string", int: "an integer"}.get(kind, "a number")
+        raise InvalidOperation(f"{operation['op']}: {field} must be {expected}")
+    return value
+
+
+def _search(service, operation):
+    field = operation.get("field")
+    if field is not None and not isinstance(field, str):
+        raise InvalidOperation("search: field must be a string")
+    return service.search_items(_get(operation, "text", str), field, _get(operation, "limit", int, PAGE_SIZE))
+
+
+def _borrow(service, operation):
+    return service.borrow(_get(operation, "email", str), _get(operation, "item_id", int))
+
+
+def _return(service, operation):
+    return service.return_item(_get(operation, "email", str), _get(operation, "item_id", int))
+
+
+def _donate(service, operation):
+    return service.donate(*(_get(operation, field, str) for field in ("name", "author", "category", "genre")))
+
+
+def _register(service, operation):
+    return service.register(_get(operation, "email", str), _get(operation, "event_id", int),
+                            waitlist=bool(operation.get("waitlist")))
+
+
+def _pay(service, operation):
+    return service.pay_fines(_get(operation, "email", str), float(_get(operation, "amount", (int, float))))
+
+
+OPERATIONS = {
+    "search": _search,
+    "borrow": _borrow,
+    "return": _return,
+    "donate": _donate,
+    "register": _register,
+    "pay": _pay,
+}
+
+
+# Runs one operation ({"op": ..., fields}) -> What the service call returns
+def run_operation(service, operation):
+    name = operation.get("op")
+    if name not in OPERATIONS:
+        raise InvalidOperation(f"Unknown op: {name!r}")
+    try:
+        return OPERATIONS[name](service, operation)
+    except KeyError as error:
+        raise InvalidOperation(f"{name}: missing field {error}")
+    except (TypeError, ValueError) as error:
+        raise InvalidOperation(f"{name}: {error}")
+
+
+# Runs operations off `work` until it gets None; appends (timings, counts, errors) to `results`
+def _worker(db, work, results):
+    conn = open_library(db, timeout=BUSY_TIMEOUT_MS / 1000)
+    service = LibraryService(conn)
+    timings, counts, errors = {}, {}, []
+    try:
+        while True:
+            task = work.get()
+            if task is None:
+                break
+            line, operation = task
+            name = operation.get("op")
+            outcome = "ok"
+            started = time.perf_counter()
+            try:
+                result = run_operation(service, operation)
+                # return_item reports a refusal in the result
+                if getattr(result, "ok", True) is False:
+                    outcome = "refused"
+            except InvalidOperation as error:
+                outcome = "invalid"
+                errors.append((line, str(error)))
+            except LibraryError:
+                outcome = "refused"
+            except Exception as error:
+                # Anything else (database locked, a bug) -> Count it and carry
+                # on; a worker that died would leave the feeder blocked on the queue
+                outcome = "failed"
+                errors.append((line, f"{name}: {type(error).__name__}: {error}"))
+                if conn.in_transaction:
+                    conn.rollback()
+            elapsed = (time.perf_counter() - started) * 1000
+
+            if name in OPERATIONS:
+                timings.setdefault(name, []).append(elapsed)
+            key = (name if name in OPERATIONS else "?", outcome)
+            counts[key] = counts.get(key, 0) + 1
+    finally:
+        service.close()
+        results.append((timings, counts, errors))
+
+
+# Streams `lines` (JSON text) through `workers` threads, each with its own
+# connection to `db` -> ReplayReport
+def replay(db, lines, workers=1):
+    if workers < 1:
+        raise ValueError("replay needs at least one worker")
+    db = Path(db).resolve()
+    # Schema brought up to date once, before the workers connect
+    conn = open_library(db)
+    if workers > 1:
+        # Concurrent writers -> WAL, as the server runs it (stored in the file)
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    work = queue.Queue(maxsize=workers * QUEUE_PER_WORKER)
+    results = []
+    threads = [threading.Thread(target=_worker, args=(db, work, results), name=f"replay-{number}")
+               for number in range(workers)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    bad_lines = []
+    operations = 0
+    try:
+        for number, text in enumerate(lines, 1):
+            if not text.strip():
+                continue
+            operations += 1
+            try:
+                operation = json.loads(text)
+                if not isinstance(operation, dict):
+                    raise ValueError("not a JSON object")
+            except ValueError as error:
+                bad_lines.append((number, f"bad JSON: {error}"))
+                continue
+            work.put((number, operation))
+    finally:
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+    seconds = time.perf_counter() - started
+
+    timings, counts, errors = {}, {}, list(bad_lines)
+    for worker_timings, worker_counts, worker_errors in results:
+        for name, values in worker_timings.items():
+            timings.setdefault(name, []).extend(values)
+        for key, count in worker_counts.items():
+            counts[key] = counts.get(key, 0) + count
+        errors.extend(worker_errors)
+    if bad_lines:
+        counts[("?", "invalid")] = counts.get(("?", "invalid"), 0) + len(bad_lines)
+
+    stats = []
+    for name in [*OPERATIONS, "?"]:
+        outcomes = {outcome: counts.get((name, outcome), 0) for outcome in ("ok", "refused", "invalid", "failed")}
+        total = sum(outcomes.values())
+        if not total:
+            continue
+        values = sorted(timings.get(name, []))
+        stats.append(OpStats(name, total, outcomes["refused"], outcomes["invalid"], outcomes["failed"],
+                             percentile(values, 50), percentile(values, 95), percentile(values, 99)))
+    return ReplayReport(operations, seconds, workers, stats, sorted(errors)[:MAX_ERRORS_SHOWN])
+
+
+def print_report(report):
+    rate = report.operations / report.seconds if report.seconds else 0.0
+    print(f"✅ {report.operations} operations in {report.seconds:.2f}s with {report.workers} "
+          f"worker{'s' if report.workers != 1 else ''} -> {rate:.0f} ops/s")
+    print(f"   {'op':<10} {'count':>7} {'refused':>8} {'invalid':>8} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stats in report.stats:
+        print(f"   {stats.op:<10} {stats.count:>7} {stats.refused:>8} {stats.invalid:>8} {stats.failed:>7} "
+              f"{stats.p50:8.2f} {stats.p95:8.2f} {stats.p99:8.2f}")
+    for number, message in report.errors:
+        print(f"❌ line {number}: {message}")
+
+
+# A made-up day at the desk from what is in the database -> Operation dicts
+# Returns are of items borrowed earlier in the same workload
+def sample_workload(conn, count, seed=7, today=None):
+    rng = random.Random(seed)
+    emails = [email for (email,) in conn.execute("SELECT email FROM Member ORDER BY random() LIMIT 2000")]
+    items = [item_id for (item_id,) in conn.execute("""
+        SELECT itemID FROM Item WHERE status = 'Available' ORDER BY random() LIMIT 5000
+    """)]
+    words = sorted({word for (name,) in conn.execute("SELECT name FROM Item ORDER BY random() LIMIT 500")
+                    for word in name.split() if len(word) > 3})
+    events = [event_id for (event_id,) in conn.execute("SELECT eventID FROM Events WHERE scheduledDate >= ?",
+                                                       (today or date.today().isoformat(),))]
+    owing = [email for (email,) in conn.execute("""
+        SELECT DISTINCT T.email FROM Fines F JOIN BorrowTransactions T ON T.borrowID = F.borrowID
+        WHERE F.status = 'Unpaid' AND F.amount > 0
+        LIMIT 500
+    """)]
+
+    names, weights = zip(*MIX.items())
+    loans = []
+    for _ in range(count):
+        name = rng.choices(names, weights)[0]
+        if name == "return" and loans:
+            email, item_id = loans.pop(rng.randrange(len(loans)))
+            yield {"op": "return", "email": email, "item_id": item_id}
+        elif name in ("borrow", "return") and emails and items:
+            email, item_id = rng.choice(emails), rng.choice(items)
+            loans.append((email, item_id))
+            yield {"op": "borrow", "email": email, "item_id": item_id}
+        elif name == "register" and events and emails:
+            yield {"op": "register", "email": rng.choice(emails), "event_id": rng.choice(events),
+                   "waitlist": rng.random() < 0.5}
+        elif name == "pay" and owing:
+            yield {"op": "pay", "email": rng.choice(owing), "amount": 0.5}
+        elif name == "donate" and words:
+            yield {"op": "donate", "name": f"{rng.choice(words)} {rng.choice(words)}", "author": "Donor",
+                   "category": "Book", "genre": "Fiction"}
+        elif words:
+            field = rng.choice([None, None, "name"])
+            yield {"op": "search", "text": rng.choice(words).lower(), **({"field": field} if field else {})}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a made-up desk workload to replay")
+    parser.add_argument("--db", default="library.db", help="database to take members, items and events from")
+    parser.add_argument("--ops", type=int, default=5000, help="number of operations")
+    parser.add_argument("--out", default="workload.jsonl", help="file to write (replaced if it exists)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    # Migrated first (sampling reads BorrowTransactions.email); the file is only
+    # written once the whole workload is drawn -> No empty file if that fails
+    conn = open_library(args.db)
+    try:
+        workload = list(sample_workload(conn, args.ops, args.seed))
+    finally:
+        conn.close()
+    with open(args.out, "w") as out:
+        for operation in workload:
+            out.write(json.dumps(operation) + "\n")
+    print(f"✅ {args.ops} operations written to {args.out}. "
+          f"Replay with `library_db_application.py --db {args.db} replay {args.out}`.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from records import LibraryError, Record
+from schema import CHANGE_TABLES, ensure_schema
+from transactions import immediate_transaction
+
+# Read replicas of library.db, kept up to date from the change log
+#
+#   python replica.py init replica.db                 # copy of library.db to follow it
+#   python replica.py follow replica.db [kiosk.db]    # apply changes as they happen
+#   python replica.py status
+#   python replica.py prune                           # drop what every replica has applied
+#   python server.py --replica replica.db             # searches / event listings go there
+#
+# Triggers on the primary append every change to CHANGE_TABLES to ChangeLog
+# (schema.py). A replica starts as a consistent copy made with the backup API
+# and then applies the log in seq order, BATCH_SIZE entries per transaction.
+# Its own triggers (search index, trigrams, seat counts, ...) keep everything
+# derived from those tables in step; the change-log triggers are dropped so a
+# replica doesn't log what it applies.
+#
+# Staleness: ReplicaState.syncedAt is a time by which every change committed
+# on the primary had been applied. The follower moves it on every poll, so a
+# replica whose syncedAt is more than MAX_STALENESS_SECONDS old (follower
+# stopped or far behind) is skipped and reads go to the primary.
+#
+# changes_since() is the same feed for anything else that wants to follow
+# the primary incrementally (caches, summaries).
+
+# Log entries per replica transaction
+BATCH_SIZE = 1000
+
+# Follower sleep between polls when caught up (s)
+POLL_SECONDS = 0.2
+
+# Reads only use a replica that was in sync this recently (s)
+MAX_STALENESS_SECONDS = 2.0
+
+# How often a follower records its position on the primary (s) -> Not a write per batch
+READER_UPDATE_SECONDS = 5.0
+
+REPLICA_STATE = [
+    """CREATE TABLE IF NOT EXISTS ReplicaState (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        appliedSeq INTEGER NOT NULL,
+        syncedAt REAL NOT NULL
+    )""",
+]
+
+
+class ReplicaError(LibraryError):
+    pass
+
+
+# One change-log entry: op 'I' / 'U' / 'D', key = primary key before the
+# change, row = {column: value} after it (None for a delete)
+class Change(Record):
+    __slots__ = ("seq", "table", "op", "key", "row")
+
+
+# Follower position -> (name, seq, entries behind, seenAt)
+class ReaderStatus(Record):
+    __slots__ = ("name", "seq", "behind", "seen_at")
+
+
+# Entries after `seq`, oldest first
+def changes_since(conn, seq, limit=BATCH_SIZE):
+    rows = conn.execute("""
+        SELECT seq, tableName, op, rowKey, rowData FROM ChangeLog
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (seq, limit)).fetchall()
+    return [Change(seq, table, op, json.loads(key), json.loads(data) if data else None)
+            for seq, table, op, key, data in rows]
+
+
+# Highest seq ever handed out (the log itself may have been pruned)
+def last_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ChangeLog'").fetchone()
+    return row[0] if row else 0
+
+
+def _reader_name(path):
+    return str(Path(path).resolve())
+
+
+def _open_replica(path):
+    conn = sqlite3.connect(Path(path).resolve())
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ReplicaState'").fetchone() is None:
+        conn.close()
+        raise ReplicaError(f"{path} is not a replica. Create it with `replica.py init {path}`.")
+    return conn
+
+
+# Makes `path` a replica of the primary -> Seq it starts from
+def create_replica(primary, path):
+    path = Path(path).resolve()
+    partial = path.with_name(path.name + ".partial")
+    partial.unlink(missing_ok=True)
+
+    # One backup step -> One read transaction on the primary: the copy and the
+    # seq it goes with are from the same moment
+    replica = sqlite3.connect(partial)
+    primary.backup(replica)
+    seq = last_seq(replica)
+
+    cursor = replica.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'changelog\\_%' ESCAPE '\\'")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER {name}")
+    cursor.execute("DELETE FROM ChangeLog")
+    cursor.execute("DELETE FROM ChangeLogReaders")
+    for statement in REPLICA_STATE:
+        cursor.execute(statement)
+    cursor.execute("INSERT INTO ReplicaState (id, appliedSeq, syncedAt) VALUES (1, ?, ?)", (seq, time.time()))
+    replica.commit()
+    replica.execute("PRAGMA journal_mode = WAL")
+    replica.close()
+    os.replace(partial, path)
+
+    with immediate_transaction(primary):
+        primary.execute("""
+            INSERT INTO ChangeLogReaders (name, seq, seenAt) VALUES (?, ?, DATETIME('now'))
+            ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, seenAt = excluded.seenAt
+        """, (_reader_name(path), seq))
+    return seq
+
+
+# Applies entries inside the caller's transaction. Existing rows get an
+# UPDATE of just the columns that changed -> The replica's triggers do what
+# they did on the primary (a checkout doesn't re-index the item's trigrams),
+# and the triggers' own OR IGNORE inserts aren't overridden as under an upsert
+def apply_changes(cursor, changes, statements=None):
+    statements = {} if statements is None else statements
+    for change in changes:
+        key_columns = CHANGE_TABLES[change.table]
+        where = " AND ".join(f"{column} = ?" for column in key_columns)
+
+        if change.op == 'D':
+            cursor.execute(f"DELETE FROM {change.table} WHERE {where}", change.key)
+            continue
+
+        columns = tuple(change.row)
+        key = [change.row[column] for column in key_columns]
+        # Primary key changed -> The old row goes first
+        if change.op == 'U' and list(change.key) != key:
+            cursor.execute(f"DELETE FROM {change.table} WHERE {where}", change.key)
+
+        select = statements.get((change.table, columns))
+        if select is None:
+            select = f"SELECT {', '.join(columns)} FROM {change.table} WHERE {where}"
+            statements[(change.table, columns)] = select
+        current = cursor.execute(select, key).fetchone()
+
+        if current is None:
+            cursor.execute(f"INSERT INTO {change.table} ({', '.join(columns)}) "
+                           f"VALUES ({', '.join('?' for _ in columns)})",
+                           [change.row[column] for column in columns])
+            continue
+        changed = [column for column, value in zip(columns, current) if value != change.row[column]]
+        if changed:
+            cursor.execute(f"UPDATE {change.table} SET {', '.join(f'{column} = ?' for column in changed)} WHERE {where}",
+                           [change.row[column] for column in changed] + key)
+
+
+# One round for one replica -> (entries applied, caught up)
+def sync_once(primary, replica, batch_size=BATCH_SIZE, statements=None):
+    applied_seq = replica.execute("SELECT appliedSeq FROM ReplicaState WHERE id = 1").fetchone()[0]
+
+    # Everything committed on the primary before `started` is in what we read
+    # (unless the batch came back full)
+    started = time.time()
+    changes = changes_since(primary, applied_seq, batch_size)
+    primary.commit()
+    if not changes and last_seq(primary) < applied_seq:
+        raise ReplicaError("The primary is behind this replica (restored from a snapshot?). "
+                           "Create the replica again.")
+
+    caught_up = len(changes) < batch_size
+    cursor = replica.cursor()
+    with immediate_transaction(replica):
+        apply_changes(cursor, changes, statements)
+        cursor.execute("""
+            UPDATE ReplicaState
+            SET appliedSeq = ?, syncedAt = CASE WHEN ? THEN ? ELSE syncedAt END
+            WHERE id = 1
+        """, (changes[-1].seq if changes else applied_seq, caught_up, started))
+    return len(changes), caught_up
+
+
+# Records on the primary how far a replica got (for prune / status)
+def _record_position(primary, name, replica):
+    seq = replica.execute("SELECT appliedSeq FROM ReplicaState WHERE id = 1").fetchone()[0]
+    with immediate_transaction(primary):
+        primary.execute("""
+            INSERT INTO ChangeLogReaders (name, seq, seenAt) VALUES (?, ?, DATETIME('now'))
+            ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, seenAt = excluded.seenAt
+        """, (name, seq))
+
+
+# Keeps the replicas in step until interrupted
+# progress(path, entries applied) is called after every batch that applied something
+def follow(primary, paths, batch_size=BATCH_SIZE, poll=POLL_SECONDS, progress=None):
+    replicas = [(path, _reader_name(path), _open_replica(path), {}) for path in paths]
+    recorded = 0.0
+    try:
+        while True:
+            all_caught_up = True
+            for path, name, replica, statements in replicas:
+                applied, caught_up = sync_once(primary, replica, batch_size, statements)
+                all_caught_up = all_caught_up and caught_up
+                if applied and progress:
+                    progress(path, applied)
+
+            if time.monotonic() - recorded >= READER_UPDATE_SECONDS:
+                for path, name, replica, _ in replicas:
+                    _record_position(primary, name, replica)
+                recorded = time.monotonic()
+            if all_caught_up:
+                time.sleep(poll)
+    finally:
+        for _, _, replica, _ in replicas:
+            replica.close()
+
+
+# Seconds since the replica was last known to be in sync, None if `conn` isn't a replica
+def replica_lag(conn):
+    try:
+        row = conn.execute("SELECT syncedAt FROM ReplicaState WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return max(0.0, time.time() - row[0]) if row else None
+
+
+def reader_status(primary):
+    last = last_seq(primary)
+    rows = primary.execute("SELECT name, seq, seenAt FROM ChangeLogReaders ORDER BY name").fetchall()
+    return [ReaderStatus(name, seq, last - seq, seen_at) for name, seq, seen_at in rows]
+
+
+# Drops entries every registered replica has applied -> Entries deleted
+def prune(primary):
+    with immediate_transaction(primary):
+        cursor = primary.execute("""
+            DELETE FROM ChangeLog WHERE seq <= (SELECT MIN(seq) FROM ChangeLogReaders)
+        """)
+        return cursor.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read replicas of the library database")
+    parser.add_argument("--db", default="library.db", help="primary database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="create a replica from the primary")
+    init.add_argument("replica")
+
+    follower = commands.add_parser("follow", help="keep replicas up to date (runs until stopped)")
+    follower.add_argument("replicas", nargs="+")
+    follower.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="log entries per transaction")
+    follower.add_argument("--poll", type=float, default=POLL_SECONDS, help="seconds between polls when idle")
+
+    commands.add_parser("status", help="how far behind each replica is")
+    commands.add_parser("prune", help="drop log entries every replica has applied")
+
+    args = parser.parse_args(argv)
+    primary = sqlite3.connect(Path(args.db).resolve(), timeout=5)
+    ensure_schema(primary)
+
+    try:
+        if args.command == "init":
+            seq = create_replica(primary, args.replica)
+            print(f"✅ Replica {args.replica} created at change {seq}. "
+                  f"Keep it up to date with `replica.py follow {args.replica}`.")
+
+        elif args.command == "follow":
+            applied = 0
+
+            def progress(path, count):
+                nonlocal applied
+                applied += count
+                print(f"\r⏳ {applied} changes applied", end="", flush=True)
+
+            print(f"🔁 Following {args.db} into {', '.join(args.replicas)} (Ctrl+C to stop)")
+            try:
+                follow(primary, args.replicas, args.batch_size, args.poll, progress)
+            except KeyboardInterrupt:
+                print(f"\n👋 Stopped after {applied} changes.")
+
+        elif args.command == "status":
+            readers = reader_status(primary)
+            if not readers:
+                print("❌ No replicas registered.")
+            for reader in readers:
+                print(f"  {reader.name:<50} change {reader.seq:>10} ({reader.behind} behind), seen {reader.seen_at}")
+
+        elif args.command == "prune":
+            print(f"✅ Pruned {prune(primary)} change-log entries.")
+    except ReplicaError as error:
+        print(f"❌ {error}")
+        return 1
+    finally:
+        primary.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
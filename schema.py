@@ -0,0 +1,1144 @@
+import argparse
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+# Versioned schema migrations on top of the tables built in the notebook.
+# Applied versions are recorded in SchemaVersion; ensure_schema() runs the
+# pending ones on start-up, each in its own transaction.
+#
+#   python schema.py status
+#   python schema.py migrate --dry-run    # show the SQL, change nothing
+#   python schema.py migrate
+#
+# Migrations are written to be safe on databases that already got part of the
+# way (IF NOT EXISTS, column checks), since early versions ran unversioned.
+
+Migration = namedtuple("Migration", ["version", "name", "apply"])
+
+# Full-text search index over the catalog (external content -> rows live in Item)
+SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS ItemSearch USING fts5(
+        name, author, category, genre,
+        content='Item', content_rowid='itemID',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+
+    # Keep ItemSearch in sync with Item (alongside add_record_on_item_insert)
+    """CREATE TRIGGER IF NOT EXISTS item_search_insert
+    AFTER INSERT ON Item
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO ItemSearch (rowid, name, author, category, genre)
+        VALUES (NEW.itemID, NEW.name, NEW.author, NEW.category, NEW.genre);
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS item_search_delete
+    AFTER DELETE ON Item
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO ItemSearch (ItemSearch, rowid, name, author, category, genre)
+        VALUES ('delete', OLD.itemID, OLD.name, OLD.author, OLD.category, OLD.genre);
+    END""",
+
+    # Only text columns -> Borrowing/returning (status changes) don't touch the index
+    """CREATE TRIGGER IF NOT EXISTS item_search_update
+    AFTER UPDATE OF itemID, name, author, category, genre ON Item
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO ItemSearch (ItemSearch, rowid, name, author, category, genre)
+        VALUES ('delete', OLD.itemID, OLD.name, OLD.author, OLD.category, OLD.genre);
+        INSERT INTO ItemSearch (rowid, name, author, category, genre)
+        VALUES (NEW.itemID, NEW.name, NEW.author, NEW.category, NEW.genre);
+    END""",
+]
+
+
+# ID allocation: the MAX()-based set_* triggers are replaced by SQLite's own
+# INTEGER PRIMARY KEY allocation (staffID, volunteerID, eventID, roomNum are
+# already rowid aliases). BorrowTransactions is rebuilt with AUTOINCREMENT so a
+# borrowID referenced by Fines is never handed out twice.
+ID_TRIGGERS = ['set_borrow_transactions', 'set_staff', 'set_volunteer', 'set_event', 'set_room']
+
+BORROW_TRANSACTIONS_TABLE = """CREATE TABLE {name} (
+    borrowID INTEGER PRIMARY KEY AUTOINCREMENT,
+    borrowDate DATE,
+    returnDate DATE DEFAULT NULL,
+    status VARCHAR(10) CHECK (status IN ('Borrowed', 'Returned')) DEFAULT 'Borrowed'
+)"""
+
+# Triggers on BorrowTransactions, re-created after the rebuild
+BORROW_TRANSACTIONS_TRIGGERS = [
+    # Only when the insert didn't already give a return date -> No second write per loan
+    """CREATE TRIGGER IF NOT EXISTS SetReturnDate
+    AFTER INSERT ON BorrowTransactions
+    FOR EACH ROW
+    WHEN NEW.returnDate IS NULL
+    BEGIN
+        UPDATE BorrowTransactions
+        SET returnDate = DATE(NEW.borrowDate, '+1 month')
+        WHERE borrowID = NEW.borrowID;
+    END""",
+]
+
+
+# Rebuilds a table from new DDL (CREATE TABLE {name} ...), keeping its rows,
+# indexes and triggers. legacy_alter_table -> Other tables' triggers and
+# foreign keys keep referring to it by name.
+# rowid_as -> New column the old rowids are copied into (ids kept as they were)
+def _rebuild_table(cursor, table, create_sql, rowid_as=None):
+    cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """, (table,))
+    dependents = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute(f"SELECT name FROM pragma_table_info('{table}')")
+    columns = ", ".join(row[0] for row in cursor.fetchall())
+    new_columns, old_columns = (f"{rowid_as}, {columns}", f"rowid, {columns}") if rowid_as else (columns, columns)
+
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(create_sql.format(name=f"{table}_new"))
+        cursor.execute(f"INSERT INTO {table}_new ({new_columns}) SELECT {old_columns} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for statement in dependents:
+            cursor.execute(statement)
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+
+
+# Drops the MAX()-based ID triggers and rebuilds BorrowTransactions with AUTOINCREMENT
+def migrate_id_allocation(cursor):
+    for trigger in ID_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'BorrowTransactions'")
+    if 'AUTOINCREMENT' in cursor.fetchone()[0].upper():
+        return
+
+    cursor.execute("DROP TRIGGER IF EXISTS SetReturnDate")
+    _rebuild_table(cursor, 'BorrowTransactions', BORROW_TRANSACTIONS_TABLE)
+    for statement in BORROW_TRANSACTIONS_TRIGGERS:
+        cursor.execute(statement)
+
+
+# Overdue fines come from the nightly sweep (fines.sweep_overdue) instead of
+# per-row triggers, which missed loans that were simply never touched again
+FINE_SWEEP = [
+    "DROP TRIGGER IF EXISTS AddFineForOverdueInsert",
+    "DROP TRIGGER IF EXISTS AddFineForOverdueUpdate",
+
+    # Open loans only, in due-date order -> The sweep's range query
+    """CREATE INDEX IF NOT EXISTS BorrowTransactionsOverdue
+    ON BorrowTransactions (returnDate, borrowID)
+    WHERE status = 'Borrowed'""",
+
+    # Where a sweep got to, so an interrupted run can pick up again
+    """CREATE TABLE IF NOT EXISTS SweepCheckpoint (
+        job VARCHAR(50) PRIMARY KEY,
+        runDate DATE,
+        lastReturnDate DATE,
+        lastBorrowID INTEGER,
+        finished INTEGER DEFAULT 0
+    )""",
+]
+
+
+# Sets up the overdue sweep (index, checkpoints, Fines.assessed)
+def migrate_fine_sweep(cursor):
+    for statement in FINE_SWEEP:
+        cursor.execute(statement)
+
+    # Fines.amount is what is still owed -> assessed keeps the total charged,
+    # so a re-run can raise a fine without undoing payments
+    cursor.execute("SELECT name FROM pragma_table_info('Fines')")
+    if 'assessed' not in {row[0] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE Fines ADD COLUMN assessed DECIMAL(10,2)")
+        # The old triggers only ever charged the flat $10
+        cursor.execute("UPDATE Fines SET assessed = MAX(amount, 10.00)")
+
+
+# Borrow rows are deleted on return -> BorrowTransactions keeps who borrowed
+# what, so fines (and other history) survive the return
+def migrate_loan_history(cursor):
+    cursor.execute("SELECT name FROM pragma_table_info('BorrowTransactions')")
+    columns = {row[0] for row in cursor.fetchall()}
+
+    if 'email' not in columns:
+        cursor.execute("ALTER TABLE BorrowTransactions ADD COLUMN email VARCHAR(500) REFERENCES Member(email)")
+    if 'itemID' not in columns:
+        cursor.execute("ALTER TABLE BorrowTransactions ADD COLUMN itemID INTEGER REFERENCES Item(itemID)")
+
+    # Fill in loans made before the columns existed
+    cursor.execute("""
+        UPDATE BorrowTransactions
+        SET email = Borrow.email, itemID = Borrow.itemID
+        FROM Borrow
+        WHERE Borrow.borrowID = BorrowTransactions.borrowID
+          AND BorrowTransactions.email IS NULL
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS BorrowTransactionsEmail ON BorrowTransactions (email, borrowID)")
+
+
+# Creates ItemSearch + its triggers, and fills the index the first time
+def migrate_search_index(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'ItemSearch'")
+    exists = cursor.fetchone() is not None
+
+    for statement in SEARCH_INDEX:
+        cursor.execute(statement)
+
+    if not exists:
+        cursor.execute("INSERT INTO ItemSearch (ItemSearch) VALUES ('rebuild')")
+
+
+# Indexes for the member-centric lookups (email / eventID filters)
+MEMBER_INDEXES = [
+    # return_item: borrowed items of a member, and the (email, itemID) lookup -> Covering
+    "CREATE INDEX IF NOT EXISTS BorrowEmail ON Borrow (email, itemID, borrowID)",
+    # check-in: open loans of an item
+    "CREATE INDEX IF NOT EXISTS BorrowItem ON Borrow (itemID, borrowID)",
+    "CREATE INDEX IF NOT EXISTS StaffEmail ON Staff (email)",
+    "CREATE INDEX IF NOT EXISTS VolunteerEmail ON Volunteer (email)",
+    # Who attends an event (email lookups already use the primary key)
+    "CREATE INDEX IF NOT EXISTS AttendsEvent ON Attends (eventID, email)",
+    # recommend_events
+    "CREATE INDEX IF NOT EXISTS EventsAudience ON Events (targetAudience)",
+]
+
+
+def migrate_member_indexes(cursor):
+    for statement in MEMBER_INDEXES:
+        cursor.execute(statement)
+
+
+# Same tables as the notebook, with email as text (it was declared INTEGER)
+# and Attends.eventID as INTEGER (it had no type)
+TYPED_TABLES = {
+    'Borrow': """CREATE TABLE {name} (
+    borrowID INTEGER,
+    email VARCHAR(500),
+    itemID INTEGER,
+    PRIMARY KEY (borrowID, email, itemID),
+    FOREIGN KEY (borrowID) REFERENCES BorrowTransactions(borrowID),
+    FOREIGN KEY (email) REFERENCES Member(email),
+    FOREIGN KEY (itemID) REFERENCES Item(itemID)
+)""",
+    'Staff': """CREATE TABLE {name} (
+    email VARCHAR(500),
+    staffID INTEGER PRIMARY KEY,
+    position VARCHAR(50),
+    wage DECIMAL(10,2),
+    employmentDate DATE,
+    employmentStatus VARCHAR(20) CHECK (employmentStatus IN ('Working', 'Resigned')),
+    FOREIGN KEY (email) REFERENCES Member(email)
+)""",
+    'Volunteer': """CREATE TABLE {name} (
+    email VARCHAR(500),
+    volunteerID INTEGER PRIMARY KEY,
+    employmentDate DATE,
+    FOREIGN KEY (email) REFERENCES Member(email)
+)""",
+    'Attends': """CREATE TABLE {name} (
+    email VARCHAR(500),
+    eventID INTEGER,
+    PRIMARY KEY (email, eventID),
+    FOREIGN KEY (email) REFERENCES Member(email),
+    FOREIGN KEY (eventID) REFERENCES Events(eventID)
+)""",
+}
+
+
+# Rebuilds the tables whose declared types don't match what they hold
+def migrate_column_affinity(cursor):
+    for table, create_sql in TYPED_TABLES.items():
+        cursor.execute(f"SELECT name, type FROM pragma_table_info('{table}')")
+        types = dict(cursor.fetchall())
+        if types.get('email') == 'INTEGER' or types.get('eventID') == '':
+            _rebuild_table(cursor, table, create_sql)
+
+
+# Event listings: past/upcoming split and date ranges are range scans, already
+# in (date, time, eventID) order (eventID is the rowid, so it rides along)
+EVENT_SCHEDULE = [
+    "CREATE INDEX IF NOT EXISTS EventsSchedule ON Events (scheduledDate, scheduledTime)",
+    # For ad-hoc queries and reports; the app passes its own 'today' (event_calendar.py)
+    """CREATE VIEW IF NOT EXISTS UpcomingEvents AS
+    SELECT eventID, name, scheduledTime, scheduledDate, targetAudience
+    FROM Events
+    WHERE scheduledDate >= DATE('now', 'localtime')""",
+]
+
+
+def migrate_event_schedule(cursor):
+    for statement in EVENT_SCHEDULE:
+        cursor.execute(statement)
+
+
+# Event sign-ups: EventOccupancy keeps a seat count per event (kept by triggers,
+# so every writer to Attends keeps it right) and its capacity (the rooms it is
+# Located in; NULL -> no room, no limit). EventWaitlist queues members in
+# waitID order once an event is full.
+EVENT_OCCUPANCY = [
+    """CREATE TABLE IF NOT EXISTS EventOccupancy (
+        eventID INTEGER PRIMARY KEY,
+        capacity INTEGER,
+        attendees INTEGER NOT NULL DEFAULT 0,
+        waitlisted INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (eventID) REFERENCES Events(eventID)
+    )""",
+
+    """CREATE TABLE IF NOT EXISTS EventWaitlist (
+        waitID INTEGER PRIMARY KEY AUTOINCREMENT,
+        eventID INTEGER NOT NULL,
+        email VARCHAR(500) NOT NULL,
+        addedAt DATETIME,
+        UNIQUE (eventID, email),
+        FOREIGN KEY (eventID) REFERENCES Events(eventID),
+        FOREIGN KEY (email) REFERENCES Member(email)
+    )""",
+    # Queue order of an event (waitID is the rowid -> Rides along)
+    "CREATE INDEX IF NOT EXISTS EventWaitlistQueue ON EventWaitlist (eventID)",
+    # Events held in a room -> Room capacity changes
+    "CREATE INDEX IF NOT EXISTS LocatedRoom ON Located (roomNum, eventID)",
+
+    """CREATE TRIGGER IF NOT EXISTS event_occupancy_insert
+    AFTER INSERT ON Events
+    FOR EACH ROW
+    BEGIN
+        INSERT OR IGNORE INTO EventOccupancy (eventID) VALUES (NEW.eventID);
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS event_occupancy_delete
+    AFTER DELETE ON Events
+    FOR EACH ROW
+    BEGIN
+        DELETE FROM EventWaitlist WHERE eventID = OLD.eventID;
+        DELETE FROM EventOccupancy WHERE eventID = OLD.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS attends_count_insert
+    AFTER INSERT ON Attends
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy SET attendees = attendees + 1 WHERE eventID = NEW.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS attends_count_delete
+    AFTER DELETE ON Attends
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy SET attendees = attendees - 1 WHERE eventID = OLD.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS attends_count_update
+    AFTER UPDATE OF eventID ON Attends
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy SET attendees = attendees - 1 WHERE eventID = OLD.eventID;
+        UPDATE EventOccupancy SET attendees = attendees + 1 WHERE eventID = NEW.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS waitlist_count_insert
+    AFTER INSERT ON EventWaitlist
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy SET waitlisted = waitlisted + 1 WHERE eventID = NEW.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS waitlist_count_delete
+    AFTER DELETE ON EventWaitlist
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy SET waitlisted = waitlisted - 1 WHERE eventID = OLD.eventID;
+    END""",
+
+    # Capacity = seats of every room the event is in
+    """CREATE TRIGGER IF NOT EXISTS located_capacity_insert
+    AFTER INSERT ON Located
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy
+        SET capacity = (SELECT SUM(Room.maxCap) FROM Located JOIN Room USING (roomNum)
+                        WHERE Located.eventID = NEW.eventID)
+        WHERE eventID = NEW.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS located_capacity_delete
+    AFTER DELETE ON Located
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy
+        SET capacity = (SELECT SUM(Room.maxCap) FROM Located JOIN Room USING (roomNum)
+                        WHERE Located.eventID = OLD.eventID)
+        WHERE eventID = OLD.eventID;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS room_capacity_update
+    AFTER UPDATE OF maxCap ON Room
+    FOR EACH ROW
+    BEGIN
+        UPDATE EventOccupancy
+        SET capacity = (SELECT SUM(Room.maxCap) FROM Located JOIN Room USING (roomNum)
+                        WHERE Located.eventID = EventOccupancy.eventID)
+        WHERE eventID IN (SELECT eventID FROM Located WHERE roomNum = NEW.roomNum);
+    END""",
+]
+
+
+# Recounts EventOccupancy from Events / Located / Attends / EventWaitlist
+# (after loading data with the triggers off, or if the counts are ever in doubt)
+# archive=False -> Attends only, for the migrations that run before the archive tables exist
+def rebuild_event_occupancy(cursor, archive=True):
+    attends = "AttendanceHistory" if archive else "Attends"
+    cursor.execute("DELETE FROM EventOccupancy")
+    cursor.execute(f"""
+        INSERT INTO EventOccupancy (eventID, capacity, attendees, waitlisted)
+        SELECT e.eventID,
+               (SELECT SUM(Room.maxCap) FROM Located JOIN Room USING (roomNum) WHERE Located.eventID = e.eventID),
+               (SELECT COUNT(*) FROM {attends} a WHERE a.eventID = e.eventID),
+               (SELECT COUNT(*) FROM EventWaitlist WHERE EventWaitlist.eventID = e.eventID)
+        FROM Events e
+    """)
+
+
+def migrate_event_occupancy(cursor):
+    for statement in EVENT_OCCUPANCY:
+        cursor.execute(statement)
+    rebuild_event_occupancy(cursor, archive=False)
+
+
+# Recommendations (recommend.py): the top neighbours of each item / event,
+# built by a batch job and topped up as loans and sign-ups arrive
+RECOMMENDATIONS = [
+    """CREATE TABLE IF NOT EXISTS ItemNeighbours (
+        itemID INTEGER,
+        neighbourID INTEGER,
+        together INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (itemID, neighbourID)
+    ) WITHOUT ROWID""",
+
+    """CREATE TABLE IF NOT EXISTS EventNeighbours (
+        eventID INTEGER,
+        neighbourID INTEGER,
+        together INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (eventID, neighbourID)
+    ) WITHOUT ROWID""",
+
+    # Members who have borrowed each item -> Scales the co-borrow counts
+    """CREATE TABLE IF NOT EXISTS ItemBorrowers (
+        itemID INTEGER PRIMARY KEY,
+        borrowers INTEGER NOT NULL
+    )""",
+
+    # Last loan (borrowID) / sign-up (attendID) folded into each job
+    """CREATE TABLE IF NOT EXISTS RecommendCheckpoint (
+        job VARCHAR(50) PRIMARY KEY,
+        lastID INTEGER,
+        builtAt DATETIME,
+        updatedAt DATETIME
+    )""",
+]
+
+
+def migrate_recommendations(cursor):
+    for statement in RECOMMENDATIONS:
+        cursor.execute(statement)
+
+
+# Indexes / triggers bulk_import.py set aside for a --defer-indexes run, with
+# the first itemID it added -> Put back (and the search index caught up) when
+# the run ends, or by the next run if it was killed
+IMPORT_DEFERRED = [
+    """CREATE TABLE IF NOT EXISTS ImportDeferred (
+        name VARCHAR(100) PRIMARY KEY,
+        sql TEXT NOT NULL,
+        fromItemID INTEGER NOT NULL
+    )""",
+]
+
+
+def migrate_import_deferred(cursor):
+    for statement in IMPORT_DEFERRED:
+        cursor.execute(statement)
+
+
+# One row per maintenance.py run (snapshot, vacuum, analyze, ...) -> Tells the
+# nightly job what is due, and keeps the page / freelist counts over time
+MAINTENANCE_LOG = [
+    """CREATE TABLE IF NOT EXISTS MaintenanceLog (
+        logID INTEGER PRIMARY KEY,
+        job VARCHAR(50) NOT NULL,
+        ranAt DATETIME NOT NULL,
+        seconds REAL,
+        pages INTEGER,
+        freelist INTEGER,
+        bytes INTEGER,
+        path TEXT
+    )""",
+
+    "CREATE INDEX IF NOT EXISTS MaintenanceLogJob ON MaintenanceLog (job, ranAt)",
+]
+
+
+def migrate_maintenance_log(cursor):
+    for statement in MAINTENANCE_LOG:
+        cursor.execute(statement)
+
+
+# Reporting summaries (analytics.py), so dashboards never read the raw tables
+#
+#   LoanStats / FineStats -> Counters per day, kept by triggers as loans, returns,
+#                            fines and payments happen
+#   EventStats / RoomStats -> Per month, rebuilt by analytics.refresh() for the
+#                            months in AnalyticsDirty (marked by triggers whenever
+#                            an event's seats, date or audience change)
+#   OverdueStats           -> Open and overdue loans, one row per refresh day
+ANALYTICS = [
+    """CREATE TABLE IF NOT EXISTS LoanStats (
+        day DATE,
+        category VARCHAR(50),
+        genre VARCHAR(50),
+        loans INTEGER NOT NULL DEFAULT 0,
+        returned INTEGER NOT NULL DEFAULT 0,
+        returnedLate INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category, genre)
+    ) WITHOUT ROWID""",
+
+    """CREATE TABLE IF NOT EXISTS FineStats (
+        day DATE PRIMARY KEY,
+        fines INTEGER NOT NULL DEFAULT 0,
+        assessed REAL NOT NULL DEFAULT 0,
+        collected REAL NOT NULL DEFAULT 0,
+        cleared INTEGER NOT NULL DEFAULT 0
+    )""",
+
+    """CREATE TABLE IF NOT EXISTS OverdueStats (
+        day DATE PRIMARY KEY,
+        openLoans INTEGER NOT NULL,
+        overdue INTEGER NOT NULL
+    )""",
+
+    """CREATE TABLE IF NOT EXISTS EventStats (
+        month VARCHAR(7),
+        audience VARCHAR(100),
+        events INTEGER NOT NULL,
+        attendees INTEGER NOT NULL,
+        capacity INTEGER,
+        PRIMARY KEY (month, audience)
+    ) WITHOUT ROWID""",
+
+    """CREATE TABLE IF NOT EXISTS RoomStats (
+        month VARCHAR(7),
+        roomNum INTEGER,
+        events INTEGER NOT NULL,
+        seats INTEGER,
+        attendees REAL NOT NULL,
+        PRIMARY KEY (month, roomNum)
+    ) WITHOUT ROWID""",
+
+    """CREATE TABLE IF NOT EXISTS AnalyticsDirty (
+        month VARCHAR(7) PRIMARY KEY
+    ) WITHOUT ROWID""",
+
+    # Loan counted on the day it starts, under the item's category / genre
+    """CREATE TRIGGER IF NOT EXISTS loan_stats_insert
+    AFTER INSERT ON BorrowTransactions
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO LoanStats (day, category, genre, loans)
+        SELECT COALESCE(NEW.borrowDate, DATE('now', 'localtime')),
+               COALESCE((SELECT category FROM Item WHERE itemID = NEW.itemID), ''),
+               COALESCE((SELECT genre FROM Item WHERE itemID = NEW.itemID), ''),
+               1
+        WHERE true
+        ON CONFLICT (day, category, genre) DO UPDATE SET loans = loans + 1;
+    END""",
+
+    # Return counted on the day it happens; late if after the due date (the old returnDate)
+    """CREATE TRIGGER IF NOT EXISTS loan_stats_return
+    AFTER UPDATE OF status ON BorrowTransactions
+    FOR EACH ROW
+    WHEN OLD.status = 'Borrowed' AND NEW.status = 'Returned'
+    BEGIN
+        INSERT INTO LoanStats (day, category, genre, returned, returnedLate)
+        SELECT COALESCE(NEW.returnDate, DATE('now', 'localtime')),
+               COALESCE((SELECT category FROM Item WHERE itemID = NEW.itemID), ''),
+               COALESCE((SELECT genre FROM Item WHERE itemID = NEW.itemID), ''),
+               1,
+               COALESCE(NEW.returnDate > OLD.returnDate, 0)
+        WHERE true
+        ON CONFLICT (day, category, genre) DO UPDATE SET
+            returned = returned + 1, returnedLate = returnedLate + excluded.returnedLate;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS fine_stats_insert
+    AFTER INSERT ON Fines
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO FineStats (day, fines, assessed, collected, cleared)
+        VALUES (DATE('now', 'localtime'), 1, COALESCE(NEW.assessed, NEW.amount),
+                COALESCE(NEW.assessed, NEW.amount) - NEW.amount, NEW.status = 'Paid')
+        ON CONFLICT (day) DO UPDATE SET
+            fines = fines + 1,
+            assessed = assessed + excluded.assessed,
+            collected = collected + excluded.collected,
+            cleared = cleared + excluded.cleared;
+    END""",
+
+    # Raised fine -> assessed and amount go up together; payment -> only amount
+    # goes down. Collected is whatever the amount dropped beyond the change in
+    # assessed (rows from before the assessed column count as unchanged).
+    """CREATE TRIGGER IF NOT EXISTS fine_stats_update
+    AFTER UPDATE OF amount, assessed, status ON Fines
+    FOR EACH ROW
+    BEGIN
+        INSERT INTO FineStats (day, fines, assessed, collected, cleared)
+        SELECT DATE('now', 'localtime'), 0, raised, raised - (NEW.amount - OLD.amount),
+               OLD.status = 'Unpaid' AND NEW.status = 'Paid'
+        FROM (SELECT COALESCE(NEW.assessed, OLD.assessed, OLD.amount) - COALESCE(OLD.assessed, OLD.amount) AS raised)
+        WHERE true
+        ON CONFLICT (day) DO UPDATE SET
+            assessed = assessed + excluded.assessed,
+            collected = collected + excluded.collected,
+            cleared = cleared + excluded.cleared;
+    END""",
+
+    # Seats, attendees or rooms changed (EventOccupancy is kept by the triggers above)
+    """CREATE TRIGGER IF NOT EXISTS analytics_occupancy_insert
+    AFTER INSERT ON EventOccupancy
+    FOR EACH ROW
+    BEGIN
+        INSERT OR IGNORE INTO AnalyticsDirty (month)
+        SELECT SUBSTR(scheduledDate, 1, 7) FROM Events WHERE eventID = NEW.eventID AND scheduledDate IS NOT NULL;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS analytics_occupancy_update
+    AFTER UPDATE OF attendees, capacity ON EventOccupancy
+    FOR EACH ROW
+    BEGIN
+        INSERT OR IGNORE INTO AnalyticsDirty (month)
+        SELECT SUBSTR(scheduledDate, 1, 7) FROM Events WHERE eventID = NEW.eventID AND scheduledDate IS NOT NULL;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS analytics_event_update
+    AFTER UPDATE OF scheduledDate, targetAudience ON Events
+    FOR EACH ROW
+    BEGIN
+        INSERT OR IGNORE INTO AnalyticsDirty (month)
+        SELECT SUBSTR(OLD.scheduledDate, 1, 7) WHERE OLD.scheduledDate IS NOT NULL
+        UNION SELECT SUBSTR(NEW.scheduledDate, 1, 7) WHERE NEW.scheduledDate IS NOT NULL;
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS analytics_event_delete
+    AFTER DELETE ON Events
+    FOR EACH ROW
+    WHEN OLD.scheduledDate IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO AnalyticsDirty (month) VALUES (SUBSTR(OLD.scheduledDate, 1, 7));
+    END""",
+]
+
+
+# Recomputes LoanStats and FineStats from the raw tables and marks every event
+# month for the next analytics refresh (after loading data with the triggers
+# off, or if the counters are ever in doubt). The raw tables don't keep
+# everything the triggers see, so history comes out approximate: a returned
+# loan counts as late if it was fined, and fines are filed under the loan's
+# return date rather than the day they were charged or paid.
+# archive=False -> Live tables only (see rebuild_event_occupancy)
+def rebuild_analytics(cursor, archive=True):
+    loans, fines, items = (("LoanHistory", "FineHistory", "ItemHistory") if archive
+                           else ("BorrowTransactions", "Fines", "Item"))
+    cursor.execute("DELETE FROM LoanStats")
+    cursor.execute(f"""
+        INSERT INTO LoanStats (day, category, genre, loans, returned, returnedLate)
+        SELECT day, category, genre, SUM(loans), SUM(returned), SUM(late)
+        FROM (
+            SELECT T.borrowDate AS day, COALESCE(I.category, '') AS category, COALESCE(I.genre, '') AS genre,
+                   1 AS loans, 0 AS returned, 0 AS late
+            FROM {loans} T
+            LEFT JOIN {items} I ON I.itemID = T.itemID
+            WHERE T.borrowDate IS NOT NULL
+            UNION ALL
+            SELECT T.returnDate, COALESCE(I.category, ''), COALESCE(I.genre, ''),
+                   0, 1, F.borrowID IS NOT NULL
+            FROM {loans} T
+            LEFT JOIN {items} I ON I.itemID = T.itemID
+            LEFT JOIN {fines} F ON F.borrowID = T.borrowID
+            WHERE T.status = 'Returned' AND T.returnDate IS NOT NULL
+        )
+        GROUP BY day, category, genre
+    """)
+
+    cursor.execute("DELETE FROM FineStats")
+    cursor.execute(f"""
+        INSERT INTO FineStats (day, fines, assessed, collected, cleared)
+        SELECT T.returnDate, COUNT(*), SUM(COALESCE(F.assessed, F.amount)),
+               SUM(COALESCE(F.assessed, F.amount) - F.amount), SUM(F.status = 'Paid')
+        FROM {fines} F
+        JOIN {loans} T ON T.borrowID = F.borrowID
+        WHERE T.returnDate IS NOT NULL
+        GROUP BY T.returnDate
+    """)
+
+    cursor.execute("DELETE FROM EventStats")
+    cursor.execute("DELETE FROM RoomStats")
+    cursor.execute("""
+        INSERT OR IGNORE INTO AnalyticsDirty (month)
+        SELECT DISTINCT SUBSTR(scheduledDate, 1, 7) FROM Events WHERE scheduledDate IS NOT NULL
+    """)
+
+
+def migrate_analytics(cursor):
+    for statement in ANALYTICS:
+        cursor.execute(statement)
+    rebuild_analytics(cursor, archive=False)
+
+
+# Archive tier (archive.py): closed loans with their settled fines, sign-ups
+# for long-past events and retired items are moved out of the tables the desk
+# works on, into Archived* tables with the same columns. The *History views
+# put the two back together for anything that needs the full history.
+# Same file rather than an attached database -> A move is one atomic
+# transaction (even in WAL mode), and the views work on every connection.
+ARCHIVE = [
+    """CREATE TABLE IF NOT EXISTS ArchivedLoans (
+        borrowID INTEGER PRIMARY KEY,
+        borrowDate DATE,
+        returnDate DATE,
+        status VARCHAR(10),
+        email VARCHAR(500),
+        itemID INTEGER,
+        archivedAt DATE
+    )""",
+
+    "CREATE INDEX IF NOT EXISTS ArchivedLoansEmail ON ArchivedLoans (email, borrowID)",
+
+    """CREATE TABLE IF NOT EXISTS ArchivedFines (
+        borrowID INTEGER PRIMARY KEY,
+        status VARCHAR(6),
+        amount DECIMAL(10,2),
+        assessed DECIMAL(10,2)
+    )""",
+
+    # attendID -> The sign-up's id in Attends (recommend.py orders history by it)
+    """CREATE TABLE IF NOT EXISTS ArchivedAttends (
+        attendID INTEGER PRIMARY KEY,
+        email VARCHAR(500),
+        eventID INTEGER,
+        archivedAt DATE
+    )""",
+
+    "CREATE INDEX IF NOT EXISTS ArchivedAttendsEmail ON ArchivedAttends (email, eventID)",
+    "CREATE INDEX IF NOT EXISTS ArchivedAttendsEvent ON ArchivedAttends (eventID)",
+
+    """CREATE TABLE IF NOT EXISTS ArchivedItems (
+        itemID INTEGER PRIMARY KEY,
+        name VARCHAR(255),
+        author VARCHAR(100),
+        category VARCHAR(50),
+        genre VARCHAR(50),
+        status VARCHAR(11),
+        archivedAt DATE
+    )""",
+
+    # Retiring an item updates its Records row
+    "CREATE INDEX IF NOT EXISTS RecordsItem ON Records (itemID)",
+
+    # Items retired at the desk, waiting for the archive job
+    "CREATE INDEX IF NOT EXISTS RecordsArchived ON Records (itemID) WHERE status = 'Archived'",
+
+    """CREATE VIEW IF NOT EXISTS LoanHistory AS
+    SELECT borrowID, borrowDate, returnDate, status, email, itemID FROM BorrowTransactions
+    UNION ALL
+    SELECT borrowID, borrowDate, returnDate, status, email, itemID FROM ArchivedLoans""",
+
+    """CREATE VIEW IF NOT EXISTS FineHistory AS
+    SELECT borrowID, status, amount, assessed FROM Fines
+    UNION ALL
+    SELECT borrowID, status, amount, assessed FROM ArchivedFines""",
+
+    """CREATE VIEW IF NOT EXISTS AttendanceHistory AS
+    SELECT rowid AS attendID, email, eventID FROM Attends
+    UNION ALL
+    SELECT attendID, email, eventID FROM ArchivedAttends""",
+
+    """CREATE VIEW IF NOT EXISTS ItemHistory AS
+    SELECT itemID, name, author, category, genre, status FROM Item
+    UNION ALL
+    SELECT itemID, name, author, category, genre, status FROM ArchivedItems""",
+]
+
+
+def migrate_archive(cursor):
+    for statement in ARCHIVE:
+        cursor.execute(statement)
+
+
+# Typo-tolerant lookups (search_index.fuzzy_search): every 3-letter piece of
+# an item's name and author, with the items it appears in. Text is lowercased,
+# punctuation turned into spaces and padded with a space each end; pieces are
+# taken word by word (none with a space in the middle), so 'J.R.R. Tolkien'
+# and 'J. R. R. Tolkien' give the same ones: ' j ', ' r ', ' to', 'tol', 'olk',
+# 'lki', 'kie', 'ien', 'en '.
+# Kept up to date by triggers in plain SQL (no Python function), so it stays
+# right whoever writes to Item. Triggers can't use WITH RECURSIVE ->
+# TrigramPositions holds the character positions 1..TRIGRAM_POSITIONS.
+# The one-row subqueries have LIMIT 1 so SQLite doesn't flatten them into the
+# join -> The text is cleaned up once, not once per position.
+TRIGRAM_POSITIONS = 300
+TRIGRAM_FIELDS = ('name', 'author')
+TRIGRAM_SEPARATORS = ".,:;!?()[]\"/&-_"
+
+
+# SQL expression: `text` lowercased, punctuation -> spaces, padded
+def trigram_text(text):
+    for separator in TRIGRAM_SEPARATORS:
+        text = f"replace({text}, '{separator}', ' ')"
+    return f"(' ' || lower(replace({text}, '''', '')) || ' ')"
+
+
+# SELECT of (trigram, field, itemID) for one column of one item
+def _trigram_select(field, text, item_id):
+    return f"""SELECT substr(t.s, p.n, 3), '{field}', {item_id}
+        FROM (SELECT {trigram_text(text)} AS s LIMIT 1) t
+        JOIN TrigramPositions p ON p.n <= length(t.s) - 2
+        WHERE substr(t.s, p.n + 1, 1) <> ' '"""
+
+
+def _trigram_inserts(row):
+    return "\n        ".join(f"INSERT OR IGNORE INTO ItemTrigrams (trigram, field, itemID)\n        "
+                     f"{_trigram_select(field, f'{row}.{field}', f'{row}.itemID')};"
+                     for field in TRIGRAM_FIELDS)
+
+
+def _trigram_delete(row):
+    return f"""DELETE FROM ItemTrigrams WHERE itemID = {row}.itemID AND trigram IN (
+            {' UNION ALL '.join(f"SELECT substr(t.s, p.n, 3) FROM (SELECT {trigram_text(f'{row}.{field}')} AS s LIMIT 1) t "
+                                f"JOIN TrigramPositions p ON p.n <= length(t.s) - 2" for field in TRIGRAM_FIELDS)});"""
+
+
+TRIGRAM_INDEX = [
+    "CREATE TABLE IF NOT EXISTS TrigramPositions (n INTEGER PRIMARY KEY)",
+
+    # Posting lists: (trigram, itemID) first -> All items with a trigram is a
+    # range, and "does this item have it" a single lookup
+    """CREATE TABLE IF NOT EXISTS ItemTrigrams (
+        trigram VARCHAR(3),
+        itemID INTEGER,
+        field VARCHAR(6),
+        PRIMARY KEY (trigram, itemID, field)
+    ) WITHOUT ROWID""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS item_trigrams_insert
+    AFTER INSERT ON Item
+    FOR EACH ROW
+    BEGIN
+        {_trigram_inserts('NEW')}
+    END""",
+
+    f"""CREATE TRIGGER IF NOT EXISTS item_trigrams_delete
+    AFTER DELETE ON Item
+    FOR EACH ROW
+    BEGIN
+        {_trigram_delete('OLD')}
+    END""",
+
+    # Status changes (every checkout and return) leave the index alone
+    f"""CREATE TRIGGER IF NOT EXISTS item_trigrams_update
+    AFTER UPDATE OF itemID, name, author ON Item
+    FOR EACH ROW
+    BEGIN
+        {_trigram_delete('OLD')}
+        {_trigram_inserts('NEW')}
+    END""",
+]
+
+
+# Indexes items from `from_id` on (all of them by default). MATERIALIZED ->
+# Each item's text is cleaned up once, not once per position; sorted -> The
+# rows go into the index in order.
+def rebuild_item_trigrams(cursor, from_id=0):
+    if not from_id:
+        cursor.execute("DELETE FROM ItemTrigrams")
+    texts = " UNION ALL ".join(f"SELECT itemID, '{field}' AS field, {trigram_text(field)} AS s FROM Item WHERE itemID >= :from_id"
+                               for field in TRIGRAM_FIELDS)
+    cursor.execute(f"""
+        WITH t AS MATERIALIZED ({texts})
+        INSERT OR IGNORE INTO ItemTrigrams (trigram, field, itemID)
+        SELECT substr(t.s, p.n, 3), t.field, t.itemID
+        FROM t JOIN TrigramPositions p ON p.n <= length(t.s) - 2
+        WHERE substr(t.s, p.n + 1, 1) <> ' '
+        ORDER BY 1, 3, 2
+    """, {"from_id": from_id})
+
+
+def migrate_trigram_index(cursor):
+    for statement in TRIGRAM_INDEX:
+        cursor.execute(statement)
+    cursor.execute("""
+        WITH RECURSIVE positions (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM positions WHERE n < ?)
+        INSERT OR IGNORE INTO TrigramPositions (n) SELECT n FROM positions
+    """, (TRIGRAM_POSITIONS,))
+    rebuild_item_trigrams(cursor)
+
+
+# Holds on items that are out (holds.py). Queue order is holdID; when a copy
+# comes back (circulation.release_items) the head of its queue gets it: the
+# hold is marked ready with a pickup deadline and the item stays 'Unavailable'
+# for everyone else until the member collects it or the hold expires.
+ITEM_HOLDS = [
+    """CREATE TABLE IF NOT EXISTS ItemHolds (
+        holdID INTEGER PRIMARY KEY AUTOINCREMENT,
+        itemID INTEGER NOT NULL,
+        email VARCHAR(500) NOT NULL,
+        placedAt DATE,
+        readyAt DATE,
+        expiresAt DATE,
+        UNIQUE (itemID, email),
+        FOREIGN KEY (itemID) REFERENCES Item(itemID),
+        FOREIGN KEY (email) REFERENCES Member(email)
+    )""",
+    # Queue of an item in order (holdID is the rowid -> Rides along): the head is one seek
+    "CREATE INDEX IF NOT EXISTS ItemHoldsQueue ON ItemHolds (itemID)",
+    "CREATE INDEX IF NOT EXISTS ItemHoldsEmail ON ItemHolds (email)",
+    # Ready holds by pickup deadline -> The expiry job's range scan
+    "CREATE INDEX IF NOT EXISTS ItemHoldsExpiry ON ItemHolds (expiresAt) WHERE readyAt IS NOT NULL",
+]
+
+
+def migrate_item_holds(cursor):
+    for statement in ITEM_HOLDS:
+        cursor.execute(statement)
+
+
+# Change log (replica.py): every insert / update / delete on CHANGE_TABLES
+# appends a row with a new seq. Only one transaction writes at a time and seq
+# is handed out inside it -> Rows become visible in seq order, so whoever reads
+# "seq > last seen" never skips one (a rolled-back write just leaves a gap).
+# rowKey is the primary key before the change (itemID for Records, one row per
+# item), rowData the whole row after it (NULL for a delete) -> Applying an
+# entry twice does no harm.
+# ChangeLogReaders: how far each follower got, so the log can be pruned.
+CHANGE_TABLES = {
+    'Item': ('itemID',),
+    'Borrow': ('borrowID', 'email', 'itemID'),
+    'BorrowTransactions': ('borrowID',),
+    'Fines': ('borrowID',),
+    'Attends': ('email', 'eventID'),
+    'Member': ('email',),
+    'Events': ('eventID',),
+    'Located': ('eventID', 'roomNum'),
+    # Kept by triggers, but the archive job and item retirement write to them too
+    'EventOccupancy': ('eventID',),
+    'Records': ('itemID',),
+}
+
+CHANGE_LOG = [
+    """CREATE TABLE IF NOT EXISTS ChangeLog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        tableName VARCHAR(50) NOT NULL,
+        op CHAR(1) NOT NULL CHECK (op IN ('I', 'U', 'D')),
+        rowKey TEXT NOT NULL,
+        rowData TEXT,
+        changedAt DATETIME DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+    )""",
+
+    """CREATE TABLE IF NOT EXISTS ChangeLogReaders (
+        name VARCHAR(500) PRIMARY KEY,
+        seq INTEGER NOT NULL,
+        seenAt DATETIME
+    )""",
+]
+
+
+# (Re)creates the change-log triggers from the tables' current columns -> A
+# migration that adds a column to one of CHANGE_TABLES calls this again
+def create_change_log_triggers(cursor):
+    for table, key in CHANGE_TABLES.items():
+        cursor.execute(f"SELECT name FROM pragma_table_info('{table}')")
+        columns = [row[0] for row in cursor.fetchall()]
+        new_row = "json_object(" + ", ".join(f"'{column}', NEW.{column}" for column in columns) + ")"
+
+        for event, op, key_row, data in (("INSERT", "I", "NEW", new_row), ("UPDATE", "U", "OLD", new_row),
+                                         ("DELETE", "D", "OLD", "NULL")):
+            row_key = "json_array(" + ", ".join(f"{key_row}.{column}" for column in key) + ")"
+            cursor.execute(f"DROP TRIGGER IF EXISTS changelog_{table.lower()}_{event.lower()}")
+            cursor.execute(f"CREATE TRIGGER changelog_{table.lower()}_{event.lower()}\n"
+                           f"    AFTER {event} ON {table}\n"
+                           f"    FOR EACH ROW\n"
+                           f"    BEGIN\n"
+                           f"        INSERT INTO ChangeLog (tableName, op, rowKey, rowData)\n"
+                           f"        VALUES ('{table}', '{op}', {row_key}, {data});\n"
+                           f"    END")
+
+
+def migrate_change_log(cursor):
+    for statement in CHANGE_LOG:
+        cursor.execute(statement)
+    create_change_log_triggers(cursor)
+
+
+# Sign-ups get an AUTOINCREMENT id (attendID, the old rowid). A plain rowid is
+# MAX + 1: after the newest sign-up is cancelled the next one got the same id,
+# and recommend.py's update, checkpointed on it, skipped the new sign-up.
+ATTENDS_TABLE = """CREATE TABLE {name} (
+    attendID INTEGER PRIMARY KEY AUTOINCREMENT,
+    email VARCHAR(500),
+    eventID INTEGER,
+    UNIQUE (email, eventID),
+    FOREIGN KEY (email) REFERENCES Member(email),
+    FOREIGN KEY (eventID) REFERENCES Events(eventID)
+)"""
+
+
+def migrate_attend_ids(cursor):
+    cursor.execute("SELECT 1 FROM pragma_table_info('Attends') WHERE name = 'attendID'")
+    if cursor.fetchone() is not None:
+        return
+    _rebuild_table(cursor, 'Attends', ATTENDS_TABLE, rowid_as='attendID')
+    # Ids of archived sign-ups are taken too
+    cursor.execute("""
+        UPDATE sqlite_sequence
+        SET seq = MAX(seq, COALESCE((SELECT MAX(attendID) FROM ArchivedAttends), 0))
+        WHERE name = 'Attends'
+    """)
+    cursor.execute("""
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'Attends', MAX(attendID) FROM ArchivedAttends
+        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'Attends')
+        HAVING MAX(attendID) IS NOT NULL
+    """)
+    # Change-log rows carry the new column
+    create_change_log_triggers(cursor)
+
+
+# In order -> Never renumber or edit an applied migration, add a new one instead
+MIGRATIONS = [
+    Migration(1, "full-text search index", migrate_search_index),
+    Migration(2, "rowid/AUTOINCREMENT id allocation", migrate_id_allocation),
+    Migration(3, "overdue fine sweep", migrate_fine_sweep),
+    Migration(4, "loan history on BorrowTransactions", migrate_loan_history),
+    Migration(5, "member lookup indexes", migrate_member_indexes),
+    Migration(6, "email/eventID column types", migrate_column_affinity),
+    Migration(7, "event schedule index", migrate_event_schedule),
+    Migration(8, "event occupancy and waitlist", migrate_event_occupancy),
+    Migration(9, "recommendation neighbours", migrate_recommendations),
+    Migration(10, "bulk import bookkeeping", migrate_import_deferred),
+    Migration(11, "maintenance log", migrate_maintenance_log),
+    Migration(12, "reporting summaries", migrate_analytics),
+    Migration(13, "archive tier", migrate_archive),
+    Migration(14, "trigram index for fuzzy search", migrate_trigram_index),
+    Migration(15, "item holds", migrate_item_holds),
+    Migration(16, "change log", migrate_change_log),
+    Migration(17, "sign-up ids", migrate_attend_ids),
+]
+
+
+# Versions already applied to this database
+def applied_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaVersion (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100),
+            appliedAt DATETIME
+        )
+    """)
+    return {row[0] for row in conn.execute("SELECT version FROM SchemaVersion")}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+# Left out of the dry-run listing: reads, SQLite's internal statements ("-- ...")
+# and our own bookkeeping
+UNREPORTED = ("--", "SELECT", "BEGIN", "COMMIT", "INSERT INTO SchemaVersion")
+
+
+# Applies pending migrations, each in its own transaction.
+# dry_run=True -> Runs them all in one transaction, then rolls back.
+# Returns [(migration, [SQL statements executed])]
+def migrate(conn, dry_run=False):
+    pending = pending_migrations(conn)
+    conn.commit()
+    if not pending:
+        return []
+
+    results = []
+    statements = []
+    cursor = conn.cursor()
+    # SQL only captured for a dry run -> ensure_schema() leaves the connection's tracing alone
+    if dry_run:
+        conn.set_trace_callback(statements.append)
+    try:
+        if dry_run:
+            cursor.execute("BEGIN IMMEDIATE")
+        for migration in pending:
+            statements.clear()
+            if not dry_run:
+                cursor.execute("BEGIN IMMEDIATE")
+            try:
+                migration.apply(cursor)
+                cursor.execute("INSERT INTO SchemaVersion (version, name, appliedAt) VALUES (?, ?, ?)",
+                               (migration.version, migration.name, datetime.now().isoformat(timespec="seconds")))
+            except BaseException:
+                conn.rollback()
+                raise
+            if not dry_run:
+                conn.commit()
+            results.append((migration, [sql for sql in statements if not sql.lstrip().startswith(UNREPORTED)]))
+    finally:
+        if dry_run:
+            conn.set_trace_callback(None)
+            conn.rollback()
+    return results
+
+
+# Brings an existing library.db up to date
+def ensure_schema(conn):
+    migrate(conn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library database schema migrations")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list applied and pending migrations")
+    run = commands.add_parser("migrate", help="apply pending migrations")
+    run.add_argument("--dry-run", action="store_true", help="print the SQL and roll back")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(Path(args.db).resolve())
+
+    if args.command == "status":
+        applied = applied_versions(conn)
+        for migration in MIGRATIONS:
+            mark = "✅" if migration.version in applied else "⏳"
+            print(f"{mark} {migration.version:>3}  {migration.name}")
+
+    elif args.command == "migrate":
+        results = migrate(conn, dry_run=args.dry_run)
+        if not results:
+            print("✅ Schema is up to date.")
+        for migration, statements in results:
+            verb = "Would apply" if args.dry_run else "Applied"
+            print(f"\n{verb} {migration.version}: {migration.name}")
+            if args.dry_run:
+                for sql in statements:
+                    print("    " + " ".join(sql.split()))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import json
+import math
+import re
+
+from schema import TRIGRAM_FIELDS, trigram_text
+
+# Full-text catalog search on top of the ItemSearch FTS5 index (see schema.py),
+# and fuzzy_search() on the ItemTrigrams index for misspelled names / authors
+
+# Columns a search can be limited to
+SEARCH_FIELDS = ('name', 'author', 'category', 'genre')
+
+# bm25 column weights -> Title hits rank above author hits, above category/genre
+RANK_WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+
+# Turns free text into an FTS5 query: every word must match, as a prefix
+def build_match_query(text, field=None):
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+
+    terms = " ".join(f'"{word}"*' for word in words)
+
+    if field is None:
+        return terms
+    if field not in SEARCH_FIELDS:
+        raise ValueError(f"Unknown search field: {field}")
+    return f"{{{field}}} : ({terms})"
+
+
+# Default number of results per page when streaming a search
+PAGE_SIZE = 20
+
+
+# Builds the one set-based search query -> (sql, params), or None if nothing to search for
+# Available items come first, then best match first
+# scored -> The bm25 score (lower is better) as an extra last column
+def build_search_query(text, field=None, scored=False):
+    match = build_match_query(text, field)
+    if match is None:
+        return None
+
+    score = f"bm25(ItemSearch, {', '.join(map(str, RANK_WEIGHTS))})"
+    query = f"""
+        SELECT Item.itemID, Item.name, Item.author, Item.category, Item.genre, Item.status{f', {score}' if scored else ''}
+        FROM ItemSearch
+        JOIN Item ON Item.itemID = ItemSearch.rowid
+        WHERE ItemSearch MATCH ?
+        ORDER BY Item.status = 'Available' DESC,
+                 {score}
+    """
+    return query, [match]
+
+
+# Returns matching items as
+# (itemID, name, author, category, genre, status) tuples (+ score if scored)
+def search_items(conn, text, field=None, limit=None, scored=False):
+    search = build_search_query(text, field, scored)
+    if search is None:
+        return []
+
+    query, params = search
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    return conn.execute(query, params).fetchall()
+
+
+# Streams matching items one page (list of tuples) at a time
+# -> Only one page is ever held in memory, however many items match
+def iter_search_pages(conn, text, field=None, page_size=PAGE_SIZE):
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+
+    search = build_search_query(text, field)
+    if search is None:
+        return
+
+    # Own cursor so other statements can run between pages
+    cursor = conn.cursor()
+    try:
+        cursor.execute(*search)
+        while True:
+            page = cursor.fetchmany(page_size)
+            if not page:
+                return
+            yield page
+    finally:
+        cursor.close()
+
+
+# Share of the search text's trigrams an item must have to be a close match
+# ('Tolkein' shares 3 of its 7 with 'Tolkien', 'Dubios' 2 of 6 with 'Dubois')
+FUZZY_THRESHOLD = 0.3
+
+# Trigrams this common all count as equally common when picking the rare ones
+FREQUENCY_CAP = 1000
+
+# Items fully scored per search, those with the most of the rare trigrams
+MAX_CANDIDATES = 500
+
+
+# Trigrams of the search text, made exactly as the index triggers make them
+def query_trigrams(conn, text):
+    rows = conn.execute(f"""
+        SELECT DISTINCT substr(t.s, p.n, 3)
+        FROM (SELECT {trigram_text('?')} AS s LIMIT 1) t
+        JOIN TrigramPositions p ON p.n <= length(t.s) - 2
+        WHERE substr(t.s, p.n + 1, 1) <> ' '
+    """, (text,)).fetchall()
+    return [trigram for (trigram,) in rows]
+
+
+# Close matches for misspelled text, best first -> Same tuples as search_items
+# Items sharing at least `threshold` of the text's trigrams, ranked by how many
+# they share. One that shares `needed` of n trigrams must have one of the
+# n - needed + 1 rarest -> Only those posting lists are read in full; the
+# MAX_CANDIDATES items with most of them are then checked for the rest, a
+# single lookup per item and trigram.
+def fuzzy_search(conn, text, field=None, limit=PAGE_SIZE, threshold=FUZZY_THRESHOLD):
+    if field is not None and field not in TRIGRAM_FIELDS:
+        raise ValueError(f"Fuzzy search covers {' and '.join(TRIGRAM_FIELDS)} only, not {field}")
+
+    trigrams = query_trigrams(conn, text)
+    if not trigrams:
+        return []
+    needed = max(1, math.ceil(threshold * len(trigrams)))
+    params = {"all": json.dumps(trigrams), "field": field, "cap": FREQUENCY_CAP}
+
+    frequencies = conn.execute("""
+        SELECT q.value, (SELECT COUNT(*) FROM (SELECT 1 FROM ItemTrigrams
+                                              WHERE trigram = q.value AND (:field IS NULL OR field = :field)
+                                              LIMIT :cap))
+        FROM json_each(:all) q
+    """, params).fetchall()
+    rare = [trigram for trigram, _ in sorted(frequencies, key=lambda row: row[1])][:len(trigrams) - needed + 1]
+
+    params.update(rare=json.dumps(rare), needed=needed, candidates=MAX_CANDIDATES, limit=limit)
+    return conn.execute("""
+        SELECT Item.itemID, Item.name, Item.author, Item.category, Item.genre, Item.status
+        FROM (
+            SELECT c.itemID,
+                   (SELECT COUNT(DISTINCT t.trigram) FROM ItemTrigrams t
+                    WHERE t.trigram IN (SELECT value FROM json_each(:all)) AND t.itemID = c.itemID
+                      AND (:field IS NULL OR t.field = :field)) AS shared
+            FROM (SELECT itemID FROM ItemTrigrams
+                  WHERE trigram IN (SELECT value FROM json_each(:rare)) AND (:field IS NULL OR field = :field)
+                  GROUP BY itemID
+                  ORDER BY COUNT(DISTINCT trigram) DESC
+                  LIMIT :candidates) c
+        ) scored
+        JOIN Item ON Item.itemID = scored.itemID
+        WHERE scored.shared >= :needed
+        ORDER BY scored.shared DESC, Item.status = 'Available' DESC, Item.itemID
+        LIMIT :limit
+    """, params).fetchall()
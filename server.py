@@ -0,0 +1,448 @@
+import argparse
+import json
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from branches import BranchLibrary, load_branches
+from circulation import CheckoutConflict, ItemNotFound
+from library_service import LibraryService, MemberExists, RoleConflict
+from event_calendar import PAGE_SIZE as EVENT_PAGE_SIZE, EventCalendar
+from holds import HoldError, HoldNotFound
+from member_cache import MemberCache
+from pool import ConnectionPool
+from records import LibraryError, MemberNotFound, Record
+from registration import AlreadyRegistered, EventFull, EventNotFound, EventPassed, NotRegistered
+from replica import MAX_STALENESS_SECONDS
+from search_index import PAGE_SIZE
+
+# HTTP/JSON front end for kiosks and the website
+#
+#   python server.py --port 8080 --workers 8
+#
+#   GET  /items?q=tolkien[&field=author][&limit=20]   search the catalog
+#                                                     (no match -> "closest": misspellings allowed)
+#   GET  /items/<itemID>
+#   GET  /items/<itemID>/similar[?limit=10]            borrowed by the same members
+#   GET  /events[?limit=10]                           {"upcoming": [...], "past": [...]} (first pages)
+#   GET  /events?when=upcoming|past[&after=<eventID>]  next page after that event
+#   GET  /events?from=2025-01-01&to=2025-01-31[&after=<eventID>]
+#   GET  /events/all[?limit=10]                       upcoming events at every branch (--branches)
+#   GET  /events/<eventID>
+#   GET  /events/<eventID>/seats                      capacity, attendees, waitlisted
+#   GET  /members/<email>/items                       what a member has out
+#   GET  /members/<email>/fines
+#   GET  /members/<email>/holds                       ready to collect first
+#   GET  /members/<email>/recommendations[?limit=10]  {"items": [...], "events": [...]}
+#   POST /borrow    {"email": ..., "item_id": 5}  or  {"email": ..., "item_ids": [5, 6]}
+#   POST /return    {"email": ..., "item_id": 5}  or  {"item_ids": [5, 6]}   (return bin)
+#   POST /items/<itemID>/hold         {"email": ...}   join the queue for an item that is out
+#   POST /items/<itemID>/hold/cancel  {"email": ...}
+#   POST /events/<eventID>/register  {"email": ...[, "waitlist": true]}  or  {"emails": [...]}  (group)
+#   POST /events/<eventID>/cancel    {"email": ...}   -> members moved up from the waitlist
+#
+# Requests are handled by a fixed set of worker threads, each with its own read
+# connection from the pool; writes go one at a time through the pool's writer.
+# All requests share one member cache.
+#
+#   python server.py --replica replica.db [--replica replica2.db] [--max-staleness 2]
+#
+# Catalog searches and event listings read from the replicas (replica.py) while
+# those are within --max-staleness seconds of library.db, everything else from
+# library.db itself.
+#
+#   python server.py --db east.db --branches branches.json
+#
+# With --branches (branches.py) GET /items searches every branch's catalog and
+# each item says which branch it is at; a branch that doesn't answer in time
+# is listed under "missing". Everything else is this server's own branch.
+
+# Largest page of search results a client can ask for
+MAX_SEARCH_LIMIT = 100
+
+# Error -> HTTP status (anything else that is a LibraryError -> 400)
+ERROR_STATUS = {
+    MemberNotFound: 404,
+    ItemNotFound: 404,
+    EventNotFound: 404,
+    NotRegistered: 404,
+    HoldNotFound: 404,
+    CheckoutConflict: 409,
+    AlreadyRegistered: 409,
+    EventPassed: 409,
+    EventFull: 409,
+    MemberExists: 409,
+    RoleConflict: 409,
+    HoldError: 409,
+}
+
+
+# Request the client got wrong (bad JSON, missing field, ...)
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+# Records (and lists/dicts of them) -> Plain JSON values
+def to_json(value):
+    if isinstance(value, Record):
+        return value.as_dict()
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    return value
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} must be an integer")
+
+
+# Names of the JSON types a field can be required to have
+TYPE_NAMES = {str: "a string", list: "a list", bool: "true or false"}
+
+
+def _field(body, name, kind=None):
+    if name not in body:
+        raise BadRequest(f"Missing field: {name}")
+    if kind is not None and not isinstance(body[name], kind):
+        raise BadRequest(f"{name} must be {TYPE_NAMES[kind]}")
+    return body[name]
+
+
+# Service on this thread's read connection
+def reader(server):
+    return LibraryService(server.pool.reader(), server.member_cache, server.calendar)
+
+
+# Service on a read replica (or this thread's read connection if none is in
+# sync) -> For reads that may be up to --max-staleness seconds out of date
+def replica_reader(server):
+    return LibraryService(server.pool.replica_reader(), server.member_cache, server.calendar)
+
+
+# Service on the write connection, held for the block
+@contextmanager
+def writer(server):
+    with server.pool.writer() as conn:
+        yield LibraryService(conn, server.member_cache, server.calendar)
+
+
+# Reads
+
+def search(server, match, query, body):
+    text = query.get("q", "")
+    limit = min(_int(query.get("limit", PAGE_SIZE), "limit"), MAX_SEARCH_LIMIT)
+    field = query.get("field")
+    if server.branches is not None:
+        try:
+            found = server.branches.search_items(text, field, limit)
+        except ValueError as error:
+            raise BadRequest(str(error))
+        return {"items": found.results, "missing": found.missing}
+
+    service = replica_reader(server)
+    try:
+        items = service.search_items(text, field, limit)
+        # Nothing spelled like that -> Close matches on name / author too
+        if not items and field in (None, "name", "author"):
+            return {"items": [], "closest": service.fuzzy_search(text, field, limit)}
+    except ValueError as error:
+        raise BadRequest(str(error))
+    return {"items": items}
+
+
+def get_item(server, match, query, body):
+    item = reader(server).get_item(int(match["id"]))
+    if item is None:
+        raise NotFound("Item not found.")
+    return item
+
+
+def similar_items(server, match, query, body):
+    limit = min(_int(query.get("limit", 10), "limit"), MAX_SEARCH_LIMIT)
+    return {"items": reader(server).similar_items(int(match["id"]), limit)}
+
+
+def list_events(server, match, query, body):
+    service = replica_reader(server)
+    limit = min(_int(query.get("limit", EVENT_PAGE_SIZE), "limit"), MAX_SEARCH_LIMIT)
+
+    # Keyset paging: ?after=<eventID> of the last event on the previous page
+    after = None
+    if "after" in query:
+        after = service.get_event(_int(query["after"], "after"))
+        if after is None:
+            raise NotFound("Event not found.")
+
+    if "from" in query or "to" in query:
+        start, end = query.get("from", "0000-01-01"), query.get("to", "9999-12-31")
+        return {"events": service.events_between(start, end, limit, after)}
+    if query.get("when") == "upcoming":
+        return {"events": service.upcoming_events(limit, after)}
+    if query.get("when") == "past":
+        return {"events": service.past_events(limit, after)}
+
+    upcoming, past = service.list_events(limit=limit)
+    return {"upcoming": upcoming, "past": past}
+
+
+def all_branch_events(server, match, query, body):
+    if server.branches is None:
+        raise NotFound("This server isn't started with --branches.")
+    limit = min(_int(query.get("limit", EVENT_PAGE_SIZE), "limit"), MAX_SEARCH_LIMIT)
+    found = server.branches.upcoming_events(limit)
+    return {"events": found.results, "missing": found.missing}
+
+
+def get_event(server, match, query, body):
+    event = reader(server).get_event(int(match["id"]))
+    if event is None:
+        raise NotFound("Event not found.")
+    return event
+
+
+def event_seats(server, match, query, body):
+    seats = reader(server).seats(int(match["id"]))
+    if seats is None:
+        raise NotFound("Event not found.")
+    return seats
+
+
+def member_items(server, match, query, body):
+    service = reader(server)
+    email = unquote(match["email"])
+    service.require_member(email)
+    return {"items": service.borrowed_items(email)}
+
+
+def member_fines(server, match, query, body):
+    service = reader(server)
+    email = unquote(match["email"])
+    service.require_member(email)
+    return service.fines(email)
+
+
+def member_holds(server, match, query, body):
+    service = reader(server)
+    email = unquote(match["email"])
+    service.require_member(email)
+    return {"holds": service.holds(email)}
+
+
+def member_recommendations(server, match, query, body):
+    service = reader(server)
+    email = unquote(match["email"])
+    service.require_member(email)
+    limit = min(_int(query.get("limit", 10), "limit"), MAX_SEARCH_LIMIT)
+    return {"items": service.recommend_items(email, limit), "events": service.recommend_events(email, limit)}
+
+
+def report(server, match, query, body):
+    try:
+        return reader(server).report(query.get("from"), query.get("to"))
+    except ValueError as error:
+        raise BadRequest(str(error))
+
+
+# Writes
+
+def borrow(server, match, query, body):
+    email = _field(body, "email", str)
+    with writer(server) as service:
+        if "item_ids" in body:
+            return {"results": service.borrow_many(email, [_int(i, "item_ids") for i in _field(body, "item_ids", list)])}
+        return service.borrow(email, _int(_field(body, "item_id"), "item_id"))
+
+
+def return_items(server, match, query, body):
+    with writer(server) as service:
+        if "item_ids" in body:
+            return {"results": service.return_many([_int(i, "item_ids") for i in _field(body, "item_ids", list)])}
+        return service.return_item(_field(body, "email", str), _int(_field(body, "item_id"), "item_id"))
+
+
+def place_hold(server, match, query, body):
+    with writer(server) as service:
+        return service.place_hold(_field(body, "email", str), int(match["id"]))
+
+
+def cancel_hold(server, match, query, body):
+    with writer(server) as service:
+        return {"next": service.cancel_hold(_field(body, "email", str), int(match["id"]))}
+
+
+def register(server, match, query, body):
+    waitlist = _field(body, "waitlist", bool) if "waitlist" in body else "emails" in body
+    with writer(server) as service:
+        if "emails" in body:
+            emails = _field(body, "emails", list)
+            if not all(isinstance(email, str) for email in emails):
+                raise BadRequest("emails must be a list of strings")
+            return {"results": service.register_group(int(match["id"]), emails, waitlist=waitlist)}
+        return service.register(_field(body, "email", str), int(match["id"]), waitlist=waitlist)
+
+
+def cancel_registration(server, match, query, body):
+    with writer(server) as service:
+        return {"promoted": service.cancel_registration(_field(body, "email", str), int(match["id"]))}
+
+
+# (method, path pattern, handler)
+ROUTES = [
+    ("GET", r"/items", search),
+    ("GET", r"/items/(?P<id>\d+)", get_item),
+    ("GET", r"/items/(?P<id>\d+)/similar", similar_items),
+    ("GET", r"/events", list_events),
+    ("GET", r"/events/all", all_branch_events),
+    ("GET", r"/events/(?P<id>\d+)", get_event),
+    ("GET", r"/events/(?P<id>\d+)/seats", event_seats),
+    ("GET", r"/members/(?P<email>[^/]+)/items", member_items),
+    ("GET", r"/members/(?P<email>[^/]+)/fines", member_fines),
+    ("GET", r"/members/(?P<email>[^/]+)/holds", member_holds),
+    ("GET", r"/members/(?P<email>[^/]+)/recommendations", member_recommendations),
+    ("GET", r"/reports", report),
+    ("POST", r"/borrow", borrow),
+    ("POST", r"/return", return_items),
+    ("POST", r"/items/(?P<id>\d+)/hold", place_hold),
+    ("POST", r"/items/(?P<id>\d+)/hold/cancel", cancel_hold),
+    ("POST", r"/events/(?P<id>\d+)/register", register),
+    ("POST", r"/events/(?P<id>\d+)/cancel", cancel_registration),
+]
+ROUTES = [(method, re.compile(pattern + "/?"), handler) for method, pattern, handler in ROUTES]
+
+
+class LibraryHandler(BaseHTTPRequestHandler):
+    server_version = "LibraryHTTP/1.0"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        try:
+            for route_method, pattern, handler in ROUTES:
+                match = pattern.fullmatch(url.path)
+                if match and route_method == method:
+                    break
+            else:
+                raise NotFound(f"No such endpoint: {method} {url.path}")
+
+            body = self._read_body() if method == "POST" else {}
+            status, payload = 200, handler(self.server, match, query, body)
+        except BadRequest as error:
+            status, payload = 400, {"error": str(error)}
+        except NotFound as error:
+            status, payload = 404, {"error": str(error)}
+        except LibraryError as error:
+            status, payload = ERROR_STATUS.get(type(error), 400), {"error": str(error)}
+        except Exception:
+            # A bug, or a database error -> Logged here; the kiosk still gets an answer
+            sys.stderr.write(f"{method} {url.path} failed:\n{traceback.format_exc()}")
+            status, payload = 500, {"error": "Something went wrong on our side. Please try again."}
+
+        self._send(status, payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise BadRequest("Body must be JSON")
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object")
+        return body
+
+    def _send(self, status, payload):
+        data = json.dumps(to_json(payload)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Quiet by default; --verbose turns the access log back on
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+# HTTPServer that hands each request to a fixed pool of worker threads
+# -> Bounded number of threads, so also a bounded number of read connections
+class LibraryHTTPServer(HTTPServer):
+    def __init__(self, address, pool, workers=8, verbose=False, branches=None):
+        super().__init__(address, LibraryHandler)
+        self.pool = pool
+        self.branches = branches
+        self.member_cache = MemberCache()
+        self.calendar = EventCalendar()
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="library-http")
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+        if self.branches is not None:
+            self.branches.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library HTTP/JSON server")
+    parser.add_argument("--db", default="library.db", help="database file (default: library.db)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=8, help="request threads (one read connection each)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    parser.add_argument("--replica", action="append", default=[],
+                        help="read replica for searches and event listings (repeatable)")
+    parser.add_argument("--max-staleness", type=float, default=MAX_STALENESS_SECONDS,
+                        help=f"seconds a replica may be behind (default: {MAX_STALENESS_SECONDS})")
+    parser.add_argument("--branches", help="branches file: searches cover every branch (see branches.py)")
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(args.db, replicas=args.replica, max_staleness=args.max_staleness)
+    branches = BranchLibrary(load_branches(args.branches)) if args.branches else None
+    server = LibraryHTTPServer((args.host, args.port), pool, args.workers, args.verbose, branches)
+    print(f"📚 Serving {args.db} on http://{args.host}:{server.server_port} with {args.workers} workers")
+    if args.replica:
+        print(f"🔁 Searches and event listings from {', '.join(args.replica)} "
+              f"(up to {args.max_staleness:g}s behind)")
+    if branches is not None:
+        print(f"🔎 Searches cover branches {', '.join(branches.branches)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+
+# Transaction helpers shared by the write paths
+
+
+# Runs the block inside one BEGIN IMMEDIATE transaction
+# -> The write lock is taken up front, so concurrent desks queue instead of
+#    interleaving, and the whole block costs a single commit (one fsync)
+@contextmanager
+def immediate_transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()